@@ -0,0 +1,127 @@
+"""
+REST API Throughput Benchmark
+Requests/sec using Flask's test client in N client threads, before vs after:
+- pool:  a new connection per request vs the per-worker connection pool
+- cache: the pool without vs with the response cache (--revalidate sends the
+         previous ETag, so cached responses come back as 304)
+
+The test client runs the full Flask request cycle without a network hop, so
+differences come from the handlers and their connection handling. Run the
+pipeline first so a snapshot with alerts exists.
+
+Usage:
+    python benchmarks/bench_api.py
+    python benchmarks/bench_api.py --threads 4 --duration 10
+    python benchmarks/bench_api.py --mode cache --revalidate
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import importlib.util
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src', 'common'))
+
+from db import connect
+from snapshots import current_snapshot
+
+
+def load_api():
+    spec = importlib.util.spec_from_file_location('api_app', os.path.join(BASE_DIR, 'src', '05_api', 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def per_request_connection():
+    """Baseline get_db(): open and close a connection for every request"""
+    return connect(current_snapshot(), read_only=True)
+
+
+def measure(app, path, threads, duration, revalidate=False):
+    """
+    Requests/sec and failed responses for one endpoint
+    """
+    counts = [0] * threads
+    errors = [0] * threads
+    deadline = time.perf_counter() + duration
+
+    def client(i):
+        c = app.test_client()
+        headers = {}
+        while time.perf_counter() < deadline:
+            response = c.get(path, headers=headers)
+            if response.status_code not in (200, 304):
+                errors[i] += 1
+            if revalidate and 'ETag' in response.headers:
+                headers = {'If-None-Match': response.headers['ETag']}
+            counts[i] += 1
+
+    workers = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return sum(counts) / (time.perf_counter() - start), sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API requests/sec")
+    parser.add_argument('--threads', type=int, default=4, help="Concurrent client threads")
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds per endpoint and mode")
+    parser.add_argument('--paths', nargs='+', default=None, help="Endpoints to request")
+    parser.add_argument('--mode', choices=['pool', 'cache'], default='pool', help="What to compare")
+    parser.add_argument('--revalidate', action='store_true', help="Send If-None-Match with the last ETag")
+    args = parser.parse_args()
+
+    api = load_api()
+    pooled_get_db = api.get_db
+    cache_entries = api.CACHE.max_entries
+
+    def configure(after):
+        if args.mode == 'pool':
+            api.get_db = pooled_get_db if after else per_request_connection
+        else:
+            api.CACHE.clear()
+            api.CACHE.max_entries = cache_entries if after else 0
+
+    paths = args.paths
+    if not paths:
+        with connect(current_snapshot(), read_only=True) as conn:
+            row = conn.execute("SELECT row_id FROM ml_explanations LIMIT 1").fetchone()
+        if args.mode == 'cache':
+            paths = ['/api/v1/stats', '/api/v1/alerts/ml?limit=50', '/api/v1/alerts/ml?limit=1000']
+        else:
+            paths = ['/api/v1/health', '/api/v1/alerts/ml?limit=50']
+            if row:
+                paths.append(f'/api/v1/alerts/ml/{row[0]}/explanation')
+
+    print("="*76)
+    print("API THROUGHPUT: " + ("per-request connection vs connection pool" if args.mode == 'pool'
+                                else "uncached vs response cache" + (" (revalidating)" if args.revalidate else "")))
+    print("="*76)
+    print(f"Snapshot: {os.path.basename(current_snapshot())}  |  Client threads: {args.threads}  |  "
+          f"{args.duration:.0f}s per run")
+    print()
+    print(f"{'Endpoint':<44}{'Before req/s':>13}{'After req/s':>13}{'Speedup':>9}")
+    print("-" * 79)
+
+    for path in paths:
+        configure(after=False)
+        before, before_errors = measure(api.app, path, args.threads, args.duration, args.revalidate)
+        configure(after=True)
+        after, after_errors = measure(api.app, path, args.threads, args.duration, args.revalidate)
+        note = f"  ({before_errors + after_errors} errors)" if before_errors or after_errors else ""
+        print(f"{path:<44}{before:>13,.0f}{after:>13,.0f}{after / before:>8.1f}x{note}")
+
+    print()
+    print(f"Pool: {api.POOL.info()}")
+    print(f"Cache: {api.CACHE.info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Prefilter Cascade Benchmark
+Compares full Isolation Forest scoring against HBOS-gated cascades
+
+For each target recall the prefilter is calibrated on the training sample, then the
+scoring set is scored through the cascade. Recall is measured against the rows the
+full forest flags on the same scoring set.
+
+Usage:
+    python benchmarks/bench_cascade.py
+    python benchmarks/bench_cascade.py --limit 1000000 --recalls 0.9 0.99 1.0
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_FILE = os.path.join(BASE_DIR, "data", "fraud_data.duckdb")
+sys.path.insert(0, os.path.join(BASE_DIR, 'src', '03_ml_scoring'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src', 'common'))
+
+from db import connect
+from features import FEATURES, feature_query, training_query
+from prefilter import fit_hbos, hbos_scores, calibrate_threshold, cascade_decision
+from anomaly_detection import MODEL_PARAMS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HBOS prefilter cascades")
+    parser.add_argument('--limit', type=int, default=None, help="Rows in the scoring set (default: all)")
+    parser.add_argument('--recalls', type=float, nargs='+', default=[0.90, 0.95, 0.99, 1.0])
+    args = parser.parse_args()
+
+    conn = connect(DB_FILE, read_only=True)
+
+    X_train = conn.execute(training_query()).fetchdf()[FEATURES].fillna(0).to_numpy()
+    scoring_sql = feature_query() + (f" LIMIT {args.limit}" if args.limit else "")
+    X_eval = conn.execute(scoring_sql).fetchdf()[FEATURES].fillna(0).to_numpy()
+    conn.close()
+
+    print(f"[INFO] Training sample: {len(X_train):,} rows | Scoring set: {len(X_eval):,} rows")
+
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X_train)
+    iso_forest = IsolationForest(**MODEL_PARAMS).fit(X_scaled)
+
+    # Reference: full forest on every row
+    start = time.perf_counter()
+    full_decision, _ = cascade_decision(iso_forest, scaler, X_eval)
+    full_elapsed = time.perf_counter() - start
+    full_flags = full_decision < 0
+
+    hbos_train = hbos_scores(fit_hbos(X_train), X_train)
+    train_flags = iso_forest.decision_function(X_scaled) < 0
+
+    print()
+    print(f"{'mode':<16}{'candidates':>12}{'rows/sec':>14}{'speedup':>10}{'recall':>10}{'flagged':>10}")
+    print("-" * 72)
+    print(f"{'full forest':<16}{'100.00%':>12}{len(X_eval) / full_elapsed:>14,.0f}"
+          f"{'1.00x':>10}{'100.00%':>10}{full_flags.sum():>10,}")
+
+    for target in args.recalls:
+        prefilter = fit_hbos(X_train)
+        calibrate_threshold(prefilter, hbos_train, train_flags, target)
+
+        start = time.perf_counter()
+        decision, candidates = cascade_decision(iso_forest, scaler, X_eval, prefilter)
+        elapsed = time.perf_counter() - start
+
+        flags = decision < 0
+        recall = (flags & full_flags).sum() / full_flags.sum() if full_flags.any() else 1.0
+        print(f"{f'cascade @ {target:.3f}':<16}{candidates.mean() * 100:>11.2f}%"
+              f"{len(X_eval) / elapsed:>14,.0f}{full_elapsed / elapsed:>9.2f}x"
+              f"{recall * 100:>9.2f}%{flags.sum():>10,}")
+
+
+if __name__ == "__main__":
+    main()
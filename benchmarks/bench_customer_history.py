@@ -0,0 +1,112 @@
+"""
+Customer Transaction History Benchmark
+Latency of GET /api/v1/customer/<id>/transactions (queries.customer_transactions)
+with transactions in CSV order (steps ascending, customers scattered) vs the
+ETL's (nameOrig, step) clustering
+
+A synthetic PaySim-like dataset (benchmarks/generate_synthetic.py, ~3
+transactions per customer) is loaded into two scratch databases, one per
+layout, and random existing customers are looked up in each. The step-window
+scan the incremental rules run is timed as well: it is the query that loses
+its zone-map pruning when the table is clustered by customer.
+
+Usage:
+    python benchmarks/bench_customer_history.py
+    python benchmarks/bench_customer_history.py --rows 6300000 --lookups 500 --threads 4
+"""
+
+import os
+import sys
+import time
+import shutil
+import random
+import argparse
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'benchmarks'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src', 'common'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src', '05_api'))
+
+from generate_synthetic import generate
+from db import connect
+from queries import customer_transactions
+
+# (label, database file, ORDER BY of the load)
+LAYOUTS = [('csv order', 'csv_order', ''),
+           ('(nameOrig, step)', 'clustered', 'ORDER BY nameOrig, step')]
+
+
+def build(workdir, csv_file, name, order_by):
+    path = os.path.join(workdir, f"{name}.duckdb")
+    conn = connect(path)
+    conn.execute(f"CREATE TABLE transactions AS SELECT * FROM read_csv_auto('{csv_file}', header=True) {order_by}")
+    conn.close()
+    return path
+
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000
+    return np.percentile(ms, 50), np.percentile(ms, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-customer transaction lookups by table layout")
+    parser.add_argument('--rows', type=int, default=6_300_000)
+    parser.add_argument('--lookups', type=int, default=200, help="Random customers looked up per layout")
+    parser.add_argument('--threads', type=int, default=None, help="DuckDB threads (default: all cores)")
+    parser.add_argument('--workdir', default=os.path.join(BASE_DIR, 'data', 'history_bench'))
+    parser.add_argument('--keep', action='store_true', help="Keep the scratch databases")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    csv_file = os.path.join(args.workdir, 'paysim.csv')
+    if not os.path.exists(csv_file):
+        generate(args.rows, csv_file)
+
+    print("="*78)
+    print(f"CUSTOMER TRANSACTION HISTORY: {args.rows:,} synthetic rows, {args.lookups} lookups per layout")
+    print("="*78)
+    print(f"{'Layout':<20}{'Load s':>9}{'lookup p50 ms':>15}{'lookup p95 ms':>15}{'step window ms':>16}")
+    print("-" * 75)
+
+    customers = None
+    try:
+        for label, name, order_by in LAYOUTS:
+            start = time.perf_counter()
+            path = build(args.workdir, csv_file, name, order_by)
+            load_seconds = time.perf_counter() - start
+
+            conn = connect(path, read_only=True)
+            if args.threads:
+                conn.execute(f"SET threads TO {int(args.threads)}")
+            if customers is None:
+                ids = [row[0] for row in conn.execute("SELECT DISTINCT nameOrig FROM transactions").fetchall()]
+                customers = random.Random(42).sample(ids, min(args.lookups, len(ids)))
+
+            customer_transactions(conn, customers[0])  # warm-up
+            lookups = []
+            for client_id in customers:
+                start = time.perf_counter()
+                customer_transactions(conn, client_id)
+                lookups.append(time.perf_counter() - start)
+
+            max_step = conn.execute("SELECT MAX(step) FROM transactions").fetchone()[0]
+            windows = []
+            for _ in range(5):
+                start = time.perf_counter()
+                conn.execute("SELECT COUNT(*), SUM(amount) FROM transactions WHERE step > ? AND step <= ?",
+                             [max_step - 24, max_step]).fetchone()
+                windows.append(time.perf_counter() - start)
+            conn.close()
+
+            p50, p95 = percentiles(lookups)
+            print(f"{label:<20}{load_seconds:>9.1f}{p50:>15.2f}{p95:>15.2f}{percentiles(windows)[0]:>16.2f}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(args.workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Memory-Capped Pipeline Run
+Runs ETL and the full pipeline on a synthetic dataset several times larger
+than the configured memory cap (resource profile, see src/common/db.py)
+
+The run happens in a scratch workspace (default data/memcap_bench) whose src/
+is a symlink to this project's src/, so the project's own data is untouched.
+Each step runs as a subprocess with AML_MEMORY_LIMIT / AML_PYTHON_BUDGET set;
+DuckDB spills to the workspace's data/tmp and Python stages score in chunks.
+The run passes when every step succeeds and produces scores and alerts.
+
+Usage:
+    python benchmarks/bench_memory_cap.py                          # 1GB cap, 5x dataset
+    python benchmarks/bench_memory_cap.py --memory-limit 4GB --threads 4
+    python benchmarks/bench_memory_cap.py --memory-limit 128MB --threads 1 --keep
+
+DuckDB needs roughly 100MB per thread, so keep small caps single-threaded.
+Peak RSS is the largest step process and includes the Python interpreter and
+libraries, not just DuckDB's buffer pool.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+
+import duckdb
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'benchmarks'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src', 'common'))
+
+from generate_synthetic import generate
+from db import parse_size, connect
+
+# Synthetic CSV bytes per transaction (measured on generate_synthetic.py output)
+CSV_BYTES_PER_ROW = 80
+
+
+def children_peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def prepare_workspace(workdir):
+    os.makedirs(os.path.join(workdir, 'data'), exist_ok=True)
+    link = os.path.join(workdir, 'src')
+    if not os.path.exists(link):
+        os.symlink(os.path.join(BASE_DIR, 'src'), link, target_is_directory=True)
+
+
+def table_rows(workdir, table):
+    """
+    Row count of a workspace table, 0 when missing
+    """
+    try:
+        with connect(os.path.join(workdir, 'data', 'fraud_data.duckdb'), read_only=True) as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    except duckdb.Error:
+        return 0
+
+
+def run_step(name, args, workdir, env):
+    """
+    Run one pipeline entrypoint in the workspace. Returns (ok, seconds).
+    """
+    start = time.perf_counter()
+    log_path = os.path.join(workdir, f"{name}.log")
+    with open(log_path, 'w') as log:
+        code = subprocess.call([sys.executable] + args, cwd=workdir, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    seconds = time.perf_counter() - start
+    print(f"{name:<12}{'ok' if code == 0 else f'exit {code}':>8}{seconds:>10.1f}s"
+          f"{(children_peak_rss_mb() or 0):>12,.0f} MB   ({log_path})")
+    return code == 0, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pipeline on data larger than the memory cap")
+    parser.add_argument('--memory-limit', default='1GB', help="DuckDB memory limit (AML_MEMORY_LIMIT)")
+    parser.add_argument('--python-budget', default=None,
+                        help="Python result budget (AML_PYTHON_BUDGET, default: a quarter of the limit)")
+    parser.add_argument('--threads', type=int, default=None, help="DuckDB threads (AML_THREADS)")
+    parser.add_argument('--ratio', type=float, default=5.0, help="Dataset size / memory limit")
+    parser.add_argument('--workdir', default=os.path.join(BASE_DIR, 'data', 'memcap_bench'))
+    parser.add_argument('--keep', action='store_true', help="Keep the workspace afterwards")
+    args = parser.parse_args()
+
+    limit = parse_size(args.memory_limit)
+    budget = args.python_budget or f"{limit // 4 // 1024**2}MB"
+    rows = int(limit * args.ratio / CSV_BYTES_PER_ROW)
+
+    workdir = os.path.abspath(args.workdir)
+    prepare_workspace(workdir)
+    env = dict(os.environ, AML_MEMORY_LIMIT=args.memory_limit, AML_PYTHON_BUDGET=budget)
+    if args.threads:
+        env['AML_THREADS'] = str(args.threads)
+
+    print("="*72)
+    print("MEMORY-CAPPED PIPELINE RUN")
+    print("="*72)
+    print(f"Memory limit: {args.memory_limit}  |  Python budget: {budget}  |  "
+          f"Threads: {args.threads or 'default'}")
+
+    csv_path = os.path.join(workdir, 'data', 'paysim.csv')
+    if not os.path.exists(csv_path) or os.path.getsize(csv_path) < limit * args.ratio:
+        print(f"[INFO] Generating {rows:,} synthetic transactions...")
+        generate(rows, csv_path)
+    size = os.path.getsize(csv_path)
+    print(f"Dataset: {size / 1024**2:,.0f} MB CSV = {size / limit:.1f}x the memory limit")
+    print()
+
+    print(f"{'Step':<12}{'Status':>8}{'Wall':>11}{'Peak RSS':>15}")
+    print("-" * 72)
+    passed = True
+    for name, step_args in [
+        ('etl', ['src/01_etl/load_data.py']),
+        ('pipeline', ['src/04_orchestration/master_pipeline.py', '--force', '--skip', 'publish']),
+    ]:
+        ok, _ = run_step(name, step_args, workdir, env)
+        # load_data.py reports errors without an exit code: check the table too
+        passed = ok and (name != 'etl' or table_rows(workdir, 'transactions') >= rows)
+        if not passed:
+            break
+
+    if passed:
+        loaded = table_rows(workdir, 'transactions')
+        scores = table_rows(workdir, 'ml_scores')
+        alerts = table_rows(workdir, 'rule_alerts')
+        print()
+        print(f"Transactions: {loaded:,}  |  ML anomalies: {scores:,}  |  Rule alerts: {alerts:,}")
+        passed = scores > 0
+
+    print("="*72)
+    print("[SUCCESS] Pipeline completed under the memory cap" if passed
+          else "[ERROR] Memory-capped run failed (see the step logs)")
+
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+API Serialization Benchmark
+Time to turn a DuckDB result into JSON response bytes: the pandas path the API
+used (.df().to_dict('records') + Flask jsonify) vs the serialization layer
+(Arrow fetch + orjson / json), records and columns orient
+
+The result mixes the column types the API returns: INTEGER, VARCHAR,
+DECIMAL(18,2), DATE, TIMESTAMP and DOUBLE.
+
+Usage:
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --rows 100 10000 100000 1000000 --repeat 5
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from flask import Flask, jsonify
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src', 'common'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src', '05_api'))
+
+import serialization
+from db import connect
+from serialization import dumps, fetch_table, payload
+
+QUERY = "SELECT * FROM bench_alerts LIMIT ?"
+
+
+def create_table(conn, rows):
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE bench_alerts AS
+        SELECT
+            range::INTEGER as alert_id,
+            'C' || (range * 7919 % 1000003) as customer_id,
+            (range % 997 * 101.37)::DECIMAL(18,2) as amount,
+            DATE '2025-01-01' + (range % 365)::INTEGER as detection_date,
+            TIMESTAMP '2025-01-01' + INTERVAL (range) SECOND as detected_at,
+            (range % 1000) / 1000.0 as anomaly_score
+        FROM range({rows})
+    """)
+
+
+def pandas_path(app, conn, rows):
+    records = conn.execute(QUERY, [rows]).df().to_dict('records')
+    with app.app_context():
+        return jsonify({"count": len(records), "alerts": records}).get_data()
+
+
+def arrow_path(orient):
+    def run(app, conn, rows):
+        table = fetch_table(conn, QUERY, [rows])
+        return dumps({"count": table.num_rows, "alerts": payload(table, orient)})
+    return run
+
+
+def best_of(fn, repeat, *args):
+    """
+    (best seconds, output bytes) or (None, error) when the path fails
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            body = fn(*args)
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API JSON serialization paths")
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement (best is reported)")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    conn = connect()
+    create_table(conn, max(args.rows))
+    encoder = 'orjson' if serialization.orjson is not None else 'json'
+
+    paths = [('pandas + jsonify', pandas_path),
+             (f'arrow + {encoder} (records)', arrow_path('records')),
+             (f'arrow + {encoder} (columns)', arrow_path('columns'))]
+
+    print("="*78)
+    print("API SERIALIZATION: DuckDB result -> JSON bytes")
+    print("="*78)
+    print(f"{'Rows':>9}  {'Path':<30}{'ms':>10}{'rows/s':>14}{'KB':>10}{'vs pandas':>11}")
+    print("-" * 86)
+
+    for rows in args.rows:
+        baseline = None
+        for name, fn in paths:
+            seconds, size = best_of(fn, args.repeat, app, conn, rows)
+            if seconds is None:
+                print(f"{rows:>9,}  {name:<30}  FAILED  {size}")
+                continue
+            if fn is pandas_path:
+                baseline = seconds
+            speedup = f"{baseline / seconds:>10.1f}x" if baseline else f"{'-':>11}"
+            print(f"{rows:>9,}  {name:<30}{seconds * 1000:>10.1f}{rows / seconds:>14,.0f}"
+                  f"{size / 1024:>10,.0f}{speedup}")
+        print()
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
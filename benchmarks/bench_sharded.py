@@ -0,0 +1,93 @@
+"""
+Sharded Pipeline Scaling Benchmark
+Runs the sharded pipeline at increasing worker counts and reports speedup
+
+Each configuration is a full sharded run (partition, training, shards, merge)
+against data/fraud_data.duckdb, so it rewrites the pipeline outputs like a
+normal run. Speedup and efficiency are relative to the first worker count; the
+in-process pipeline (master_pipeline.py --workers 1 --force) is timed as a
+reference. Load the synthetic dataset first:
+
+    python benchmarks/generate_synthetic.py --rows 5000000
+    python src/01_etl/load_data.py
+
+Usage:
+    python benchmarks/bench_sharded.py
+    python benchmarks/bench_sharded.py --workers 1 2 4 --repeat 3
+"""
+
+import os
+import sys
+import time
+import io
+import argparse
+import contextlib
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_FILE = os.path.join(BASE_DIR, "data", "fraud_data.duckdb")
+sys.path.insert(0, os.path.join(BASE_DIR, 'src', '04_orchestration'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src', 'common'))
+
+from sharded import run_sharded
+import master_pipeline
+from db import connect
+
+
+def timed(func, *args, **kwargs):
+    """
+    Wall time of func with its output silenced
+    """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sharded execution scaling")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per configuration (best is kept)")
+    parser.add_argument('--skip-reference', action='store_true',
+                        help="Don't time the in-process pipeline")
+    args = parser.parse_args()
+
+    with connect(DB_FILE, read_only=True) as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    print("="*72)
+    print("SHARDED PIPELINE SCALING")
+    print("="*72)
+    print(f"Transactions: {rows:,}  |  CPUs: {os.cpu_count()}")
+    print()
+
+    if not args.skip_reference:
+        seconds, _ = timed(master_pipeline.main, ['--force', '--workers', '1', '--skip', 'summary,publish'])
+        print(f"In-process pipeline (reference): {seconds:.1f}s ({rows / seconds:,.0f} rows/s)")
+        print()
+
+    print(f"{'Workers':>8}{'Total s':>10}{'Shards s':>10}{'Merge s':>9}{'Rows/s':>12}"
+          f"{'Speedup':>9}{'Effic.':>8}")
+    print("-" * 66)
+
+    first = None  # (workers, seconds) of the first configuration, normally 1 worker
+    for workers in args.workers:
+        best = None
+        for _ in range(args.repeat):
+            seconds, run = timed(run_sharded, workers, publish=False)
+            if best is None or seconds < best[0]:
+                best = (seconds, run)
+        seconds, run = best
+        stages = {m['stage']: m['seconds'] for m in run['stages']}
+        first = first or (workers, seconds)
+        speedup = first[1] / seconds
+        efficiency = speedup / (workers / first[0])
+        print(f"{workers:>8}{seconds:>10.1f}{stages['shards']:>10.1f}{stages['merge']:>9.1f}"
+              f"{rows / seconds:>12,.0f}{speedup:>8.2f}x{efficiency:>8.0%}")
+
+    print()
+    print("Partitioning, global training and the merge are serial; with fewer CPUs")
+    print("than workers the extra processes only add overhead.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Synthetic PaySim-like Dataset
+Generates transactions with the PaySim schema for benchmarks and local testing
+
+Rows are produced in chunks (constant memory) with a fixed seed, so the same
+arguments always give the same file. Steps increase through the file like the
+real dataset (one step = one hour). A small share of structuring bursts, round
+amounts and fraud labels is injected so the rules and model have work to do.
+
+The output is a CSV consumed by the normal ETL (src/01_etl/load_data.py).
+
+Usage:
+    python benchmarks/generate_synthetic.py --rows 1000000
+    python benchmarks/generate_synthetic.py --rows 30000000 --output data/paysim_30m.csv
+"""
+
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TYPES = np.array(['PAYMENT', 'TRANSFER', 'CASH_OUT', 'DEBIT', 'CASH_IN'])
+TYPE_SHARES = [0.34, 0.08, 0.35, 0.01, 0.22]  # PaySim mix
+STEPS = 743  # 30 days of hourly steps
+
+
+def generate_chunk(rng, n, first_row, total_rows, n_customers, n_merchants):
+    """
+    n transactions starting at global position first_row
+    """
+    position = first_row + np.arange(n)
+    step = 1 + (position * STEPS // total_rows)
+
+    tx_type = rng.choice(TYPES, n, p=TYPE_SHARES)
+    amount = np.round(rng.lognormal(10, 1.5, n), 2)
+
+    # Round amounts (Round_Amount_Pattern)
+    round_mask = rng.random(n) < 0.001
+    amount[round_mask] = rng.integers(1, 10, round_mask.sum()) * 100000.0
+
+    customer = rng.integers(0, n_customers, n)
+
+    # Structuring bursts: a few customers split cash-outs just under 50k in one step
+    burst = rng.random(n) < 0.002
+    amount[burst] = np.round(rng.uniform(5000, 49000, burst.sum()), 2)
+    tx_type[burst] = 'CASH_OUT'
+    customer[burst] = rng.integers(0, max(n_customers // 1000, 1), burst.sum())
+
+    old_orig = np.round(rng.lognormal(11, 2, n), 2)
+    new_orig = np.maximum(old_orig - amount, 0)
+    old_dest = np.round(rng.lognormal(11, 2, n), 2)
+    new_dest = old_dest + amount
+
+    return pd.DataFrame({
+        'step': step,
+        'type': tx_type,
+        'amount': amount,
+        'nameOrig': np.char.add('C', customer.astype(str)),
+        'oldbalanceOrg': old_orig,
+        'newbalanceOrig': new_orig,
+        'nameDest': np.char.add('M', rng.integers(0, n_merchants, n).astype(str)),
+        'oldbalanceDest': old_dest,
+        'newbalanceDest': new_dest,
+        'isFraud': (rng.random(n) < 0.0013).astype(np.int64),
+        'isFlaggedFraud': 0,
+    })
+
+
+def generate(rows, output, chunk_rows=1_000_000, seed=42):
+    """
+    Write `rows` synthetic transactions to `output` (CSV). Returns bytes written.
+    """
+    rng = np.random.default_rng(seed)
+    n_customers = max(rows // 3, 1)
+    n_merchants = max(rows // 2, 1)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    start = time.perf_counter()
+    written = 0
+    for first_row in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - first_row)
+        chunk = generate_chunk(rng, n, first_row, rows, n_customers, n_merchants)
+        chunk.to_csv(output, mode='w' if first_row == 0 else 'a', header=first_row == 0, index=False)
+        written += n
+        print(f"[INFO] {written:,}/{rows:,} rows ({time.perf_counter() - start:.0f}s)")
+
+    size = os.path.getsize(output)
+    print(f"[SUCCESS] Wrote {rows:,} rows ({size / 1024**2:,.0f} MB) to {output}")
+    return size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic PaySim-like dataset")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--output', default=os.path.join(BASE_DIR, 'data', 'paysim.csv'))
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    generate(args.rows, args.output, args.chunk_rows, args.seed)
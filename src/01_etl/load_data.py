@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 
-import duckdb
 import os
 import sys
 
@@ -8,6 +7,11 @@ import sys
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8')
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from db import connect, resource_profile, memory_chunk_count
+from system_stats import ensure_stats_tables, refresh_transaction_stats, refresh_ml_stats
+
 # ============================================================
 # CONFIGURATION: Dynamic project paths
 # ============================================================
@@ -16,6 +20,75 @@ DATA_DIR = os.path.join(BASE_DIR, "data")
 CSV_FILE = os.path.join(DATA_DIR, "paysim.csv")
 DB_FILE = os.path.join(DATA_DIR, "fraud_data.duckdb")
 
+# ML outputs keyed by the transactions rowid. A reload renumbers the rows, so
+# these are dropped with it and the scoring watermark restarts from step 0
+ROWID_TABLES = ['ml_scores', 'ml_explanations', 'ml_alerts']
+ROWID_WATERMARK_JOBS = ['ml_scoring']
+
+# Stored order; amount breaks (customer, step) ties so every load, chunked or
+# not, assigns the same rowids (training samples and scores are rowid-based)
+SORT_KEY = "nameOrig, step, amount"
+
+# DuckDB memory the (nameOrig, step) sort needs per transaction (8.4M synthetic
+# rows fail at 256MB and fit in 384MB); bigger loads are sorted in nameOrig ranges
+SORT_BYTES_PER_ROW = 64
+BOUNDARY_SAMPLE_ROWS = 100_000
+
+
+def load_sorted(conn, source):
+    """
+    Create transactions from source sorted by SORT_KEY.
+
+    Under a memory limit (AML_MEMORY_LIMIT) the rows are first staged unsorted;
+    when one sort would not fit, they are appended in consecutive nameOrig
+    ranges (bounds from a fixed sample), each sorted on its own. The table
+    ends up in the same order either way.
+    """
+    if not resource_profile()['memory_limit']:
+        conn.execute(f"CREATE OR REPLACE TABLE transactions AS SELECT * FROM {source} ORDER BY {SORT_KEY}")
+        return
+
+    conn.execute(f"CREATE OR REPLACE TABLE transactions_staging AS SELECT * FROM {source}")
+    rows = conn.execute("SELECT COUNT(*) FROM transactions_staging").fetchone()[0]
+    n_chunks = memory_chunk_count(rows, SORT_BYTES_PER_ROW)
+    bounds = []
+    if n_chunks > 1:
+        sample = [row[0] for row in conn.execute(f"""
+            SELECT nameOrig FROM transactions_staging
+            WHERE nameOrig IS NOT NULL
+            USING SAMPLE reservoir({BOUNDARY_SAMPLE_ROWS} ROWS) REPEATABLE (42)
+        """).fetchall()]
+        sample.sort()
+        bounds = sorted({sample[len(sample) * i // n_chunks] for i in range(1, n_chunks)}) if sample else []
+        print(f"   Sorting {rows:,} rows in {len(bounds) + 1} nameOrig ranges (memory limit)")
+
+    conn.execute("CREATE OR REPLACE TABLE transactions AS SELECT * FROM transactions_staging WHERE false")
+    for low, high in zip([None] + bounds, bounds + [None]):
+        if low is None and high is None:
+            where, params = "", []
+        elif low is None:
+            where, params = "WHERE nameOrig < ?", [high]
+        elif high is None:
+            where, params = "WHERE nameOrig >= ? OR nameOrig IS NULL", [low]  # NULLs sort last
+        else:
+            where, params = "WHERE nameOrig >= ? AND nameOrig < ?", [low, high]
+        conn.execute(f"""
+            INSERT INTO transactions
+            SELECT * FROM transactions_staging {where}
+            ORDER BY {SORT_KEY}
+        """, params)
+    conn.execute("DROP TABLE transactions_staging")
+
+
+def drop_rowid_tables(conn):
+    """
+    Drop the rowid-keyed ML outputs and reset their watermarks (after a reload)
+    """
+    for table in ROWID_TABLES:
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+    if conn.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = 'pipeline_watermarks'").fetchone()[0]:
+        conn.execute("DELETE FROM pipeline_watermarks WHERE list_contains(?, job_name)", [ROWID_WATERMARK_JOBS])
+
 
 def load_data():
     """
@@ -24,7 +97,8 @@ def load_data():
     Process:
     1. Verify CSV file exists
     2. Connect to DuckDB (creates .duckdb file if doesn't exist)
-    3. Bulk load CSV using read_csv_auto (optimized)
+    3. Bulk load CSV using read_csv_auto (optimized), sorted by (nameOrig, step),
+       dropping the ML outputs that point at the old rowids
     4. Validate successful load
     """
     print(f"🚀 Starting ETL process (Extract, Transform, Load)...")
@@ -43,19 +117,29 @@ def load_data():
     # STEP 2: Connect to DuckDB
     print(f"🔌 Connecting to DuckDB database...")
     print(f"   Location: {DB_FILE}")
-    conn = duckdb.connect(DB_FILE)
+    conn = connect(DB_FILE)
     
     # STEP 3: Bulk load (DuckDB reads CSV 10x faster than Pandas)
     print(f"Importing massive dataset from CSV...")
     print(f"   (This may take 10-30 seconds depending on your machine)")
     
     try:
-        # read_csv_auto automatically detects data types
-        query = f"""
-            CREATE OR REPLACE TABLE transactions AS 
-            SELECT * FROM read_csv_auto('{CSV_FILE}', header=True)
-        """
-        conn.execute(query)
+        # read_csv_auto automatically detects data types.
+        # Stored clustered by customer: each row group covers a narrow nameOrig
+        # range, so per-customer lookups skip all but a few row groups (zone maps)
+        source = f"read_csv_auto('{CSV_FILE}', header=True)"
+        # Table, rowid-keyed cleanup and summary counters (system_stats) commit together
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            load_sorted(conn, source)
+            drop_rowid_tables(conn)
+            ensure_stats_tables(conn)
+            refresh_transaction_stats(conn)
+            refresh_ml_stats(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
         
         # STEP 4: Load validation
         count = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
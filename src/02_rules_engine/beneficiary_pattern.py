@@ -5,14 +5,27 @@ Beneficiary Rotation Detection Rule
 Detects frequent changes in transaction recipients
 """
 
-import duckdb
+import os
+import sys
 
-def detect_beneficiary_rotation():
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from db import connect
+from step_window import step_filter
+
+def detect_beneficiary_rotation(conn=None, from_step=None, to_step=None):
     """
     Detect beneficiary rotation patterns
+    
+    conn: shared DuckDB connection (opened and closed here when omitted)
+    from_step, to_step: micro-batch mode. Only customers with transactions in
+    (from_step, to_step] are re-evaluated (over their full history), and customers
+    already alerted for this rule are not alerted again.
     """
     
-    conn = duckdb.connect('data/fraud_data.duckdb')
+    own_conn = conn is None
+    if own_conn:
+        conn = connect('data/fraud_data.duckdb')
     
     conn.execute("""
         CREATE TABLE IF NOT EXISTS rule_alerts (
@@ -27,8 +40,16 @@ def detect_beneficiary_rotation():
     
     max_id = conn.execute("SELECT COALESCE(MAX(alert_id), 0) FROM rule_alerts").fetchone()[0]
     
+    # Micro-batch: re-evaluate customers active in the window, alert each customer once
+    batch_filter = ""
+    if from_step is not None or to_step is not None:
+        batch_filter = f"""
+          AND nameOrig IN (SELECT nameOrig FROM transactions WHERE TRUE {step_filter(from_step, to_step)})
+          AND nameOrig NOT IN (SELECT customer_id FROM rule_alerts WHERE rule_name = 'Beneficiary_Rotation')
+          {step_filter(None, to_step)}"""
+    
     # PARAMETROS MAS FLEXIBLES: >= 5 beneficiaries
-    query = """
+    query = f"""
     WITH beneficiary_count AS (
         SELECT 
             nameOrig as customer_id,
@@ -39,6 +60,7 @@ def detect_beneficiary_rotation():
         WHERE type IN ('TRANSFER', 'PAYMENT')
           AND nameDest IS NOT NULL
           AND nameDest != ''
+          {batch_filter}
         GROUP BY nameOrig
         HAVING COUNT(DISTINCT nameDest) >= 5
            AND COUNT(*) >= 5
@@ -52,6 +74,7 @@ def detect_beneficiary_rotation():
         total_amount,
         'Multiple recipients: ' || unique_beneficiaries || ' different beneficiaries in ' || tx_count || ' transactions'
     FROM beneficiary_count
+    ORDER BY customer_id
     LIMIT 50
     """
     
@@ -64,7 +87,9 @@ def detect_beneficiary_rotation():
     
     print(f"[INFO] Beneficiary Rotation: {count} alerts generated")
     
-    conn.close()
+    if own_conn:
+        conn.close()
+    return count
 
 if __name__ == "__main__":
     detect_beneficiary_rotation()
@@ -1,6 +1,3 @@
-
-
-
 """
 Rules Engine Executor
 Orchestrates all SQL-based detection rules
@@ -9,91 +6,170 @@ Orchestrates all SQL-based detection rules
 import sys
 import os
 
-# Add project root to path
+# Add project root and this folder to path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(os.path.dirname(current_dir))
 sys.path.insert(0, project_root)
-
-print("\n" + "="*60)
-print("RULES ENGINE EXECUTOR")
-print("="*60 + "\n")
-
-# ============================================
-# EXECUTE ALL RULES
-# ============================================
-
-# Rule 1: Structuring Detection
-print("[INFO] Executing Structuring Detection...")
-try:
-    from rules import detect_structuring
-    detect_structuring()
-    print("[SUCCESS] Structuring detection completed")
-except Exception as e:
-    print(f"[ERROR] Structuring detection failed: {str(e)}")
-
-print()
-
-# Rule 2: Velocity Check
-print("[INFO] Executing Velocity Check...")
-try:
-    from velocity_rule import detect_velocity_abuse
-    detect_velocity_abuse()
-    print("[SUCCESS] Velocity check completed")
-except Exception as e:
-    print(f"[ERROR] Velocity check failed: {str(e)}")
-
-print()
-
-# Rule 3: Round Amounts
-print("[INFO] Executing Round Amounts Detection...")
-try:
-    from round_amounts import detect_round_amounts
-    detect_round_amounts()
-    print("[SUCCESS] Round amounts detection completed")
-except Exception as e:
-    print(f"[ERROR] Round amounts detection failed: {str(e)}")
-
-print()
-
-# Rule 4: Beneficiary Rotation
-print("[INFO] Executing Beneficiary Rotation Detection...")
-try:
-    from beneficiary_pattern import detect_beneficiary_rotation
-    detect_beneficiary_rotation()
-    print("[SUCCESS] Beneficiary rotation detection completed")
-except Exception as e:
-    print(f"[ERROR] Beneficiary rotation detection failed: {str(e)}")
-
-print()
-
-# ============================================
-# SUMMARY
-# ============================================
-print("="*60)
-print("RULES ENGINE SUMMARY")
-print("="*60)
-
-try:
-    import duckdb
-    conn = duckdb.connect('data/fraud_data.duckdb', read_only=True)
-    
-    result = conn.execute("SELECT COUNT(*) as total FROM rule_alerts").fetchone()
-    print(f"Total Alerts Generated: {result[0]}")
-    
-    by_rule = conn.execute("""
-        SELECT rule_name, COUNT(*) as count 
-        FROM rule_alerts 
-        GROUP BY rule_name
-        ORDER BY count DESC
-    """).fetchdf()
-    
-    print("\nAlerts by Rule:")
-    for _, row in by_rule.iterrows():
-        print(f"  - {row['rule_name']}: {row['count']}")
-    
-    conn.close()
-    
-except Exception as e:
-    print(f"[WARNING] Could not generate summary: {str(e)}")
-
-print("="*60 + "\n")
+sys.path.insert(0, current_dir)
+sys.path.insert(0, os.path.join(project_root, 'src', '04_orchestration'))
+sys.path.insert(0, os.path.join(project_root, 'src', 'common'))
+
+from telemetry import new_run, begin_stage, end_stage, record_run, print_stage_table, table_count
+from db import connect
+from system_stats import refresh_rule_stats
+
+
+def run_rules(conn=None, from_step=None, to_step=None, transaction=True):
+    """
+    Execute all rules in sequence (they share rule_alerts ids, so never concurrently).
+
+    conn: shared DuckDB connection; opened on the pipeline database when omitted.
+    from_step, to_step: restrict rules to the steps (from_step, to_step] (micro-batch mode)
+    transaction: commit the alerts and the rule counters of system_stats together,
+    rolling both back if any rule fails. False when the caller already holds a
+    transaction on conn (stream service: alerts + watermark).
+    Returns the number of rules that failed.
+    """
+    failures = 0
+    own_conn = conn is None
+    if own_conn:
+        conn = connect('data/fraud_data.duckdb')
+    if transaction:
+        conn.execute("BEGIN TRANSACTION")
+
+    # ============================================
+    # EXECUTE ALL RULES
+    # ============================================
+
+    # Rule 1: Structuring Detection
+    print("[INFO] Executing Structuring Detection...")
+    try:
+        from rules import detect_structuring
+        detect_structuring(conn, from_step, to_step)
+        print("[SUCCESS] Structuring detection completed")
+    except Exception as e:
+        failures += 1
+        print(f"[ERROR] Structuring detection failed: {str(e)}")
+
+    print()
+
+    # Rule 2: Velocity Check
+    print("[INFO] Executing Velocity Check...")
+    try:
+        from velocity_rule import detect_velocity_abuse
+        detect_velocity_abuse(conn, from_step, to_step)
+        print("[SUCCESS] Velocity check completed")
+    except Exception as e:
+        failures += 1
+        print(f"[ERROR] Velocity check failed: {str(e)}")
+
+    print()
+
+    # Rule 3: Round Amounts
+    print("[INFO] Executing Round Amounts Detection...")
+    try:
+        from round_amounts import detect_round_amounts
+        detect_round_amounts(conn, from_step, to_step)
+        print("[SUCCESS] Round amounts detection completed")
+    except Exception as e:
+        failures += 1
+        print(f"[ERROR] Round amounts detection failed: {str(e)}")
+
+    print()
+
+    # Rule 4: Beneficiary Rotation
+    print("[INFO] Executing Beneficiary Rotation Detection...")
+    try:
+        from beneficiary_pattern import detect_beneficiary_rotation
+        detect_beneficiary_rotation(conn, from_step, to_step)
+        print("[SUCCESS] Beneficiary rotation detection completed")
+    except Exception as e:
+        failures += 1
+        print(f"[ERROR] Beneficiary rotation detection failed: {str(e)}")
+
+    print()
+
+    # Per-rule counters read by /stats and the dashboard (system_stats)
+    if not failures:
+        try:
+            refresh_rule_stats(conn)
+        except Exception as e:
+            failures += 1
+            print(f"[ERROR] Rule statistics refresh failed: {str(e)}")
+
+    if transaction:
+        if failures:
+            conn.execute("ROLLBACK")
+            print("[ERROR] Rules rolled back: no alerts written")
+        else:
+            conn.execute("COMMIT")
+    if own_conn:
+        conn.close()
+
+    return failures
+
+
+def print_summary(conn=None):
+    """
+    Print alert totals per rule
+    """
+    print("="*60)
+    print("RULES ENGINE SUMMARY")
+    print("="*60)
+
+    try:
+        own_conn = conn is None
+        if own_conn:
+            conn = connect('data/fraud_data.duckdb', read_only=True)
+
+        result = conn.execute("SELECT COUNT(*) as total FROM rule_alerts").fetchone()
+        print(f"Total Alerts Generated: {result[0]}")
+
+        by_rule = conn.execute("""
+            SELECT rule_name, COUNT(*) as count
+            FROM rule_alerts
+            GROUP BY rule_name
+            ORDER BY count DESC
+        """).fetchdf()
+
+        print("\nAlerts by Rule:")
+        for _, row in by_rule.iterrows():
+            print(f"  - {row['rule_name']}: {row['count']}")
+
+        if own_conn:
+            conn.close()
+
+    except Exception as e:
+        print(f"[WARNING] Could not generate summary: {str(e)}")
+
+    print("="*60 + "\n")
+
+
+def run_rules_engine(conn=None):
+    """
+    Pipeline stage: all rules plus summary. Raises if any rule failed.
+    Returns row counts for telemetry.
+    """
+    failures = run_rules(conn)
+    print_summary(conn)
+    if failures:
+        raise RuntimeError(f"{failures} rule(s) failed")
+    return {'rows_in': table_count(conn, 'transactions'),
+            'rows_out': table_count(conn, 'rule_alerts')}
+
+
+if __name__ == "__main__":
+    print("\n" + "="*60)
+    print("RULES ENGINE EXECUTOR")
+    print("="*60 + "\n")
+
+    run = new_run('rules_executor')
+    metrics = begin_stage('rules')
+    try:
+        run['stages'].append(end_stage(metrics, 'success', output=run_rules_engine()))
+    except Exception as e:
+        run['stages'].append(end_stage(metrics, 'failed', error=str(e)))
+
+    print_stage_table(run['stages'])
+    print(f"Telemetry: {record_run(run)}")
+    sys.exit(0 if metrics['status'] == 'success' else 1)
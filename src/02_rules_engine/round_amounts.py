@@ -6,14 +6,25 @@ Round Amount Detection Rule
 Detects suspicious round number patterns
 """
 
-import duckdb
+import os
+import sys
 
-def detect_round_amounts():
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from db import connect
+from step_window import step_filter
+
+def detect_round_amounts(conn=None, from_step=None, to_step=None):
     """
     Detect suspicious use of round amounts
+    
+    conn: shared DuckDB connection (opened and closed here when omitted)
+    from_step, to_step: only evaluate transactions in (from_step, to_step] (micro-batch mode)
     """
     
-    conn = duckdb.connect('data/fraud_data.duckdb')
+    own_conn = conn is None
+    if own_conn:
+        conn = connect('data/fraud_data.duckdb')
     
     conn.execute("""
         CREATE TABLE IF NOT EXISTS rule_alerts (
@@ -29,7 +40,7 @@ def detect_round_amounts():
     max_id = conn.execute("SELECT COALESCE(MAX(alert_id), 0) FROM rule_alerts").fetchone()[0]
     
     # PARAMETROS MAS FLEXIBLES: 100000 divisible por 100000
-    query = """
+    query = f"""
     WITH round_amounts AS (
         SELECT 
             nameOrig as customer_id,
@@ -39,6 +50,7 @@ def detect_round_amounts():
         WHERE amount % 100000 = 0
           AND amount >= 100000
           AND type IN ('TRANSFER', 'CASH_OUT')
+          {step_filter(from_step, to_step)}
     )
     INSERT INTO rule_alerts (alert_id, customer_id, rule_name, detection_date, amount, description)
     SELECT 
@@ -49,6 +61,7 @@ def detect_round_amounts():
         amount,
         'Suspicious exact round amount: $' || ROUND(amount, 2)
     FROM round_amounts
+    ORDER BY customer_id, step, amount
     LIMIT 50
     """
     
@@ -61,7 +74,9 @@ def detect_round_amounts():
     
     print(f"[INFO] Round Amounts: {count} alerts generated")
     
-    conn.close()
+    if own_conn:
+        conn.close()
+    return count
 
 if __name__ == "__main__":
     detect_round_amounts()
@@ -6,14 +6,25 @@ Structuring Detection Rule
 Detects multiple small transactions below reporting threshold
 """
 
-import duckdb
+import os
+import sys
 
-def detect_structuring():
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from db import connect
+from step_window import step_filter
+
+def detect_structuring(conn=None, from_step=None, to_step=None):
     """
     Detect potential structuring (smurfing) patterns
+    
+    conn: shared DuckDB connection (opened and closed here when omitted)
+    from_step, to_step: only evaluate transactions in (from_step, to_step] (micro-batch mode)
     """
     
-    conn = duckdb.connect('data/fraud_data.duckdb')
+    own_conn = conn is None
+    if own_conn:
+        conn = connect('data/fraud_data.duckdb')
     
     conn.execute("""
         CREATE TABLE IF NOT EXISTS rule_alerts (
@@ -29,7 +40,7 @@ def detect_structuring():
     max_id = conn.execute("SELECT COALESCE(MAX(alert_id), 0) FROM rule_alerts").fetchone()[0]
     
     # PARAMETROS MAS FLEXIBLES: >= 2 transacciones, total > 5000
-    query = """
+    query = f"""
     WITH structuring_candidates AS (
         SELECT 
             nameOrig as customer_id,
@@ -41,6 +52,7 @@ def detect_structuring():
         WHERE amount < 50000
           AND amount > 1000
           AND type IN ('CASH_OUT', 'TRANSFER')
+          {step_filter(from_step, to_step)}
         GROUP BY nameOrig, step
         HAVING COUNT(*) >= 2
            AND SUM(amount) > 5000
@@ -55,6 +67,7 @@ def detect_structuring():
         'Potential structuring: ' || tx_count || ' transactions totaling $' || 
         ROUND(total_amount, 2) || ' (avg: $' || ROUND(avg_amount, 2) || ')'
     FROM structuring_candidates
+    ORDER BY customer_id, step
     LIMIT 50
     """
     
@@ -67,7 +80,9 @@ def detect_structuring():
     
     print(f"[INFO] Structuring Detection: {count} alerts generated")
     
-    conn.close()
+    if own_conn:
+        conn.close()
+    return count
 
 if __name__ == "__main__":
     detect_structuring()
@@ -0,0 +1,20 @@
+"""
+Step Window
+Restricts a rule to a micro-batch of steps (from_step, to_step]
+"""
+
+
+def step_filter(from_step=None, to_step=None, lookback=0):
+    """
+    SQL predicate (starting with AND) for transactions in (from_step - lookback, to_step].
+    Empty string when no window is given (full-history batch run).
+    """
+    if from_step is None and to_step is None:
+        return ""
+
+    clauses = []
+    if from_step is not None:
+        clauses.append(f"step > {int(from_step) - int(lookback)}")
+    if to_step is not None:
+        clauses.append(f"step <= {int(to_step)}")
+    return "AND " + " AND ".join(clauses)
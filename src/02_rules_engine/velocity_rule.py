@@ -6,14 +6,29 @@ Velocity Check Rule
 Detects rapid transaction sequences
 """
 
-import duckdb
+import os
+import sys
 
-def detect_velocity_abuse():
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from db import connect
+from step_window import step_filter
+
+# Steps between two large transfers that count as a burst
+MAX_STEP_GAP = 2
+
+def detect_velocity_abuse(conn=None, from_step=None, to_step=None):
     """
     Detect suspicious velocity patterns
+    
+    conn: shared DuckDB connection (opened and closed here when omitted)
+    from_step, to_step: only alert on transactions in (from_step, to_step] (micro-batch mode);
+    the previous MAX_STEP_GAP steps are read so bursts spanning batches are caught
     """
     
-    conn = duckdb.connect('data/fraud_data.duckdb')
+    own_conn = conn is None
+    if own_conn:
+        conn = connect('data/fraud_data.duckdb')
     
     conn.execute("""
         CREATE TABLE IF NOT EXISTS rule_alerts (
@@ -29,17 +44,18 @@ def detect_velocity_abuse():
     max_id = conn.execute("SELECT COALESCE(MAX(alert_id), 0) FROM rule_alerts").fetchone()[0]
     
     # PARAMETROS MAS FLEXIBLES: amount > 100000 (antes 50000)
-    query = """
+    query = f"""
     WITH velocity_check AS (
         SELECT 
             nameOrig as customer_id,
             step,
             amount,
-            LAG(step) OVER (PARTITION BY nameOrig ORDER BY step) as prev_step,
-            step - LAG(step) OVER (PARTITION BY nameOrig ORDER BY step) as time_diff
+            LAG(step) OVER (PARTITION BY nameOrig ORDER BY step, amount) as prev_step,
+            step - LAG(step) OVER (PARTITION BY nameOrig ORDER BY step, amount) as time_diff
         FROM transactions
         WHERE type IN ('CASH_OUT', 'TRANSFER')
           AND amount > 100000
+          {step_filter(from_step, to_step, lookback=MAX_STEP_GAP)}
     )
     INSERT INTO rule_alerts (alert_id, customer_id, rule_name, detection_date, amount, description)
     SELECT 
@@ -50,7 +66,9 @@ def detect_velocity_abuse():
         amount,
         'Suspicious velocity: Transaction of $' || ROUND(amount, 2) || ' within ' || time_diff || ' steps'
     FROM velocity_check
-    WHERE time_diff <= 2
+    WHERE time_diff <= {MAX_STEP_GAP}
+      {step_filter(from_step, None)}
+    ORDER BY customer_id, step, amount
     LIMIT 50
     """
     
@@ -63,7 +81,9 @@ def detect_velocity_abuse():
     
     print(f"[INFO] Velocity Check: {count} alerts generated")
     
-    conn.close()
+    if own_conn:
+        conn.close()
+    return count
 
 if __name__ == "__main__":
     detect_velocity_abuse()
@@ -1,58 +1,58 @@
-
-
 """
 Anomaly Detection using Isolation Forest
 """
 
-import duckdb
-import pandas as pd
-import numpy as np
+import os
+import sys
+import time
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 import pickle
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from db import connect, chunk_count
+from system_stats import refresh_ml_stats
+from features import FEATURES, TRAINING_SAMPLE_MODULO, training_query
+from prefilter import fit_hbos, hbos_scores, calibrate_threshold
+from calibration import new_digest, digest_update, build_calibration
+from drift import build_reference, evaluate, persist_drift_metrics
+from explain import explain_anomalies
+from batch_scoring import score_transactions, BYTES_PER_ROW
+
+MODEL_PARAMS = {
+    'contamination': 0.005,
+    'random_state': 42,
+    'n_estimators': 100,
+    'max_samples': 0.8,
+    'n_jobs': -1,
+}
 
-def train_and_score():
+def train_model(conn, cascade_recall=None):
     """
-    Train Isolation Forest and score all transactions
+    Fit scaler, Isolation Forest, score calibration, optional prefilter and drift
+    reference on the training sample, and save them to data/isolation_forest.pkl.
+    Returns the artifacts dict (same keys as the pickle).
     """
     
-    conn = duckdb.connect('data/fraud_data.duckdb')
-    
     print("[INFO] Loading transaction data...")
     
-    # Sample 10% for training (usando step como identificador)
-    df_sample = conn.execute("""
-        SELECT 
-            step,
-            nameOrig,
-            amount,
-            oldbalanceOrg,
-            newbalanceOrig,
-            oldbalanceDest,
-            newbalanceDest,
-            CASE type
-                WHEN 'PAYMENT' THEN 1
-                WHEN 'TRANSFER' THEN 2
-                WHEN 'CASH_OUT' THEN 3
-                WHEN 'DEBIT' THEN 4
-                WHEN 'CASH_IN' THEN 5
-                ELSE 0
-            END as type_encoded,
-            ROW_NUMBER() OVER () as row_id
-        FROM transactions
-        WHERE amount > 0
-    """).fetchdf()
-    
-    # Sample 10%
-    df_sample = df_sample[df_sample['row_id'] % 10 == 0].copy()
+    # Sample 10% for training (every 10th rowid, filtered in SQL), thinned
+    # further when the sample would exceed the Python memory budget
+    sample_rows = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] // TRAINING_SAMPLE_MODULO
+    stride = chunk_count(sample_rows, BYTES_PER_ROW)
+    if stride > 1:
+        print(f"[WARNING] Training sample exceeds the Python memory budget: "
+              f"using every {TRAINING_SAMPLE_MODULO * stride}th transaction")
+    df_sample = conn.execute(training_query(stride)).fetchdf()
     
     print(f"[INFO] Training sample: {len(df_sample):,} transactions")
     
     # Prepare features
-    features = ['amount', 'oldbalanceOrg', 'newbalanceOrig', 
-                'oldbalanceDest', 'newbalanceDest', 'type_encoded']
+    features = FEATURES
     
-    X_train = df_sample[features].fillna(0)
+    X_train = df_sample[features].fillna(0).to_numpy()
     
     # Normalize
     scaler = StandardScaler()
@@ -60,101 +60,150 @@ def train_and_score():
     
     # Train Isolation Forest
     print("[INFO] Training Isolation Forest...")
-    iso_forest = IsolationForest(
-        contamination=0.005,
-        random_state=42,
-        n_estimators=100,
-        max_samples=0.8,
-        n_jobs=-1
-    )
+    iso_forest = IsolationForest(**MODEL_PARAMS)
     
     iso_forest.fit(X_scaled)
     
-    # Save model
-    with open('data/isolation_forest.pkl', 'wb') as f:
-        pickle.dump((iso_forest, scaler), f)
+    train_decision = iso_forest.decision_function(X_scaled)
     
-    print("[INFO] Model saved to data/isolation_forest.pkl")
+    # Calibrate scores against the training distribution (stable across runs)
+    calibration = build_calibration(digest_update(new_digest(), train_decision))
     
-    # Score all transactions
-    print("[INFO] Scoring all transactions...")
+    # Calibrate prefilter against the forest on the training sample
+    prefilter = None
+    forest_scored = None
+    if cascade_recall is not None:
+        prefilter = fit_hbos(X_train)
+        train_flags = train_decision < 0
+        hbos_train = hbos_scores(prefilter, X_train)
+        calibrate_threshold(prefilter, hbos_train, train_flags, cascade_recall)
+        forest_scored = hbos_train >= prefilter['threshold']
+        print(f"[INFO] Prefilter calibrated for {cascade_recall:.1%} recall "
+              f"(HBOS threshold: {prefilter['threshold']:.2f})")
     
-    df_all = conn.execute("""
-        SELECT 
-            step,
-            nameOrig,
-            amount,
-            oldbalanceOrg,
-            newbalanceOrig,
-            oldbalanceDest,
-            newbalanceDest,
-            CASE type
-                WHEN 'PAYMENT' THEN 1
-                WHEN 'TRANSFER' THEN 2
-                WHEN 'CASH_OUT' THEN 3
-                WHEN 'DEBIT' THEN 4
-                WHEN 'CASH_IN' THEN 5
-                ELSE 0
-            END as type_encoded,
-            ROW_NUMBER() OVER () as row_id
-        FROM transactions
-        WHERE amount > 0
-    """).fetchdf()
-    
-    X_all = df_all[features].fillna(0)
-    X_all_scaled = scaler.transform(X_all)
-    
-    # Get anomaly predictions
-    predictions = iso_forest.predict(X_all_scaled)
-    
-    # Get decision scores
-    decision_scores = iso_forest.decision_function(X_all_scaled)
-    
-    # Filter only anomalies
-    df_anomalies = df_all[predictions == -1].copy()
-    anomaly_decision_scores = decision_scores[predictions == -1]
-    
-    # Normalize anomaly scores to 0-1
-    if len(df_anomalies) > 0:
-        min_score = anomaly_decision_scores.min()
-        max_score = anomaly_decision_scores.max()
-        
-        if max_score != min_score:
-            normalized_scores = (max_score - anomaly_decision_scores) / (max_score - min_score)
-        else:
-            normalized_scores = np.ones(len(df_anomalies)) * 0.5
-        
-        df_anomalies['anomaly_score'] = normalized_scores
-    
-    # Create ml_scores table
+    # Reference histograms for drift monitoring
+    drift_reference = build_reference(features, X_train, train_decision, forest_scored)
+    
+    # Save model
+    artifacts = {
+        'model': iso_forest,
+        'scaler': scaler,
+        'features': features,
+        'calibration': calibration,
+        'prefilter': prefilter,
+        'drift_reference': drift_reference,
+        'model_version': datetime.now().strftime('%Y%m%d%H%M%S'),
+    }
+    with open('data/isolation_forest.pkl', 'wb') as f:
+        pickle.dump(artifacts, f)
+    
+    print(f"[INFO] Model {artifacts['model_version']} saved to data/isolation_forest.pkl")
+    return artifacts
+
+
+def write_ml_scores(conn, df_anomalies, model_version):
+    """
+    Replace ml_scores with the flagged rows (row_id, step, nameOrig, anomaly_score)
+    and refresh the ML counters of system_stats (run inside a transaction)
+    """
     conn.execute("DROP TABLE IF EXISTS ml_scores")
     
     conn.execute("""
         CREATE TABLE ml_scores (
-            row_id INTEGER PRIMARY KEY,
+            row_id BIGINT PRIMARY KEY,
             step INTEGER,
             customer_id VARCHAR,
-            anomaly_score DOUBLE
+            anomaly_score DOUBLE,
+            model_version VARCHAR
         )
     """)
     
     # Insert only anomalies
     if len(df_anomalies) > 0:
-        for _, row in df_anomalies.iterrows():
-            conn.execute("""
-                INSERT INTO ml_scores VALUES (?, ?, ?, ?)
-            """, [int(row['row_id']), int(row['step']), row['nameOrig'], float(row['anomaly_score'])])
+        conn.execute("""
+            INSERT INTO ml_scores
+            SELECT row_id, step, nameOrig, anomaly_score, ? FROM df_anomalies
+        """, [model_version])
+    
+    refresh_ml_stats(conn)
+
+
+def train_and_score(cascade_recall=None, conn=None, timings=None):
+    """
+    Train Isolation Forest and score all transactions
+
+    cascade_recall: when set (e.g. 0.99), an HBOS prefilter calibrated to keep that
+    share of the forest's training-sample anomalies selects the candidates; only
+    candidates are scored by the forest.
+    
+    conn: shared DuckDB connection (opened and closed here when omitted)
+    timings: optional dict filled with training_seconds / scoring_seconds
+    """
+    
+    timings = {} if timings is None else timings
+    phase_start = time.perf_counter()
+    
+    own_conn = conn is None
+    if own_conn:
+        conn = connect('data/fraud_data.duckdb')
+    
+    artifacts = train_model(conn, cascade_recall)
+    iso_forest = artifacts['model']
+    scaler = artifacts['scaler']
+    features = artifacts['features']
+    prefilter = artifacts['prefilter']
+    drift_reference = artifacts['drift_reference']
+    model_version = artifacts['model_version']
+    
+    timings['training_seconds'] = time.perf_counter() - phase_start
+    phase_start = time.perf_counter()
+    
+    # Score all transactions (chunked when over the Python memory budget)
+    print("[INFO] Scoring all transactions...")
+    
+    scored = score_transactions(conn, artifacts)
+    df_anomalies = scored['anomalies']
+    n_rows = scored['rows']
+    
+    if prefilter is not None:
+        print(f"[INFO] Prefilter passed {scored['candidates']:,} candidates "
+              f"({scored['candidates']/max(n_rows, 1)*100:.2f}%) to the forest")
+    
+    # Drift: histograms accumulated while scoring (no extra scan)
+    persist_drift_metrics(conn, 'ml_training', model_version, n_rows,
+                          evaluate(drift_reference, scored['drift']))
+    
+    # Scores and their summary counters commit together
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        write_ml_scores(conn, df_anomalies, model_version)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    
+    # Explain flagged rows only (cached per model version)
+    explained = explain_anomalies(conn, iso_forest, scaler, features,
+                                  scored['X_anomalies'], df_anomalies['row_id'], model_version)
+    print(f"[INFO] Explanations computed for {explained:,} anomalies")
     
     # Get statistics
     high_risk = (df_anomalies['anomaly_score'] >= 0.7).sum() if len(df_anomalies) > 0 else 0
     medium_risk = (df_anomalies['anomaly_score'] >= 0.5).sum() if len(df_anomalies) > 0 else 0
     
-    print(f"[INFO] Scored {len(df_all):,} transactions")
-    print(f"[INFO] Anomalies detected: {len(df_anomalies)} ({len(df_anomalies)/len(df_all)*100:.4f}%)")
+    print(f"[INFO] Scored {n_rows:,} transactions")
+    print(f"[INFO] Anomalies detected: {len(df_anomalies)} ({len(df_anomalies)/n_rows*100:.4f}%)")
     print(f"[INFO] High risk (score >= 0.7): {high_risk}")
     print(f"[INFO] Medium risk (score >= 0.5): {medium_risk}")
     
-    conn.close()
+    timings['scoring_seconds'] = time.perf_counter() - phase_start
+    
+    if own_conn:
+        conn.close()
+    return n_rows, len(df_anomalies)
 
 if __name__ == "__main__":
-    train_and_score()
+    cascade_recall = None
+    if '--cascade-recall' in sys.argv:
+        cascade_recall = float(sys.argv[sys.argv.index('--cascade-recall') + 1])
+    train_and_score(cascade_recall=cascade_recall)
@@ -1,26 +1,61 @@
-
-
-
 """
 Customer Baseline Creation
 Creates statistical profiles for each customer
+
+Two modes:
+- Full: drop and rebuild customer_baselines with a GROUP BY over all transactions
+- Incremental: keep per-customer sufficient statistics (count, sum, Welford M2,
+  min/max, type bitmask) in customer_baseline_stats and merge only the steps
+  added since the last run, so refresh cost follows new volume
 """
 
-import duckdb
+import os
+import sys
+import math
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from db import connect
+from features import TYPE_CODES, type_code_sql
+from watermarks import get_watermark, set_watermark
+
+WATERMARK_JOB = 'customer_baselines'
+
 
-def create_baselines():
+def _drop_customer_baselines(conn):
+    """
+    Drop customer_baselines whether it currently is a table (full mode) or a view (incremental mode)
+    """
+    is_view = conn.execute("""
+        SELECT COUNT(*) FROM duckdb_views()
+        WHERE view_name = 'customer_baselines' AND NOT internal
+    """).fetchone()[0]
+    if is_view:
+        conn.execute("DROP VIEW customer_baselines")
+    else:
+        conn.execute("DROP TABLE IF EXISTS customer_baselines")
+
+
+def create_baselines(incremental=False, conn=None):
     """
     Create customer behavioral baselines
+
+    conn: shared DuckDB connection (opened and closed here when omitted)
     """
-    
-    conn = duckdb.connect('data/fraud_data.duckdb')
-    
+
+    if incremental:
+        return update_baselines(conn)
+
+    own_conn = conn is None
+    if own_conn:
+        conn = connect('data/fraud_data.duckdb')
+
     # Drop and recreate table
-    conn.execute("DROP TABLE IF EXISTS customer_baselines")
-    
+    _drop_customer_baselines(conn)
+
     conn.execute("""
         CREATE TABLE customer_baselines AS
-        SELECT 
+        SELECT
             nameOrig as customer_id,
             COUNT(*) as tx_count,
             AVG(amount) as avg_amount,
@@ -33,11 +68,203 @@ def create_baselines():
         GROUP BY nameOrig
         HAVING COUNT(*) >= 2
     """)
-    
+
     count = conn.execute("SELECT COUNT(*) FROM customer_baselines").fetchone()[0]
     print(f"[INFO] Created baselines for {count:,} customers")
-    
-    conn.close()
+
+    if own_conn:
+        conn.close()
+    return count
+
+
+def update_baselines(conn=None, to_step=None):
+    """
+    Merge transactions newer than the baseline watermark into customer_baseline_stats
+    (up to to_step when given, e.g. one micro-batch).
+
+    One grouped aggregate over the new steps produces per-customer batch statistics,
+    which are upserted with Chan's parallel variance formula:
+        M2 = M2_a + M2_b + delta^2 * n_a * n_b / (n_a + n_b)
+    customer_baselines becomes a view over the statistics table.
+    Returns the number of transactions merged.
+    """
+
+    own_conn = conn is None
+    if own_conn:
+        conn = connect('data/fraud_data.duckdb')
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS customer_baseline_stats (
+            customer_id VARCHAR PRIMARY KEY,
+            tx_count BIGINT,
+            sum_amount DOUBLE,
+            m2_amount DOUBLE,
+            min_amount DOUBLE,
+            max_amount DOUBLE,
+            sum_balance DOUBLE,
+            type_mask INTEGER,
+            last_step INTEGER
+        )
+    """)
+
+    last_step = get_watermark(conn, WATERMARK_JOB)
+    new_step = conn.execute(
+        "SELECT MAX(step) FROM transactions WHERE step > ? AND (? IS NULL OR step <= ?)",
+        [last_step, to_step, to_step]
+    ).fetchone()[0]
+
+    if new_step is None:
+        print(f"[INFO] Baselines up to date (watermark: step {last_step})")
+        if own_conn:
+            conn.close()
+        return 0
+
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        rows = conn.execute(
+            "SELECT COUNT(*) FROM transactions WHERE step > ? AND step <= ?",
+            [last_step, new_step]
+        ).fetchone()[0]
+
+        conn.execute(f"""
+            INSERT INTO customer_baseline_stats
+            SELECT
+                nameOrig as customer_id,
+                COUNT(*) as tx_count,
+                SUM(amount) as sum_amount,
+                VAR_POP(amount) * COUNT(*) as m2_amount,
+                MIN(amount) as min_amount,
+                MAX(amount) as max_amount,
+                SUM(oldbalanceOrg) as sum_balance,
+                BIT_OR(1 << {type_code_sql()}) as type_mask,
+                MAX(step) as last_step
+            FROM transactions
+            WHERE step > ? AND step <= ?
+            GROUP BY nameOrig
+            ON CONFLICT (customer_id) DO UPDATE SET
+                tx_count = customer_baseline_stats.tx_count + EXCLUDED.tx_count,
+                sum_amount = customer_baseline_stats.sum_amount + EXCLUDED.sum_amount,
+                m2_amount = customer_baseline_stats.m2_amount + EXCLUDED.m2_amount
+                    + POWER(EXCLUDED.sum_amount / EXCLUDED.tx_count
+                            - customer_baseline_stats.sum_amount / customer_baseline_stats.tx_count, 2)
+                    * customer_baseline_stats.tx_count * EXCLUDED.tx_count
+                    / (customer_baseline_stats.tx_count + EXCLUDED.tx_count),
+                min_amount = LEAST(customer_baseline_stats.min_amount, EXCLUDED.min_amount),
+                max_amount = GREATEST(customer_baseline_stats.max_amount, EXCLUDED.max_amount),
+                sum_balance = customer_baseline_stats.sum_balance + EXCLUDED.sum_balance,
+                type_mask = customer_baseline_stats.type_mask | EXCLUDED.type_mask,
+                last_step = GREATEST(customer_baseline_stats.last_step, EXCLUDED.last_step)
+        """, [last_step, new_step])
+
+        _drop_customer_baselines(conn)
+        conn.execute("""
+            CREATE VIEW customer_baselines AS
+            SELECT
+                customer_id,
+                tx_count,
+                sum_amount / tx_count as avg_amount,
+                SQRT(m2_amount / (tx_count - 1)) as std_amount,
+                max_amount,
+                min_amount,
+                sum_balance / tx_count as avg_balance,
+                BIT_COUNT(type_mask) as tx_types
+            FROM customer_baseline_stats
+            WHERE tx_count >= 2
+        """)
+
+        set_watermark(conn, WATERMARK_JOB, new_step, rows)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        if own_conn:
+            conn.close()
+        raise
+
+    print(f"[INFO] Merged {rows:,} transactions (steps {last_step + 1}-{new_step}) into customer baselines")
+
+    if own_conn:
+        conn.close()
+    return rows
+
+
+# ============================================
+# IN-PROCESS UPDATES (streaming scorer)
+# ============================================
+
+def new_customer_state(customer_id):
+    """
+    Empty sufficient statistics for a customer, same fields as customer_baseline_stats
+    """
+    return {
+        'customer_id': customer_id,
+        'tx_count': 0,
+        'sum_amount': 0.0,
+        'm2_amount': 0.0,
+        'min_amount': None,
+        'max_amount': None,
+        'sum_balance': 0.0,
+        'type_mask': 0,
+        'last_step': None,
+    }
+
+
+def update_customer_state(state, amount, balance, tx_type, step=None):
+    """
+    Welford update of one customer's statistics with a single transaction.
+    Mirrors the batch upsert in update_baselines() for a batch of size one.
+    """
+    n = state['tx_count']
+    old_mean = state['sum_amount'] / n if n else 0.0
+
+    state['tx_count'] = n + 1
+    state['sum_amount'] += amount
+    new_mean = state['sum_amount'] / state['tx_count']
+    state['m2_amount'] += (amount - old_mean) * (amount - new_mean)
+
+    state['min_amount'] = amount if state['min_amount'] is None else min(state['min_amount'], amount)
+    state['max_amount'] = amount if state['max_amount'] is None else max(state['max_amount'], amount)
+    state['sum_balance'] += balance
+    state['type_mask'] |= 1 << TYPE_CODES.get(tx_type, 0)
+    if step is not None:
+        state['last_step'] = step if state['last_step'] is None else max(state['last_step'], step)
+
+    return state
+
+
+def baseline_from_state(state):
+    """
+    Derive the customer_baselines columns from sufficient statistics
+    """
+    n = state['tx_count']
+    return {
+        'customer_id': state['customer_id'],
+        'tx_count': n,
+        'avg_amount': state['sum_amount'] / n if n else None,
+        'std_amount': math.sqrt(state['m2_amount'] / (n - 1)) if n >= 2 else None,
+        'max_amount': state['max_amount'],
+        'min_amount': state['min_amount'],
+        'avg_balance': state['sum_balance'] / n if n else None,
+        'tx_types': bin(state['type_mask']).count('1'),
+    }
+
+
+def load_customer_states(conn, customer_ids):
+    """
+    Fetch persisted statistics for the given customers into in-process state dicts
+    """
+    states = {}
+    if not customer_ids:
+        return states
+
+    cursor = conn.execute(
+        "SELECT * FROM customer_baseline_stats WHERE customer_id IN (SELECT UNNEST(?))",
+        [list(customer_ids)]
+    )
+    columns = [d[0] for d in cursor.description]
+    for row in cursor.fetchall():
+        states[row[0]] = dict(zip(columns, row))
+    return states
+
 
 if __name__ == "__main__":
-    create_baselines()
+    create_baselines(incremental='--incremental' in sys.argv)
@@ -0,0 +1,95 @@
+"""
+Batch Scoring
+Scores transactions with trained artifacts, in row-id chunks when the result
+would not fit the Python memory budget (AML_PYTHON_BUDGET, see src/common/db.py)
+
+Chunks are contiguous row-id ranges; only the flagged rows, their feature
+matrix and the drift histograms are kept across chunks, so memory stays
+bounded by one chunk. Scores are identical to a single-pass run.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from db import chunk_count
+from features import feature_query
+from prefilter import cascade_decision
+from calibration import calibrated_scores
+from drift import new_accumulator, accumulate
+
+# Estimated pandas/numpy footprint of one scored row: feature frame (incl. the
+# nameOrig string), feature matrix, scaled copy and scores
+BYTES_PER_ROW = 256
+
+
+def row_id_chunks(conn, where=None, row_id_column='rowid', memory_share=1):
+    """
+    WHERE clauses splitting the transactions matching `where` into budget-sized
+    row-id ranges. Returns (row count, [where clause per chunk]).
+    """
+    condition = f"amount > 0{f' AND {where}' if where else ''}"
+    rows, low, high = conn.execute(f"""
+        SELECT COUNT(*), MIN({row_id_column}), MAX({row_id_column})
+        FROM transactions WHERE {condition}
+    """).fetchone()
+
+    n_chunks = chunk_count(rows, BYTES_PER_ROW, memory_share)
+    if n_chunks == 1:
+        return rows, [where]
+
+    edges = np.linspace(low, high + 1, n_chunks + 1).astype(np.int64)
+    prefix = f"{where} AND " if where else ""
+    return rows, [f"{prefix}{row_id_column} >= {edges[i]} AND {row_id_column} < {edges[i + 1]}"
+                  for i in range(n_chunks)]
+
+
+def score_transactions(conn, artifacts, where=None, row_id_column='rowid', memory_share=1):
+    """
+    Score the transactions matching `where` (SQL on the transactions table).
+    memory_share divides the Python budget between concurrent processes.
+
+    Returns a dict with:
+    - rows: number of transactions scored
+    - anomalies: DataFrame of flagged rows (row_id, step, nameOrig, amount,
+      features, anomaly_score) in row-id order
+    - X_anomalies: feature matrix of the flagged rows (for explanations)
+    - drift: drift accumulator over all scored rows
+    - candidates: rows the prefilter passed to the forest
+    - chunks: number of chunks used
+    """
+    features = artifacts['features']
+    reference = artifacts['drift_reference']
+    rows, chunks = row_id_chunks(conn, where, row_id_column, memory_share)
+    if len(chunks) > 1:
+        print(f"[INFO] {rows:,} rows exceed the Python memory budget: scoring in {len(chunks)} chunks")
+
+    result = {'rows': 0, 'candidates': 0, 'chunks': len(chunks),
+              'drift': new_accumulator(reference)}
+    flagged_frames, flagged_X = [], []
+
+    for chunk_where in chunks:
+        df = conn.execute(feature_query(chunk_where, row_id_column=row_id_column)).fetchdf()
+        X = df[features].fillna(0).to_numpy()
+
+        decision_scores, candidates = cascade_decision(artifacts['model'], artifacts['scaler'],
+                                                       X, artifacts['prefilter'])
+        flagged = decision_scores < 0
+
+        accumulate(reference, result['drift'], features, X, decision_scores)
+        anomalies = df[flagged].copy()
+        anomalies['anomaly_score'] = calibrated_scores(artifacts['calibration'], decision_scores[flagged])
+
+        flagged_frames.append(anomalies)
+        flagged_X.append(X[flagged])
+        result['rows'] += len(df)
+        result['candidates'] += int(candidates.sum())
+        del df, X, decision_scores
+
+    result['anomalies'] = pd.concat(flagged_frames, ignore_index=True)
+    result['X_anomalies'] = np.concatenate(flagged_X) if flagged_X else np.empty((0, len(features)))
+    return result
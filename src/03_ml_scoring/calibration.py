@@ -0,0 +1,133 @@
+"""
+Score Calibration
+Maps Isolation Forest decision scores to run-independent values using a t-digest
+
+The digest summarizes the decision scores of the training sample and is stored
+with the model. Every later score (batch, daily, streaming, API) is mapped through
+the same digest, so a given calibrated score means the same thing in every run.
+
+Digests are plain dicts of NumPy arrays so they pickle with the model and can be
+merged (e.g. digests built per shard or per day).
+"""
+
+import numpy as np
+
+# Higher compression = more centroids = finer resolution (k1 scale keeps tails precise)
+DEFAULT_COMPRESSION = 1000
+
+
+def _k_scale(q, compression):
+    """
+    t-digest k1 scale function: clusters are small near q=0 and q=1
+    """
+    return compression / (2 * np.pi) * np.arcsin(2 * np.clip(q, 0.0, 1.0) - 1)
+
+
+def _compress(compression, means, weights):
+    """
+    Merge sorted points into centroids that each span at most one unit of k-space
+    """
+    order = np.argsort(means, kind='mergesort')
+    means = means[order]
+    weights = weights[order]
+
+    cum = np.cumsum(weights)
+    q_mid = (cum - weights / 2) / cum[-1]
+    bucket = np.floor(_k_scale(q_mid, compression)).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+
+    merged_weights = np.add.reduceat(weights, starts)
+    merged_means = np.add.reduceat(means * weights, starts) / merged_weights
+    return merged_means, merged_weights
+
+
+def new_digest(compression=DEFAULT_COMPRESSION):
+    """
+    Empty t-digest
+    """
+    return {
+        'compression': compression,
+        'means': np.empty(0),
+        'weights': np.empty(0),
+        'min': np.inf,
+        'max': -np.inf,
+    }
+
+
+def digest_update(digest, values):
+    """
+    Add a batch of values to a digest (in place)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return digest
+
+    means = np.concatenate([digest['means'], values])
+    weights = np.concatenate([digest['weights'], np.ones(len(values))])
+    digest['means'], digest['weights'] = _compress(digest['compression'], means, weights)
+    digest['min'] = min(digest['min'], values.min())
+    digest['max'] = max(digest['max'], values.max())
+    return digest
+
+
+def digest_merge(a, b):
+    """
+    Combine two digests into a new one
+    """
+    compression = max(a['compression'], b['compression'])
+    merged = new_digest(compression)
+    if len(a['means']) + len(b['means']) == 0:
+        return merged
+
+    merged['means'], merged['weights'] = _compress(
+        compression,
+        np.concatenate([a['means'], b['means']]),
+        np.concatenate([a['weights'], b['weights']])
+    )
+    merged['min'] = min(a['min'], b['min'])
+    merged['max'] = max(a['max'], b['max'])
+    return merged
+
+
+def build_calibration(digest):
+    """
+    Freeze a digest into a piecewise-linear CDF lookup table.
+
+    tail_mass is the share of training rows with decision score < 0, i.e. the rows
+    the model itself labels anomalous (~ contamination).
+    """
+    weights = digest['weights']
+    cum = np.cumsum(weights)
+    cdf_points = (cum - weights / 2) / cum[-1]
+
+    xs = np.concatenate([[digest['min']], digest['means'], [digest['max']]])
+    ys = np.concatenate([[0.0], cdf_points, [1.0]])
+
+    return {
+        'xs': xs,
+        'ys': ys,
+        'tail_mass': float(np.interp(0.0, xs, ys)),
+        'n': float(cum[-1]),
+        'digest': digest,
+    }
+
+
+def score_percentiles(calibration, decision_scores):
+    """
+    Share of training rows that are less anomalous than each score (0-1).
+    Binary search over the CDF table: O(log n) per row.
+    """
+    return 1.0 - np.interp(decision_scores, calibration['xs'], calibration['ys'])
+
+
+def calibrated_scores(calibration, decision_scores):
+    """
+    Position of each score inside the training anomaly tail (0-1, higher = more anomalous).
+
+    0 = at the model's anomaly boundary, 1 = beyond the most extreme training row.
+    Normal rows (decision score >= 0) map to 0. NaN (unscored) stays NaN.
+    """
+    cdf = np.interp(decision_scores, calibration['xs'], calibration['ys'])
+    tail_mass = max(calibration['tail_mass'], 1.0 / calibration['n'])
+    return np.clip(1.0 - cdf / tail_mass, 0.0, 1.0)
@@ -0,0 +1,183 @@
+"""
+Drift Monitoring
+Compares feature and score distributions of a scoring run with the training reference
+
+The reference (quantile bin edges + training counts per feature and for the
+decision score) is stored with the model. Scoring runs accumulate histograms over
+the arrays they already hold in memory, so monitoring adds no scan of the data.
+
+PSI thresholds follow common credit-risk practice:
+- PSI < 0.10: stable
+- 0.10 - 0.25: warning
+- >= 0.25: drift, retraining recommended
+"""
+
+import numpy as np
+
+DEFAULT_BINS = 20
+PSI_WARNING = 0.10
+PSI_DRIFT = 0.25
+
+SCORE_METRIC = 'decision_score'
+
+
+def _inner_edges(values, n_bins):
+    """
+    Quantile cut points; duplicates collapse (e.g. features with many zero balances)
+    """
+    qs = np.linspace(0, 1, n_bins + 1)[1:-1]
+    return np.unique(np.quantile(values, qs))
+
+
+def _bin_counts(edges, values):
+    """
+    Counts per bin; the two outer bins are open-ended so unseen ranges are still counted
+    """
+    idx = np.searchsorted(edges, values, side='right')
+    return np.bincount(idx, minlength=len(edges) + 1).astype(np.float64)
+
+
+def build_reference(features, X_train, train_decision, score_mask=None, n_bins=DEFAULT_BINS):
+    """
+    Training-time reference histograms.
+
+    score_mask restricts the score reference to the rows the forest actually scores
+    (prefilter candidates when the cascade is on), matching what scoring runs observe.
+    """
+    reference = {'features': {}, 'score': None}
+
+    for j, name in enumerate(features):
+        edges = _inner_edges(X_train[:, j], n_bins)
+        reference['features'][name] = {'edges': edges, 'counts': _bin_counts(edges, X_train[:, j])}
+
+    scores = train_decision if score_mask is None else train_decision[score_mask]
+    if len(scores) > 0:
+        edges = _inner_edges(scores, n_bins)
+        reference['score'] = {'edges': edges, 'counts': _bin_counts(edges, scores)}
+
+    return reference
+
+
+def new_accumulator(reference):
+    """
+    Empty histograms with the reference bin layout
+    """
+    return {
+        'features': {
+            name: np.zeros(len(ref['edges']) + 1) for name, ref in reference['features'].items()
+        },
+        'score': None if reference['score'] is None else np.zeros(len(reference['score']['edges']) + 1),
+        'n_rows': 0,
+    }
+
+
+def accumulate(reference, acc, features, X, decision_scores):
+    """
+    Add one scored batch to the accumulator. NaN decision scores (rows the
+    prefilter skipped) only count towards feature histograms.
+    """
+    for j, name in enumerate(features):
+        acc['features'][name] += _bin_counts(reference['features'][name]['edges'], X[:, j])
+
+    if acc['score'] is not None:
+        scored = decision_scores[~np.isnan(decision_scores)]
+        acc['score'] += _bin_counts(reference['score']['edges'], scored)
+
+    acc['n_rows'] += len(X)
+    return acc
+
+
+def psi(expected_counts, actual_counts, eps=1e-4):
+    """
+    Population Stability Index between two histograms
+    """
+    e = np.maximum(expected_counts / max(expected_counts.sum(), 1), eps)
+    a = np.maximum(actual_counts / max(actual_counts.sum(), 1), eps)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def ks_statistic(expected_counts, actual_counts):
+    """
+    Kolmogorov-Smirnov distance computed on the binned CDFs
+    """
+    e = np.cumsum(expected_counts) / max(expected_counts.sum(), 1)
+    a = np.cumsum(actual_counts) / max(actual_counts.sum(), 1)
+    return float(np.max(np.abs(a - e)))
+
+
+def _status(value):
+    if value >= PSI_DRIFT:
+        return 'drift'
+    if value >= PSI_WARNING:
+        return 'warning'
+    return 'stable'
+
+
+def evaluate(reference, acc):
+    """
+    PSI / KS per feature and for the decision score.
+    Returns a list of dicts: metric, kind, psi, ks, status.
+    """
+    results = []
+    for name, ref in reference['features'].items():
+        value = psi(ref['counts'], acc['features'][name])
+        results.append({
+            'metric': name,
+            'kind': 'feature',
+            'psi': value,
+            'ks': ks_statistic(ref['counts'], acc['features'][name]),
+            'status': _status(value),
+        })
+
+    if acc['score'] is not None and acc['score'].sum() > 0:
+        value = psi(reference['score']['counts'], acc['score'])
+        results.append({
+            'metric': SCORE_METRIC,
+            'kind': 'score',
+            'psi': value,
+            'ks': ks_statistic(reference['score']['counts'], acc['score']),
+            'status': _status(value),
+        })
+
+    return results
+
+
+def persist_drift_metrics(conn, job_name, model_version, n_rows, results):
+    """
+    Append results to drift_metrics and report whether retraining is due
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS drift_metrics (
+            measured_at TIMESTAMP,
+            job_name VARCHAR,
+            model_version VARCHAR,
+            metric VARCHAR,
+            kind VARCHAR,
+            psi DOUBLE,
+            ks DOUBLE,
+            n_rows BIGINT,
+            status VARCHAR
+        )
+    """)
+
+    conn.executemany("""
+        INSERT INTO drift_metrics VALUES (CURRENT_TIMESTAMP, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [
+        [job_name, model_version, r['metric'], r['kind'], r['psi'], r['ks'], n_rows, r['status']]
+        for r in results
+    ])
+
+    drifted = [r for r in results if r['status'] == 'drift']
+    warned = [r for r in results if r['status'] == 'warning']
+
+    if drifted:
+        names = ', '.join(f"{r['metric']} (PSI {r['psi']:.3f})" for r in drifted)
+        print(f"[WARNING] Drift detected: {names}")
+        print("[WARNING] Retraining recommended: python src/03_ml_scoring/executor.py")
+    elif warned:
+        names = ', '.join(f"{r['metric']} (PSI {r['psi']:.3f})" for r in warned)
+        print(f"[INFO] Moderate distribution shift: {names}")
+    else:
+        print(f"[INFO] No drift detected across {len(results)} monitored distributions")
+
+    return len(drifted) > 0
@@ -1,6 +1,3 @@
-
-
-
 """
 ML Scoring Executor
 Orchestrates baseline creation and anomaly detection
@@ -9,69 +6,136 @@ Orchestrates baseline creation and anomaly detection
 import sys
 import os
 
-# Add project root to path
+# Add project root and this folder to path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(os.path.dirname(current_dir))
 sys.path.insert(0, project_root)
+sys.path.insert(0, current_dir)
+sys.path.insert(0, os.path.join(project_root, 'src', '04_orchestration'))
+sys.path.insert(0, os.path.join(project_root, 'src', 'common'))
 
-print("\n" + "="*60)
-print("ML SCORING EXECUTOR")
-print("="*60 + "\n")
+from telemetry import new_run, begin_stage, end_stage, record_run, print_stage_table, table_count
+from db import connect
 
-# ============================================
-# PHASE 1: CREATE BASELINES
-# ============================================
-print("[INFO] Creating customer baselines...")
-try:
+
+def run_baselines(conn=None, incremental=False):
+    """
+    Pipeline stage: customer baselines (full rebuild or incremental merge)
+    Returns row counts for telemetry.
+    """
+    print("[INFO] Creating customer baselines...")
     from baseline import create_baselines
-    create_baselines()
+    result = create_baselines(incremental=incremental, conn=conn)
     print("[SUCCESS] Baselines created")
-except Exception as e:
-    print(f"[ERROR] Baseline creation failed: {str(e)}")
 
-print()
+    # Full rebuild reads every transaction; incremental returns the rows merged
+    rows_in = result if incremental else table_count(conn, 'transactions')
+    return {'rows_in': rows_in, 'rows_out': table_count(conn, 'customer_baselines')}
+
+
+def run_profiles(conn=None, incremental=False):
+    """
+    Pipeline stage: customer profiles for API/dashboard lookups (rebuild or incremental merge)
+    Returns row counts for telemetry.
+    """
+    print("[INFO] Updating customer profiles...")
+    from profiles import update_profiles
+    rows_in = update_profiles(conn, rebuild=not incremental)
+    print("[SUCCESS] Customer profiles updated")
+    return {'rows_in': rows_in, 'rows_out': table_count(conn, 'customer_profiles')}
 
-# ============================================
-# PHASE 2: ANOMALY DETECTION
-# ============================================
-print("[INFO] Running anomaly detection...")
-try:
+
+def run_anomaly_detection(conn=None, cascade_recall=None):
+    """
+    Pipeline stage: train Isolation Forest and score all transactions
+    Returns row counts and the training/scoring split for telemetry.
+    """
+    print("[INFO] Running anomaly detection...")
     from anomaly_detection import train_and_score
-    train_and_score()
+    timings = {}
+    scored, anomalies = train_and_score(cascade_recall=cascade_recall, conn=conn, timings=timings)
     print("[SUCCESS] Anomaly detection completed")
-except Exception as e:
-    print(f"[ERROR] Anomaly detection failed: {str(e)}")
-
-print()
-
-# ============================================
-# SUMMARY
-# ============================================
-print("="*60)
-print("ML SCORING SUMMARY")
-print("="*60)
-
-try:
-    import duckdb
-    conn = duckdb.connect('data/fraud_data.duckdb', read_only=True)
-    
-    result = conn.execute("""
-        SELECT 
-            COUNT(*) as total,
-            SUM(CASE WHEN anomaly_score >= 0.8 THEN 1 ELSE 0 END) as critical,
-            SUM(CASE WHEN anomaly_score >= 0.6 THEN 1 ELSE 0 END) as high,
-            SUM(CASE WHEN anomaly_score >= 0.5 THEN 1 ELSE 0 END) as medium
-        FROM ml_scores
-    """).fetchone()
-    
-    print(f"Total Scored: {result[0]:,}")
-    print(f"Critical Risk (>= 0.8): {result[1]}")
-    print(f"High Risk (>= 0.6): {result[2]}")
-    print(f"Medium Risk (>= 0.5): {result[3]}")
-    
-    conn.close()
-    
-except Exception as e:
-    print(f"[WARNING] Could not generate summary: {str(e)}")
-
-print("="*60 + "\n")
+    return {'rows_in': scored, 'rows_out': anomalies, **timings}
+
+
+def print_summary(conn=None):
+    """
+    Print anomaly counts per risk band
+    """
+    print("="*60)
+    print("ML SCORING SUMMARY")
+    print("="*60)
+
+    try:
+        own_conn = conn is None
+        if own_conn:
+            conn = connect('data/fraud_data.duckdb', read_only=True)
+
+        result = conn.execute("""
+            SELECT
+                COUNT(*) as total,
+                SUM(CASE WHEN anomaly_score >= 0.8 THEN 1 ELSE 0 END) as critical,
+                SUM(CASE WHEN anomaly_score >= 0.6 THEN 1 ELSE 0 END) as high,
+                SUM(CASE WHEN anomaly_score >= 0.5 THEN 1 ELSE 0 END) as medium
+            FROM ml_scores
+        """).fetchone()
+
+        print(f"Total Scored: {result[0]:,}")
+        print(f"Critical Risk (>= 0.8): {result[1]}")
+        print(f"High Risk (>= 0.6): {result[2]}")
+        print(f"Medium Risk (>= 0.5): {result[3]}")
+
+        if own_conn:
+            conn.close()
+
+    except Exception as e:
+        print(f"[WARNING] Could not generate summary: {str(e)}")
+
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    print("\n" + "="*60)
+    print("ML SCORING EXECUTOR")
+    print("="*60 + "\n")
+
+    cascade_recall = None
+    if '--cascade-recall' in sys.argv:
+        cascade_recall = float(sys.argv[sys.argv.index('--cascade-recall') + 1])
+
+    run = new_run('ml_executor')
+
+    # ============================================
+    # PHASE 1: CREATE BASELINES
+    # ============================================
+    metrics = begin_stage('baselines')
+    try:
+        run['stages'].append(end_stage(metrics, 'success',
+                                       output=run_baselines(incremental='--incremental' in sys.argv)))
+    except Exception as e:
+        run['stages'].append(end_stage(metrics, 'failed', error=str(e)))
+        print(f"[ERROR] Baseline creation failed: {str(e)}")
+
+    print()
+
+    # ============================================
+    # PHASE 2: ANOMALY DETECTION
+    # ============================================
+    metrics = begin_stage('anomaly_detection')
+    try:
+        run['stages'].append(end_stage(metrics, 'success',
+                                       output=run_anomaly_detection(cascade_recall=cascade_recall)))
+    except Exception as e:
+        run['stages'].append(end_stage(metrics, 'failed', error=str(e)))
+        print(f"[ERROR] Anomaly detection failed: {str(e)}")
+
+    print()
+
+    # ============================================
+    # SUMMARY
+    # ============================================
+    print_summary()
+    print_stage_table(run['stages'])
+    print(f"Telemetry: {record_run(run)}")
+    failed = any(m['status'] != 'success' for m in run['stages'])
+    sys.exit(1 if failed else 0)
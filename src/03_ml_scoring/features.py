@@ -0,0 +1,71 @@
+"""
+Feature Definitions
+Shared transaction type encoding used by baselines and anomaly detection
+"""
+
+# PaySim transaction types -> integer code (0 = unknown)
+TYPE_CODES = {
+    'PAYMENT': 1,
+    'TRANSFER': 2,
+    'CASH_OUT': 3,
+    'DEBIT': 4,
+    'CASH_IN': 5,
+}
+
+
+def type_code_sql(column='type'):
+    """
+    SQL CASE expression mapping a transaction type column to its integer code
+    """
+    whens = "\n".join(
+        f"                WHEN '{name}' THEN {code}" for name, code in TYPE_CODES.items()
+    )
+    return f"""CASE {column}
+{whens}
+                ELSE 0
+            END"""
+
+
+# Numerical model inputs, in column order
+FEATURES = ['amount', 'oldbalanceOrg', 'newbalanceOrig',
+            'oldbalanceDest', 'newbalanceDest', 'type_encoded']
+
+# Every 10th transaction is used for training
+TRAINING_SAMPLE_MODULO = 10
+
+
+def feature_query(where=None, extra_columns=(), row_id_column='rowid'):
+    """
+    SELECT producing model features for transactions.
+    row_id is the DuckDB rowid of the transaction. It is stable until the ETL
+    reloads transactions, which drops the row_id-keyed ML tables with it
+    (row_id_column overrides it, e.g. for shards that carry the original rowid).
+    extra_columns are passed through unchanged (e.g. isFraud for evaluation).
+    """
+    conditions = ['amount > 0']
+    if where:
+        conditions.append(where)
+    extra = ''.join(f"{column},\n            " for column in extra_columns)
+
+    return f"""
+        SELECT
+            {extra}{row_id_column} as row_id,
+            step,
+            nameOrig,
+            amount,
+            oldbalanceOrg,
+            newbalanceOrig,
+            oldbalanceDest,
+            newbalanceDest,
+            {type_code_sql()} as type_encoded
+        FROM transactions
+        WHERE {' AND '.join(conditions)}
+    """
+
+
+def training_query(stride=1):
+    """
+    Feature query restricted to the deterministic training sample
+    (stride > 1 keeps every stride-th sampled row, for memory-capped runs)
+    """
+    return feature_query(f"rowid % {TRAINING_SAMPLE_MODULO * int(stride)} = 0")
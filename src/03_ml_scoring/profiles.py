@@ -0,0 +1,190 @@
+"""
+Customer Profiles
+Materialized per-customer totals served by the API and dashboard customer lookups
+
+customer_profiles holds one row per originating customer (PRIMARY KEY, so
+DuckDB keeps an ART index on client_id and lookups are index point reads
+instead of a scan of transactions). It is maintained incrementally behind the
+'customer_profiles' watermark: each refresh aggregates only the new steps and
+upserts the totals.
+
+unique_recipients can't be merged from per-batch counts (a recipient may
+already be known), so the distinct (customer, recipient) pairs are kept in
+customer_recipients and only pairs not seen before are counted.
+
+A full build (first run or rebuild) loads customer_profiles without the key
+and adds it afterwards: one large insert into a keyed table builds the index
+in transaction-local memory and doesn't fit under a memory limit.
+customer_recipients has no key for the same reason (one row per pair, only
+read by the anti-join).
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from db import connect
+from features import type_code_sql
+from watermarks import get_watermark, set_watermark
+
+WATERMARK_JOB = 'customer_profiles'
+
+# Profile fields as served by the API and the dashboard (p = customer_profiles)
+PROFILE_COLUMNS = """
+        p.client_id,
+        p.total_transactions,
+        CAST(p.total_volume AS DECIMAL(18,2)) as total_volume,
+        CAST(p.total_volume / p.total_transactions AS DECIMAL(18,2)) as avg_amount,
+        CAST(p.max_amount AS DECIMAL(18,2)) as max_amount,
+        BIT_COUNT(p.type_mask) as transaction_types,
+        p.unique_recipients,
+        p.last_step
+"""
+
+# Lookup query shared by the API and the dashboard
+PROFILE_QUERY = f"""
+    SELECT {PROFILE_COLUMNS}
+    FROM customer_profiles p
+    WHERE p.client_id = ?
+"""
+
+
+def ensure_profile_tables(conn, primary_key=True):
+    key = ",\n            PRIMARY KEY (client_id)" if primary_key else ""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS customer_profiles (
+            client_id VARCHAR,
+            total_transactions BIGINT,
+            total_volume DOUBLE,
+            max_amount DOUBLE,
+            type_mask INTEGER,
+            unique_recipients BIGINT,
+            last_step INTEGER{key}
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS customer_recipients (
+            client_id VARCHAR,
+            recipient VARCHAR
+        )
+    """)
+
+
+def update_profiles(conn=None, to_step=None, rebuild=False):
+    """
+    Merge transactions newer than the profile watermark into customer_profiles
+    (up to to_step when given). rebuild=True starts over from an empty table,
+    e.g. after the ETL reloaded transactions.
+    Returns the number of transactions merged.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = connect('data/fraud_data.duckdb')
+
+    ensure_profile_tables(conn)
+    last_step = 0 if rebuild else get_watermark(conn, WATERMARK_JOB)
+
+    # Transactions reloaded behind our back (fewer steps than consumed): start over
+    max_step = conn.execute("SELECT COALESCE(MAX(step), 0) FROM transactions").fetchone()[0]
+    if max_step < last_step:
+        print(f"[WARNING] transactions end at step {max_step}, before the profile watermark "
+              f"({last_step}): rebuilding customer profiles")
+        last_step = 0
+
+    new_step = conn.execute(
+        "SELECT MAX(step) FROM transactions WHERE step > ? AND (? IS NULL OR step <= ?)",
+        [last_step, to_step, to_step]
+    ).fetchone()[0]
+
+    if new_step is None:
+        print(f"[INFO] Customer profiles up to date (watermark: step {last_step})")
+        if own_conn:
+            conn.close()
+        return 0
+
+    # Full build: start from empty tables and key customer_profiles at the end
+    full = last_step == 0
+
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        if full:
+            conn.execute("DROP TABLE customer_profiles")
+            conn.execute("DROP TABLE customer_recipients")
+            ensure_profile_tables(conn, primary_key=False)
+
+        rows = conn.execute(
+            "SELECT COUNT(*) FROM transactions WHERE step > ? AND step <= ?",
+            [last_step, new_step]
+        ).fetchone()[0]
+
+        # Recipient pairs first seen in this batch
+        conn.execute("""
+            CREATE OR REPLACE TEMP TABLE new_recipients AS
+            SELECT DISTINCT t.nameOrig as client_id, t.nameDest as recipient
+            FROM transactions t
+            WHERE t.step > ? AND t.step <= ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM customer_recipients r
+                  WHERE r.client_id = t.nameOrig AND r.recipient = t.nameDest
+              )
+        """, [last_step, new_step])
+        conn.execute("INSERT INTO customer_recipients SELECT * FROM new_recipients")
+
+        upsert = "" if full else """
+            ON CONFLICT (client_id) DO UPDATE SET
+                total_transactions = customer_profiles.total_transactions + EXCLUDED.total_transactions,
+                total_volume = customer_profiles.total_volume + EXCLUDED.total_volume,
+                max_amount = GREATEST(customer_profiles.max_amount, EXCLUDED.max_amount),
+                type_mask = customer_profiles.type_mask | EXCLUDED.type_mask,
+                unique_recipients = customer_profiles.unique_recipients + EXCLUDED.unique_recipients,
+                last_step = GREATEST(customer_profiles.last_step, EXCLUDED.last_step)
+        """
+        conn.execute(f"""
+            INSERT INTO customer_profiles
+            SELECT
+                b.client_id,
+                b.total_transactions,
+                b.total_volume,
+                b.max_amount,
+                b.type_mask,
+                COALESCE(n.recipients, 0) as unique_recipients,
+                b.last_step
+            FROM (
+                SELECT
+                    nameOrig as client_id,
+                    COUNT(*) as total_transactions,
+                    SUM(amount) as total_volume,
+                    MAX(amount) as max_amount,
+                    BIT_OR(1 << {type_code_sql()}) as type_mask,
+                    MAX(step) as last_step
+                FROM transactions
+                WHERE step > ? AND step <= ?
+                GROUP BY nameOrig
+            ) b
+            LEFT JOIN (
+                SELECT client_id, COUNT(*) as recipients FROM new_recipients GROUP BY client_id
+            ) n USING (client_id)
+            {upsert}
+        """, [last_step, new_step])
+        conn.execute("DROP TABLE new_recipients")
+        if full:
+            conn.execute("ALTER TABLE customer_profiles ADD PRIMARY KEY (client_id)")
+
+        set_watermark(conn, WATERMARK_JOB, new_step, rows)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        if own_conn:
+            conn.close()
+        raise
+
+    print(f"[INFO] Merged {rows:,} transactions (steps {last_step + 1}-{new_step}) into customer profiles")
+
+    if own_conn:
+        conn.close()
+    return rows
+
+
+if __name__ == "__main__":
+    update_profiles(rebuild='--rebuild' in sys.argv)
@@ -12,8 +12,15 @@ Usage Pattern:
 - TRAINING: Executed once initially, then periodically (weekly/monthly)
 - SCORING: Executed DAILY (or in real-time batch) on new transactions
 
-In this demo project, we use a static PaySim dataset, so we score a sample.
-In a real system, this would score transactions from the last 24 hours.
+Each run scores exactly the transactions after the last scored step, tracked in
+pipeline_watermarks (job 'ml_scoring'). Alerts are appended to ml_alerts tagged
+with the run_id, and every run is recorded in ml_scoring_runs. All writes of a
+run (alerts, explanations, drift metrics, run record, watermark) commit in one
+transaction, so a crashed run leaves nothing behind and is simply re-run.
+
+Transactions are assumed to arrive in step order: rows appended later for a
+step at or below the watermark are never scored. The stream service rejects
+such late drop files instead of ingesting them.
 
 Production Deployment Example:
 - Cron job: Execute daily at 2:00 AM
@@ -21,101 +28,190 @@ Production Deployment Example:
 - Real-time: Kafka stream processing with model serving
 """
 
-import duckdb
-import pandas as pd
 import pickle
 import os
+import sys
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from db import connect
+from batch_scoring import score_transactions
+from explain import explain_anomalies
+from drift import evaluate, persist_drift_metrics
+from watermarks import get_watermark, set_watermark
+from system_stats import refresh_ml_stats
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DB_FILE = os.path.join(BASE_DIR, "data", "fraud_data.duckdb")
 MODEL_PATH = os.path.join(BASE_DIR, "data", "isolation_forest.pkl")
 
-def score_new_transactions():
+WATERMARK_JOB = 'ml_scoring'
+
+
+def ensure_alert_tables(conn):
     """
-    Score new transactions using pre-trained Isolation Forest model.
+    Create (or migrate) ml_alerts history and the ml_scoring_runs log
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ml_alerts (
+            client_id VARCHAR,
+            anomaly_score DOUBLE,
+            alert_type VARCHAR,
+            risk_score INTEGER,
+            detection_date VARCHAR
+        )
+    """)
+    # Columns added for run-partitioned history (older databases lack them)
+    for column, column_type in [('run_id', 'VARCHAR'), ('row_id', 'BIGINT'), ('step', 'INTEGER'),
+                                ('amount', 'DOUBLE'), ('model_version', 'VARCHAR')]:
+        conn.execute(f"ALTER TABLE ml_alerts ADD COLUMN IF NOT EXISTS {column} {column_type}")
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ml_scoring_runs (
+            run_id VARCHAR PRIMARY KEY,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            from_step INTEGER,
+            to_step INTEGER,
+            rows_scored BIGINT,
+            anomalies BIGINT,
+            model_version VARCHAR
+        )
+    """)
+
+
+def load_artifacts():
+    """
+    Load the trained model artifacts, or None when no model has been trained yet
+    """
+    if not os.path.exists(MODEL_PATH):
+        return None
+    with open(MODEL_PATH, 'rb') as f:
+        return pickle.load(f)
+
+
+def score_new_transactions(max_steps=None, conn=None, to_step=None, artifacts=None):
+    """
+    Score transactions newer than the scoring watermark using the pre-trained model.
     
-    Production Behavior:
-    In a real payment system, this function would:
-    1. Query transactions from the last 24 hours (WHERE created_at >= NOW() - INTERVAL 1 DAY)
-    2. Apply the trained model to detect anomalies
-    3. Write alerts to a monitoring dashboard or notification system
-    4. Return metrics for observability (alert count, processing time)
+    max_steps: optional cap on the number of steps consumed by one run
+    (the rest is picked up by the next run).
+    conn: shared DuckDB connection (opened and closed here when omitted)
+    to_step: optional upper bound on the steps scored (micro-batch mode)
+    artifacts: already loaded model artifacts (loaded from MODEL_PATH when omitted)
     
-    Demo Behavior:
-    Since PaySim is static, we score a random sample to simulate daily processing.
+    Returns a summary dict (run_id, from_step, to_step, rows_scored, anomalies),
+    or None when the model is missing.
     """
-    print(f"[INFO] Daily Scoring Job - Execution Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    started_at = datetime.now()
+    run_id = started_at.strftime('%Y%m%d%H%M%S%f')
+    print(f"[INFO] Daily Scoring Job - Execution Time: {started_at.strftime('%Y-%m-%d %H:%M:%S')}")
     
-    if not os.path.exists(MODEL_PATH):
+    if artifacts is None:
+        print("[INFO] Loading pre-trained Isolation Forest model...")
+        artifacts = load_artifacts()
+    if artifacts is None:
         print("[ERROR] Trained model not found. Please run training first.")
         print("       Execute: python src/03_ml_scoring/executor.py")
-        return
+        return None
 
-    print("[INFO] Loading pre-trained Isolation Forest model...")
-    with open(MODEL_PATH, 'rb') as f:
-        artifacts = pickle.load(f)
-        model = artifacts['model']
-        scaler = artifacts['scaler']
-        feature_cols = artifacts['features']
-    
-    conn = duckdb.connect(DB_FILE)
-    
-    # PRODUCTION QUERY (commented example):
-    # In a real system with timestamp columns, you would use:
-    # WHERE transaction_date >= CURRENT_DATE - INTERVAL 1 DAY
-    
-    # DEMO QUERY (static dataset):
-    # We score a sample to simulate daily batch processing
-    print("[INFO] Loading transactions to score...")
-    print("       Note: In production, this would query last 24h of data")
-    
-    query = f"""
-        SELECT 
-            nameOrig as client_id,
-            {', '.join(feature_cols)}
-        FROM transactions
-        USING SAMPLE 10 PERCENT
-        LIMIT 100000
-    """
+    model = artifacts['model']
+    scaler = artifacts['scaler']
+    feature_cols = artifacts['features']
+    drift_reference = artifacts['drift_reference']
+    model_version = artifacts['model_version']
+    print(f"[INFO] Model version: {model_version}")
+    
+    own_conn = conn is None
+    if own_conn:
+        conn = connect(DB_FILE)
+    ensure_alert_tables(conn)
+    
+    # Step range: everything after the watermark (up to to_step when given)
+    last_step = get_watermark(conn, WATERMARK_JOB)
+    upper_step = to_step
+    to_step = conn.execute(
+        "SELECT MAX(step) FROM transactions WHERE step > ? AND (? IS NULL OR step <= ?)",
+        [last_step, upper_step, upper_step]
+    ).fetchone()[0]
     
-    df = conn.execute(query).df()
-    print(f"[INFO] Loaded {len(df):,} transactions for scoring")
+    summary = {'run_id': run_id, 'from_step': last_step + 1, 'to_step': last_step,
+               'rows_scored': 0, 'anomalies': 0}
     
-    X = df[feature_cols]
-    X_scaled = scaler.transform(X)
+    if to_step is None:
+        print(f"[INFO] No new transactions after step {last_step}. Nothing to score.")
+        if own_conn:
+            conn.close()
+        return summary
     
-    df['anomaly_score'] = model.decision_function(X_scaled)
-    df['is_anomaly'] = model.predict(X_scaled)
+    if max_steps is not None:
+        to_step = min(to_step, last_step + max_steps)
+    summary['to_step'] = to_step
     
-    anomalies = df[df['is_anomaly'] == -1].copy()
+    print(f"[INFO] Loading transactions for steps {last_step + 1}-{to_step}...")
+    
+    # Same cascade (if trained with one) and calibration as batch scoring,
+    # chunked when the window exceeds the Python memory budget
+    scored = score_transactions(conn, artifacts, f"step > {int(last_step)} AND step <= {int(to_step)}")
+    n_rows = scored['rows']
+    print(f"[INFO] Scored {n_rows:,} transactions")
+    
+    anomalies = scored['anomalies'].rename(columns={'nameOrig': 'client_id'})
     anomalies['alert_type'] = 'ML_Anomaly'
     anomalies['risk_score'] = 85
-    anomalies['detection_date'] = datetime.now().strftime('%Y-%m-%d')
+    anomalies['detection_date'] = started_at.strftime('%Y-%m-%d')
+    anomalies['run_id'] = run_id
+    anomalies['model_version'] = model_version
     
-    if not anomalies.empty:
-        anomalies_to_save = anomalies[['client_id', 'anomaly_score', 'alert_type', 'risk_score', 'detection_date']]
+    # Drift histograms accumulated over the same batch
+    drift_results = evaluate(drift_reference, scored['drift'])
+    
+    # All writes of this run commit together (safe to re-run after a crash)
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        # Defensive: drop rows of a previous attempt over the same steps
+        conn.execute("DELETE FROM ml_alerts WHERE step > ? AND step <= ?", [last_step, to_step])
         
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS ml_alerts (
-                client_id VARCHAR,
-                anomaly_score DOUBLE,
-                alert_type VARCHAR,
-                risk_score INTEGER,
-                detection_date VARCHAR
-            )
-        """)
+        if not anomalies.empty:
+            anomalies_to_save = anomalies[['client_id', 'anomaly_score', 'alert_type', 'risk_score',
+                                           'detection_date', 'run_id', 'row_id', 'step', 'amount',
+                                           'model_version']]
+            conn.execute("""
+                INSERT INTO ml_alerts (client_id, anomaly_score, alert_type, risk_score, detection_date,
+                                       run_id, row_id, step, amount, model_version)
+                SELECT * FROM anomalies_to_save
+            """)
+        
+        # Attributions for flagged rows; rows already explained for this model are cached
+        explain_anomalies(conn, model, scaler, feature_cols, scored['X_anomalies'],
+                          anomalies['row_id'], model_version)
         
-        # In production, you would typically APPEND (not DELETE) to maintain history
-        # For demo purposes, we replace to keep the database small
-        conn.execute("DELETE FROM ml_alerts WHERE alert_type = 'ML_Anomaly'")
-        conn.execute("INSERT INTO ml_alerts SELECT * FROM anomalies_to_save")
+        retrain_due = persist_drift_metrics(conn, 'daily_scoring', model_version, n_rows, drift_results)
+        
+        conn.execute("""
+            INSERT INTO ml_scoring_runs VALUES (?, ?, CURRENT_TIMESTAMP, ?, ?, ?, ?, ?)
+        """, [run_id, started_at, last_step + 1, to_step, n_rows, len(anomalies), model_version])
         
-        print(f"[SUCCESS] Anomalies detected: {len(anomalies)} / {len(df)}")
-        print(f"          Alert rate: {(len(anomalies)/len(df)*100):.2f}%")
+        set_watermark(conn, WATERMARK_JOB, to_step, n_rows)
+        refresh_ml_stats(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        if own_conn:
+            conn.close()
+        raise
+    
+    summary['rows_scored'] = n_rows
+    summary['anomalies'] = len(anomalies)
+    
+    if not anomalies.empty:
+        print(f"[SUCCESS] Anomalies detected: {len(anomalies)} / {n_rows}")
+        print(f"          Alert rate: {(len(anomalies)/n_rows*100):.2f}%")
         
         print("\n[INFO] Top 5 Most Suspicious Transactions:")
-        top_anomalies = anomalies.nsmallest(5, 'anomaly_score')[['client_id', 'amount', 'anomaly_score', 'risk_score']]
+        top_anomalies = anomalies.nlargest(5, 'anomaly_score')[['client_id', 'step', 'amount', 'anomaly_score', 'risk_score']]
         print(top_anomalies)
         
         # PRODUCTION ACTION (examples):
@@ -126,10 +222,16 @@ def score_new_transactions():
         
     else:
         print("[INFO] No anomalies detected in this batch.")
-        print("      This could indicate: clean transaction period or model needs retraining.")
+        if retrain_due:
+            print("      Input distributions have drifted (see drift_metrics): model needs retraining.")
+        else:
+            print("      Input distributions match training (see drift_metrics): clean transaction period.")
     
-    conn.close()
+    if own_conn:
+        conn.close()
+    print(f"[INFO] Run {run_id}: steps {last_step + 1}-{to_step}, watermark advanced to {to_step}")
     print(f"[COMPLETED] Scoring job finished at {datetime.now().strftime('%H:%M:%S')}")
+    return summary
 
 if __name__ == "__main__":
     """
@@ -150,5 +252,11 @@ if __name__ == "__main__":
     
     4. AWS Lambda (Serverless):
        Triggered daily by EventBridge schedule
+    
+    Options:
+       --max-steps N   Consume at most N steps in this run
     """
-    score_new_transactions()
+    max_steps = None
+    if '--max-steps' in sys.argv:
+        max_steps = int(sys.argv[sys.argv.index('--max-steps') + 1])
+    score_new_transactions(max_steps=max_steps)
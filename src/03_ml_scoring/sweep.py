@@ -0,0 +1,171 @@
+"""
+Isolation Forest Hyperparameter Sweep
+Trains many model configurations in parallel on one shared training sample
+
+The training sample and a fixed evaluation slice are materialized once as NumPy
+arrays. joblib memory-maps them into the worker processes, so every configuration
+reuses the same data without re-querying DuckDB or copying it per worker.
+
+For each configuration the harness reports training time, scoring throughput on
+the evaluation slice, pickled model size and precision/recall against isFraud,
+and recommends the fastest-scoring model that meets the recall target.
+
+Usage:
+    python src/03_ml_scoring/sweep.py
+    python src/03_ml_scoring/sweep.py --min-recall 0.2 --eval-rows 1000000 --jobs 8
+    python src/03_ml_scoring/sweep.py --contamination 0.002 0.005 --n-estimators 50 100
+"""
+
+import os
+import sys
+import time
+import pickle
+import argparse
+import itertools
+from datetime import datetime
+
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from db import connect
+from features import FEATURES, TRAINING_SAMPLE_MODULO, feature_query, training_query
+from anomaly_detection import MODEL_PARAMS
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DB_FILE = os.path.join(BASE_DIR, "data", "fraud_data.duckdb")
+
+DEFAULT_GRID = {
+    'contamination': [0.002, 0.005, 0.01],
+    'n_estimators': [50, 100, 200],
+    'max_samples': [256, 0.1, 0.8],
+}
+
+
+def load_sweep_data(conn, eval_rows):
+    """
+    Materialize the scaled training sample and a fixed, disjoint evaluation slice
+    """
+    X_train = conn.execute(training_query()).fetchdf()[FEATURES].fillna(0).to_numpy()
+
+    # Evaluation slice: rows the training sample never contains (rowid % 10 = 5)
+    eval_sql = feature_query(
+        f"rowid % {TRAINING_SAMPLE_MODULO} = {TRAINING_SAMPLE_MODULO // 2}", extra_columns=['isFraud']
+    ) + f" ORDER BY row_id LIMIT {int(eval_rows)}"
+    df_eval = conn.execute(eval_sql).fetchdf()
+
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(X_train)
+    X_eval = scaler.transform(df_eval[FEATURES].fillna(0).to_numpy())
+    y_eval = df_eval['isFraud'].fillna(0).to_numpy().astype(bool)
+
+    return X_train, X_eval, y_eval
+
+
+def evaluate_config(params, X_train, X_eval, y_eval):
+    """
+    Train one configuration and measure cost and detection quality
+    """
+    model_params = dict(MODEL_PARAMS, **params, n_jobs=1)
+
+    start = time.perf_counter()
+    model = IsolationForest(**model_params).fit(X_train)
+    train_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    flagged = model.decision_function(X_eval) < 0
+    score_seconds = time.perf_counter() - start
+
+    true_positives = int((flagged & y_eval).sum())
+    precision = true_positives / flagged.sum() if flagged.any() else 0.0
+    recall = true_positives / y_eval.sum() if y_eval.any() else 0.0
+
+    return dict(
+        params,
+        train_seconds=train_seconds,
+        rows_per_sec=len(X_eval) / score_seconds,
+        model_kb=len(pickle.dumps(model)) / 1024,
+        flagged=int(flagged.sum()),
+        precision=precision,
+        recall=recall,
+    )
+
+
+def run_sweep(grid=None, eval_rows=500000, n_jobs=-1, min_recall=None):
+    """
+    Evaluate every grid combination in parallel and persist the results to ml_sweep_results
+    """
+    grid = grid or DEFAULT_GRID
+    configs = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    sweep_id = datetime.now().strftime('%Y%m%d%H%M%S')
+
+    conn = connect(DB_FILE)
+
+    print("[INFO] Materializing training sample and evaluation slice...")
+    X_train, X_eval, y_eval = load_sweep_data(conn, eval_rows)
+    print(f"[INFO] Training sample: {len(X_train):,} rows | Evaluation slice: {len(X_eval):,} rows "
+          f"({int(y_eval.sum()):,} fraud)")
+
+    print(f"[INFO] Training {len(configs)} configurations in parallel...")
+    start = time.perf_counter()
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(evaluate_config)(params, X_train, X_eval, y_eval) for params in configs
+    )
+    print(f"[INFO] Sweep finished in {time.perf_counter() - start:.1f}s")
+
+    # max_samples mixes counts and fractions: keep it as text
+    df = pd.DataFrame([dict(r, max_samples=str(r['max_samples'])) for r in results])
+    df.insert(0, 'sweep_id', sweep_id)
+
+    conn.execute("CREATE TABLE IF NOT EXISTS ml_sweep_results AS SELECT * FROM df WHERE false")
+    conn.execute("INSERT INTO ml_sweep_results BY NAME SELECT * FROM df")
+    conn.close()
+
+    print()
+    print(df.drop(columns='sweep_id').sort_values('rows_per_sec', ascending=False).to_string(
+        index=False, float_format=lambda v: f"{v:,.4f}" if abs(v) < 10 else f"{v:,.0f}"))
+    print(f"\n[INFO] Results saved to ml_sweep_results (sweep_id {sweep_id})")
+
+    eligible = df if min_recall is None else df[df['recall'] >= min_recall]
+    if eligible.empty:
+        print(f"[WARNING] No configuration reaches recall >= {min_recall}")
+        return df, None
+
+    best = eligible.sort_values(['rows_per_sec', 'train_seconds'], ascending=[False, True]).iloc[0]
+    target = 'any recall' if min_recall is None else f"recall >= {min_recall}"
+    print(f"[SUCCESS] Fastest model with {target}: "
+          f"contamination={best['contamination']}, n_estimators={best['n_estimators']}, "
+          f"max_samples={best['max_samples']} "
+          f"({best['rows_per_sec']:,.0f} rows/sec, recall {best['recall']:.3f}, "
+          f"precision {best['precision']:.3f})")
+    return df, best
+
+
+def _max_samples(value):
+    return float(value) if '.' in value else int(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel Isolation Forest hyperparameter sweep")
+    parser.add_argument('--contamination', type=float, nargs='+', default=DEFAULT_GRID['contamination'])
+    parser.add_argument('--n-estimators', type=int, nargs='+', default=DEFAULT_GRID['n_estimators'])
+    parser.add_argument('--max-samples', type=_max_samples, nargs='+', default=DEFAULT_GRID['max_samples'])
+    parser.add_argument('--eval-rows', type=int, default=500000)
+    parser.add_argument('--jobs', type=int, default=-1, help="Parallel workers (default: all cores)")
+    parser.add_argument('--min-recall', type=float, default=None)
+    args = parser.parse_args()
+
+    run_sweep(
+        grid={
+            'contamination': args.contamination,
+            'n_estimators': args.n_estimators,
+            'max_samples': args.max_samples,
+        },
+        eval_rows=args.eval_rows,
+        n_jobs=args.jobs,
+        min_recall=args.min_recall,
+    )
@@ -0,0 +1,43 @@
+"""
+Processing Watermarks
+Tracks the last transaction step each incremental job has consumed
+"""
+
+
+def ensure_watermark_table(conn):
+    """
+    Create the watermark table if it does not exist yet
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_watermarks (
+            job_name VARCHAR PRIMARY KEY,
+            last_step INTEGER,
+            rows_processed BIGINT,
+            updated_at TIMESTAMP
+        )
+    """)
+
+
+def get_watermark(conn, job_name):
+    """
+    Return the last step processed by a job (0 if it never ran)
+    """
+    ensure_watermark_table(conn)
+    row = conn.execute(
+        "SELECT last_step FROM pipeline_watermarks WHERE job_name = ?", [job_name]
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def set_watermark(conn, job_name, last_step, rows_processed=0):
+    """
+    Advance a job's watermark; rows_processed accumulates across runs
+    """
+    ensure_watermark_table(conn)
+    conn.execute("""
+        INSERT INTO pipeline_watermarks VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (job_name) DO UPDATE SET
+            last_step = EXCLUDED.last_step,
+            rows_processed = pipeline_watermarks.rows_processed + EXCLUDED.rows_processed,
+            updated_at = EXCLUDED.updated_at
+    """, [job_name, last_step, rows_processed])
@@ -0,0 +1,148 @@
+"""
+Stage Checkpoints
+Content-addressed caching for pipeline stages
+
+Each stage's fingerprint hashes:
+- its input tables (row count and max step)
+- its config (model parameters, flags)
+- the source files that implement it
+- the fingerprints of its upstream stages
+
+A stage is skipped when the last successful run recorded the same fingerprint
+and its output tables/files still exist. --resume instead reuses every stage
+that succeeded in the previous run and restarts from the ones that failed.
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+
+
+def ensure_checkpoint_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_checkpoints (
+            stage VARCHAR PRIMARY KEY,
+            fingerprint VARCHAR,
+            status VARCHAR,
+            run_id VARCHAR,
+            seconds DOUBLE,
+            updated_at TIMESTAMP
+        )
+    """)
+
+
+def _relation_exists(conn, name):
+    return conn.execute("""
+        SELECT (SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ?)
+             + (SELECT COUNT(*) FROM duckdb_views() WHERE view_name = ? AND NOT internal)
+    """, [name, name]).fetchone()[0] > 0
+
+
+def table_fingerprint(conn, table):
+    """
+    Cheap content signature of an input table: row count plus max(step) when it has one
+    """
+    if not _relation_exists(conn, table):
+        return None
+
+    has_step = conn.execute("""
+        SELECT COUNT(*) FROM duckdb_columns()
+        WHERE table_name = ? AND column_name = 'step'
+    """, [table]).fetchone()[0]
+    if has_step:
+        row = conn.execute(f"SELECT COUNT(*), MAX(step) FROM {table}").fetchone()
+    else:
+        row = (conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0], None)
+    return {'rows': row[0], 'max_step': row[1]}
+
+
+def source_hash(paths):
+    """
+    SHA-256 over the stage's source files (the code version)
+    """
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def compute_fingerprints(conn, stages):
+    """
+    Fingerprint every stage, folding in upstream fingerprints so changes propagate downstream
+    """
+    by_name = {s.name: s for s in stages}
+    fingerprints = {}
+
+    def fingerprint(stage):
+        if stage.name in fingerprints:
+            return fingerprints[stage.name]
+        payload = {
+            'inputs': {t: table_fingerprint(conn, t) for t in stage.inputs},
+            'config': stage.config,
+            'code': source_hash(stage.sources),
+            'upstream': {d: fingerprint(by_name[d]) for d in stage.deps if d in by_name},
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+        fingerprints[stage.name] = hashlib.sha256(encoded).hexdigest()
+        return fingerprints[stage.name]
+
+    for stage in stages:
+        fingerprint(stage)
+    return fingerprints
+
+
+class CheckpointStore:
+    """
+    Cache policy handed to run_dag()
+
+    mode: 'cache' (skip unchanged stages), 'resume' (skip stages that succeeded
+    last run) or 'force' (run everything, still record checkpoints)
+    """
+
+    def __init__(self, conn, stages, run_id, mode='cache'):
+        ensure_checkpoint_table(conn)
+        self.conn = conn
+        self.run_id = run_id
+        self.mode = mode
+        self.fingerprints = compute_fingerprints(conn, stages)
+
+        cursor = conn.execute("SELECT stage, fingerprint, status FROM pipeline_checkpoints")
+        self.previous = {row[0]: {'fingerprint': row[1], 'status': row[2]} for row in cursor.fetchall()}
+
+    def _outputs_exist(self, stage):
+        return (all(_relation_exists(self.conn, t) for t in stage.outputs)
+                and all(os.path.exists(p) for p in stage.artifacts))
+
+    def is_fresh(self, stage, upstream_ran):
+        """
+        True when the stage can be skipped. Stages without outputs (reports) always run.
+        """
+        if self.mode == 'force' or upstream_ran:
+            return False
+        if not stage.outputs and not stage.artifacts:
+            return False
+
+        previous = self.previous.get(stage.name)
+        if not previous or previous['status'] != 'success' or not self._outputs_exist(stage):
+            return False
+        if self.mode == 'resume':
+            return True
+        return previous['fingerprint'] == self.fingerprints[stage.name]
+
+    def describe(self, stage):
+        return self.fingerprints[stage.name][:12]
+
+    def record(self, stage, result):
+        self.conn.execute("""
+            INSERT INTO pipeline_checkpoints VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (stage) DO UPDATE SET
+                fingerprint = EXCLUDED.fingerprint,
+                status = EXCLUDED.status,
+                run_id = EXCLUDED.run_id,
+                seconds = EXCLUDED.seconds,
+                updated_at = EXCLUDED.updated_at
+        """, [stage.name, self.fingerprints[stage.name], result['status'], self.run_id,
+              result['seconds'], datetime.now()])
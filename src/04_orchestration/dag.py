@@ -0,0 +1,186 @@
+"""
+Pipeline DAG Runner
+Runs pipeline stages in-process as a dependency graph
+
+- Stages are plain functions taking a DuckDB connection
+- Independent stages run concurrently on a thread pool; each gets its own cursor
+  of the shared connection (same database instance, no file lock contention)
+- Output streams live, each line prefixed with the stage that printed it
+- A failed stage marks its dependents as skipped; unrelated branches keep running
+- With a checkpoint cache (checkpoints.py), unchanged stages are reused instead of rerun
+- Each stage is measured with telemetry.py (wall/CPU time, peak RSS, rows, throughput)
+"""
+
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from telemetry import begin_stage, end_stage, not_run, print_stage_table
+
+
+class Stage:
+    """
+    A named pipeline step: func(conn) runs once all deps succeeded. It may return
+    a dict with rows_in / rows_out (and extra numbers) for telemetry.
+
+    inputs/outputs are table names, artifacts are files it writes, config and
+    sources (implementation files) feed the checkpoint fingerprint.
+    """
+
+    def __init__(self, name, func, deps=(), description='', inputs=(), outputs=(),
+                 artifacts=(), config=None, sources=()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.description = description
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.artifacts = tuple(artifacts)
+        self.config = config or {}
+        self.sources = tuple(sources)
+
+
+class _StageOutput:
+    """
+    stdout proxy that prefixes each line with the stage running on the current thread.
+    Every thread is line-buffered (print writes the text and its newline
+    separately), so only complete lines reach the stream, one writer at a time.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def set_stage(self, name):
+        self.local.stage = name
+        self.local.buffer = ''
+
+    def write(self, text):
+        name = getattr(self.local, 'stage', None)
+        prefix = f"[{name}] " if name is not None else ''
+
+        *lines, self.local.buffer = (getattr(self.local, 'buffer', '') + text).split('\n')
+        if lines:
+            with self.lock:
+                for line in lines:
+                    self.stream.write(f"{prefix}{line}\n")
+                self.stream.flush()
+        return len(text)
+
+    def end_stage(self):
+        if getattr(self.local, 'buffer', ''):
+            self.write('\n')
+        self.local.stage = None
+
+    def flush(self):
+        # An unterminated line outside any stage (e.g. print(..., end='', flush=True)) goes out as is
+        if getattr(self.local, 'stage', None) is None and getattr(self.local, 'buffer', ''):
+            with self.lock:
+                self.stream.write(self.local.buffer)
+            self.local.buffer = ''
+        self.stream.flush()
+
+    def __getattr__(self, attr):
+        return getattr(self.stream, attr)
+
+
+def select_stages(stages, only=None, skip=None):
+    """
+    Apply --only / --skip selection. Unknown names raise ValueError.
+    """
+    names = [s.name for s in stages]
+    for name in (only or []) + (skip or []):
+        if name not in names:
+            raise ValueError(f"Unknown stage '{name}'. Available: {', '.join(names)}")
+
+    selected = [s for s in stages if not only or s.name in only]
+    return [s for s in selected if not skip or s.name not in skip]
+
+
+def run_dag(stages, conn, max_workers=None, cache=None):
+    """
+    Execute stages respecting dependencies, running ready stages concurrently.
+
+    Dependencies on stages outside the selection are treated as satisfied
+    (their outputs are assumed to exist from a previous run).
+
+    cache: optional CheckpointStore; fresh stages get status 'cached' and every
+    executed stage is recorded. A stage whose upstream ran in this run always runs.
+
+    Returns {stage_name: telemetry metrics dict ('status', 'seconds', 'error',
+    'cpu_seconds', 'peak_rss_mb', 'rows_in', ...)} in completion order.
+    """
+    selected = {s.name for s in stages}
+    pending = {s.name: s for s in stages}
+    stages_by_name = dict(pending)
+    results = {}
+    running = {}
+
+    output = _StageOutput(sys.stdout)
+    sys.stdout = output
+
+    def execute(stage):
+        output.set_stage(stage.name)
+        cursor = conn.cursor()
+        metrics = begin_stage(stage.name)
+        try:
+            return end_stage(metrics, 'success', output=stage.func(cursor))
+        except Exception as e:
+            print(f"[ERROR] {type(e).__name__}: {e}")
+            return end_stage(metrics, 'failed', error=str(e))
+        finally:
+            cursor.close()
+            output.end_stage()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers or max(len(stages), 1)) as pool:
+            while pending or running:
+                resolved = False
+                for name, stage in list(pending.items()):
+                    deps = [d for d in stage.deps if d in selected]
+                    statuses = [results.get(d, {}).get('status') for d in deps]
+                    if any(s in ('failed', 'skipped') for s in statuses):
+                        del pending[name]
+                        results[name] = not_run(name, 'skipped', 'upstream stage failed')
+                        print(f"[WARNING] Skipping {name}: upstream stage failed")
+                        resolved = True
+                        if cache:
+                            cache.record(stage, results[name])
+                    elif all(s in ('success', 'cached') for s in statuses):
+                        del pending[name]
+                        if cache and cache.is_fresh(stage, upstream_ran='success' in statuses):
+                            results[name] = not_run(name, 'cached')
+                            print(f"[INFO] Stage {name} up to date "
+                                  f"(fingerprint {cache.describe(stage)}), skipping")
+                            resolved = True
+                            continue
+                        print(f"[INFO] Starting stage: {name}")
+                        running[pool.submit(execute, stage)] = name
+
+                if not running:
+                    if resolved:
+                        continue  # cached/skipped stages may have unblocked others
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    if cache:
+                        cache.record(stages_by_name[name], results[name])
+                    status = results[name]['status']
+                    label = "[SUCCESS]" if status == 'success' else "[ERROR]"
+                    print(f"{label} Stage {name} {status} in {results[name]['seconds']:.1f}s")
+    finally:
+        output.flush()
+        sys.stdout = output.stream
+
+    return results
+
+
+def print_timings(results):
+    """
+    Per-stage status, timing, memory and throughput table
+    """
+    print_stage_table(results.values())
@@ -1,136 +1,223 @@
-
-
 """
 Master Pipeline Orchestrator
 Executes the complete AML detection workflow
+
+Stages run in-process through the DAG runner (dag.py) on one shared DuckDB
+connection. The rules engine, baselines and anomaly detection are independent
+and run concurrently; the summary and the snapshot publish wait for all of them.
+Readers (API, dashboard) only see published snapshots (src/common/snapshots.py).
+
+Stages whose inputs, config and code are unchanged since their last successful
+run are skipped (see checkpoints.py). Per-stage telemetry is written to
+pipeline_runs and data/telemetry/ (see telemetry.py).
+
+Usage:
+    python src/04_orchestration/master_pipeline.py
+    python src/04_orchestration/master_pipeline.py --only rules
+    python src/04_orchestration/master_pipeline.py --skip baselines --incremental
+    python src/04_orchestration/master_pipeline.py --workers 1        # sequential
+    python src/04_orchestration/master_pipeline.py --resume           # continue after a failure
+    python src/04_orchestration/master_pipeline.py --force            # ignore checkpoints
 """
 
 import sys
 import os
+import argparse
+import glob
+import importlib.util
 from datetime import datetime
 
 # Add parent directory to path for imports
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(os.path.dirname(current_dir))
 sys.path.insert(0, project_root)
+sys.path.insert(0, current_dir)
+sys.path.insert(0, os.path.join(project_root, 'src', 'common'))
 
-print("\n" + "="*60)
-print("AML TRANSACTION MONITORING ENGINE")
-print("="*60)
-print(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-print("="*60 + "\n")
-
-# ============================================
-# PHASE 1: RULES ENGINE
-# ============================================
-print("PHASE 1: Executing Rules Engine...")
-print("-" * 60)
-
-try:
-    # Import rules executor
-    rules_executor_path = os.path.join(project_root, 'src', '02_rules_engine', 'executor.py')
-    
-    # Execute using subprocess to avoid import conflicts
-    import subprocess
-    result = subprocess.run(
-        [sys.executable, rules_executor_path],
-        capture_output=True,
-        text=True,
-        cwd=project_root
-    )
-    
-    if result.returncode == 0:
-        print("[SUCCESS] Rules Engine completed successfully")
-        if result.stdout:
-            print(result.stdout)
-    else:
-        print("[ERROR] Rules Engine failed")
-        if result.stderr:
-            print(result.stderr)
-        sys.exit(1)
-        
-except Exception as e:
-    print(f"[ERROR] Error executing Rules Engine: {str(e)}")
-    sys.exit(1)
-
-print()
-
-# ============================================
-# PHASE 2: ML SCORING
-# ============================================
-print("PHASE 2: Executing ML Scoring...")
-print("-" * 60)
-
-try:
-    # Import ML executor
-    ml_executor_path = os.path.join(project_root, 'src', '03_ml_scoring', 'executor.py')
-    
-    # Execute using subprocess
-    result = subprocess.run(
-        [sys.executable, ml_executor_path],
-        capture_output=True,
-        text=True,
-        cwd=project_root
-    )
-    
-    if result.returncode == 0:
-        print("[SUCCESS] ML Scoring completed successfully")
-        if result.stdout:
-            print(result.stdout)
+from dag import Stage, select_stages, run_dag, print_timings
+from checkpoints import CheckpointStore
+from telemetry import new_run, record_run
+from snapshots import publish_snapshot, POINTER_FILE
+from db import connect, describe_profile, resource_profile
+from system_stats import ensure_stats_tables, read_system_stats
+
+DB_FILE = os.path.join(project_root, 'data', 'fraud_data.duckdb')
+
+
+def load_executor(module_name, folder):
+    """
+    Import an executor by path (both are named executor.py, so they can't share a module name)
+    """
+    path = os.path.join(project_root, 'src', folder, 'executor.py')
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def print_pipeline_summary(conn):
+    """
+    PHASE 3: overall alert statistics
+    """
+    print("="*60)
+    print("PIPELINE SUMMARY")
+    print("="*60)
+
+    try:
+        # Counters maintained by the stages (system_stats)
+        stats = read_system_stats(conn)
+
+        total_tx = stats['total_transactions']
+        rule_alerts = stats['rule_alerts']
+        ml_alerts = stats['ml_anomalies']
+        alert_rate = ((rule_alerts + ml_alerts) / total_tx * 100) if total_tx else 0
+
+        print(f"Total Transactions: {total_tx:,}")
+        print(f"Rule-based Alerts: {rule_alerts}")
+        print(f"ML Anomalies: {ml_alerts}")
+        print(f"Alert Rate: {alert_rate:.4f}%")
+
+    except Exception as e:
+        print(f"[WARNING] Could not generate summary: {str(e)}")
+
+    print("="*60)
+
+
+def _sources(folder, *names):
+    return [os.path.join(project_root, 'src', folder, name) for name in names]
+
+
+def build_stages(incremental=False, cascade_recall=None):
+    """
+    Pipeline graph: rules | baselines | profiles | anomaly_detection -> summary, publish
+    """
+    rules_executor = load_executor('rules_executor', '02_rules_engine')
+    ml_executor = load_executor('ml_executor', '03_ml_scoring')
+    from anomaly_detection import MODEL_PARAMS  # importable once ml_executor set sys.path
+
+    def summary(conn):
+        ml_executor.print_summary(conn)
+        print_pipeline_summary(conn)
+
+    return [
+        Stage('rules', rules_executor.run_rules_engine,
+              description="SQL rules engine (4 typologies)",
+              inputs=['transactions'], outputs=['rule_alerts'],
+              sources=glob.glob(os.path.join(project_root, 'src', '02_rules_engine', '*.py'))),
+        Stage('baselines', lambda conn: ml_executor.run_baselines(conn, incremental=incremental),
+              description="Customer baselines",
+              inputs=['transactions'], outputs=['customer_baselines'],
+              config={'incremental': incremental},
+              sources=_sources('03_ml_scoring', 'executor.py', 'baseline.py',
+                               'features.py', 'watermarks.py')),
+        Stage('profiles', lambda conn: ml_executor.run_profiles(conn, incremental=incremental),
+              description="Customer profiles (API/dashboard lookups)",
+              inputs=['transactions'], outputs=['customer_profiles', 'customer_recipients'],
+              config={'incremental': incremental},
+              sources=_sources('03_ml_scoring', 'executor.py', 'profiles.py',
+                               'features.py', 'watermarks.py')),
+        Stage('anomaly_detection',
+              lambda conn: ml_executor.run_anomaly_detection(conn, cascade_recall=cascade_recall),
+              description="Isolation Forest training and scoring",
+              inputs=['transactions'], outputs=['ml_scores', 'ml_explanations'],
+              artifacts=['data/isolation_forest.pkl'],
+              config={'model_params': MODEL_PARAMS, 'cascade_recall': cascade_recall,
+                      'python_budget': resource_profile()['python_budget_bytes']},
+              sources=_sources('03_ml_scoring', 'executor.py', 'anomaly_detection.py',
+                               'features.py', 'prefilter.py', 'calibration.py',
+                               'drift.py', 'explain.py', 'batch_scoring.py')),
+        Stage('summary', summary, deps=['rules', 'baselines', 'anomaly_detection'],
+              description="Pipeline summary report"),
+        Stage('publish', lambda conn: {'snapshot': publish_snapshot(conn)},
+              deps=['rules', 'baselines', 'profiles', 'anomaly_detection'],
+              description="Publish a read-only snapshot for API/dashboard",
+              inputs=['transactions'], artifacts=[POINTER_FILE],
+              sources=_sources('common', 'snapshots.py')),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AML detection pipeline")
+    parser.add_argument('--only', type=lambda v: v.split(','), default=None,
+                        help="Comma-separated stages to run")
+    parser.add_argument('--skip', type=lambda v: v.split(','), default=None,
+                        help="Comma-separated stages to skip")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Max concurrent stages (1 = sequential)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Incremental customer baselines")
+    parser.add_argument('--cascade-recall', type=float, default=None,
+                        help="Enable the HBOS prefilter cascade at this recall")
+    parser.add_argument('--resume', action='store_true',
+                        help="Reuse stages that succeeded last run, restart from the failed ones")
+    parser.add_argument('--force', action='store_true',
+                        help="Run every selected stage, ignoring checkpoints")
+    parser.add_argument('--list', action='store_true', help="List stages and exit")
+    args = parser.parse_args(argv)
+
+    if args.resume and args.force:
+        print("[ERROR] --resume and --force are mutually exclusive")
+        return 2
+
+    # Stage modules resolve data/ relative to the project root
+    os.chdir(project_root)
+
+    stages = build_stages(incremental=args.incremental, cascade_recall=args.cascade_recall)
+    if args.list:
+        for stage in stages:
+            deps = f" (after: {', '.join(stage.deps)})" if stage.deps else ""
+            print(f"  {stage.name:<20}{stage.description}{deps}")
+        return 0
+
+    try:
+        stages = select_stages(stages, only=args.only, skip=args.skip)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return 2
+
+    print("\n" + "="*60)
+    print("AML TRANSACTION MONITORING ENGINE")
+    print("="*60)
+    print(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Stages: {', '.join(s.name for s in stages)}")
+    print(f"Resources: {describe_profile()}")
+    print("="*60 + "\n")
+
+    run = new_run('master_pipeline')
+    mode = 'resume' if args.resume else 'force' if args.force else 'cache'
+
+    conn = connect(DB_FILE)
+    try:
+        # Summary tables exist before stages write to them concurrently
+        ensure_stats_tables(conn)
+        cache = CheckpointStore(conn, stages, run['run_id'], mode=mode)
+        results = run_dag(stages, conn, max_workers=args.workers, cache=cache)
+        run['stages'] = list(results.values())
+        telemetry_file = record_run(run, conn)
+    finally:
+        conn.close()
+
+    failed = [name for name, r in results.items() if r['status'] in ('failed', 'skipped')]
+
+    print()
+    print("="*60)
+    print_timings(results)
+    print("="*60)
+    print(f"Telemetry: {telemetry_file}")
+    print(f"Finished: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    if failed:
+        print(f"[ERROR] Pipeline finished with failed/skipped stages: {', '.join(failed)}")
     else:
-        print("[ERROR] ML Scoring failed")
-        if result.stderr:
-            print(result.stderr)
-        sys.exit(1)
-        
-except Exception as e:
-    print(f"[ERROR] Error executing ML Scoring: {str(e)}")
-    sys.exit(1)
-
-print()
-
-# ============================================
-# PHASE 3: SUMMARY
-# ============================================
-print("="*60)
-print("PIPELINE SUMMARY")
-print("="*60)
-
-try:
-    import duckdb
-    
-    conn = duckdb.connect('data/fraud_data.duckdb', read_only=True)
-    
-    # Get statistics
-    stats = conn.execute("""
-        SELECT 
-            COUNT(*) as total_transactions,
-            (SELECT COUNT(*) FROM rule_alerts) as rule_alerts,
-            (SELECT COUNT(*) FROM ml_scores WHERE anomaly_score >= 0.5) as ml_alerts
-        FROM transactions
-    """).fetchdf()
-    
-    total_tx = stats['total_transactions'].iloc[0]
-    rule_alerts = stats['rule_alerts'].iloc[0]
-    ml_alerts = stats['ml_alerts'].iloc[0]
-    alert_rate = ((rule_alerts + ml_alerts) / total_tx * 100)
-    
-    print(f"Total Transactions: {total_tx:,}")
-    print(f"Rule-based Alerts: {rule_alerts}")
-    print(f"ML Anomalies: {ml_alerts}")
-    print(f"Alert Rate: {alert_rate:.4f}%")
-    
-    conn.close()
-    
-except Exception as e:
-    print(f"[WARNING] Could not generate summary: {str(e)}")
-
-print("="*60)
-print(f"Finished: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-print("[SUCCESS] Pipeline completed successfully!")
-print("="*60 + "\n")
-
-print("NEXT STEPS:")
-print("  - Launch API: python src/05_api/app.py")
-print("  - Launch Dashboard: streamlit run src/06_dashboard/app.py")
-print()
+        print("[SUCCESS] Pipeline completed successfully!")
+    print("="*60 + "\n")
+
+    print("NEXT STEPS:")
+    print("  - Launch API: python src/05_api/app.py")
+    print("  - Launch Dashboard: streamlit run src/06_dashboard/app.py")
+    print()
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
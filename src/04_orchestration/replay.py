@@ -0,0 +1,334 @@
+"""
+Replay Simulator
+Streams historical transactions by step as live traffic for end-to-end latency tests
+
+PaySim's step is an hourly clock. The replay reads transactions in step order
+(from the published snapshot, or a Parquet layer) and emits them into an
+in-process asyncio queue at a speed-up factor: with --speedup 3600 one step
+(one hour) is replayed per second. Each step is split into --chunks-per-step
+events spread evenly over the step, so arrivals are smooth rather than bursty.
+
+A detector consumes the queue (in a worker thread, so emission stays on
+schedule) and every chunk is timestamped on emission and when its alerts are
+available. Detectors:
+- ml:    in-process scoring per chunk with the trained model (cascade and
+         calibration as in batch scoring) plus Welford customer state updates
+- rules: the SQL rules engine per closed step on an in-memory DuckDB holding
+         the replayed transactions (events wait for their step to close)
+- none:  drain only, measures the queue itself
+
+The queue is bounded (--queue-size): when the detector falls behind, emission
+blocks and the backpressure shows up as latency. The report gives sustained
+throughput and ingest-to-alert latency percentiles per transaction; the run is
+recorded in pipeline_runs / data/telemetry like the other entrypoints.
+
+Usage:
+    python src/04_orchestration/replay.py --speedup 3600 --steps 48
+    python src/04_orchestration/replay.py --detector rules --from-step 100 --steps 24
+    python src/04_orchestration/replay.py --parquet "data/shards/*/*/*.parquet" --speedup 36000
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import contextlib
+import io
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.insert(0, current_dir)
+sys.path.insert(0, os.path.join(project_root, 'src', 'common'))
+
+from master_pipeline import load_executor
+from snapshots import current_snapshot
+from db import connect
+from telemetry import new_run, begin_stage, end_stage, record_run, print_stage_table, table_count
+
+STEP_SECONDS = 3600  # one PaySim step = one hour
+
+
+# ============================================
+# SOURCE
+# ============================================
+
+def open_source(parquet=None):
+    """
+    Read-only connection and relation name holding the transactions to replay
+    """
+    if parquet:
+        conn = connect()
+        conn.execute(f"CREATE VIEW replay_source AS SELECT * FROM read_parquet('{parquet}')")
+        return conn, 'replay_source'
+    return connect(current_snapshot(), read_only=True), 'transactions'
+
+
+def fetch_step(conn, relation, step):
+    return conn.execute(f"SELECT * FROM {relation} WHERE step = ? ORDER BY nameOrig", [step]).df()
+
+
+async def produce(queue, conn, relation, steps, speedup, chunks_per_step):
+    """
+    Emit each step's transactions on the replay clock. Returns the emission lag
+    (seconds behind schedule, worst chunk) caused by backpressure or slow reads.
+    """
+    step_seconds = STEP_SECONDS / speedup
+    start = time.perf_counter()
+    next_df = asyncio.create_task(asyncio.to_thread(fetch_step, conn, relation, steps[0]))
+    max_lag = 0.0
+
+    for i, step in enumerate(steps):
+        df = await next_df
+        if i + 1 < len(steps):
+            next_df = asyncio.create_task(asyncio.to_thread(fetch_step, conn, relation, steps[i + 1]))
+
+        bounds = np.linspace(0, len(df), chunks_per_step + 1).astype(int)
+        for k in range(chunks_per_step):
+            chunk = df.iloc[bounds[k]:bounds[k + 1]]
+            due = start + (i + k / chunks_per_step) * step_seconds
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            emitted_at = time.perf_counter()
+            max_lag = max(max_lag, emitted_at - due)
+            await queue.put((step, emitted_at, chunk))
+
+    await queue.put(None)
+    return max_lag
+
+
+# ============================================
+# DETECTORS
+# ============================================
+
+def ml_detector():
+    """
+    In-process scorer: model decision per chunk, customer statistics per transaction.
+    Alerts are the flagged rows, as in scoring_only (their calibrated scores are
+    not needed for the count, so they are not computed).
+    """
+    load_executor('ml_executor', '03_ml_scoring')  # puts 03_ml_scoring on sys.path
+    import scoring_only
+    from baseline import new_customer_state, update_customer_state
+    from features import TYPE_CODES
+    from prefilter import cascade_decision
+
+    artifacts = scoring_only.load_artifacts()
+    if artifacts is None:
+        raise RuntimeError("no trained model, run the pipeline first")
+    states = {}
+
+    def detect(step, chunk):
+        if chunk.empty:
+            return 0
+        chunk = chunk[chunk['amount'] > 0]
+        features = chunk.assign(type_encoded=chunk['type'].map(TYPE_CODES).fillna(0))
+        X = features[artifacts['features']].fillna(0).to_numpy()
+        decision_scores, _ = cascade_decision(artifacts['model'], artifacts['scaler'], X,
+                                              artifacts['prefilter'])
+
+        for customer, amount, balance, tx_type in zip(chunk['nameOrig'], chunk['amount'],
+                                                      chunk['oldbalanceOrg'], chunk['type']):
+            state = states.get(customer) or states.setdefault(customer, new_customer_state(customer))
+            update_customer_state(state, amount, balance, tx_type, step)
+
+        return int((decision_scores < 0).sum())
+
+    return detect, None
+
+
+def rules_detector(schema):
+    """
+    SQL rules engine per closed step on an in-memory copy of the replayed stream.
+    schema: [(column, type)] of the source transactions.
+    """
+    rules_executor = load_executor('rules_executor', '02_rules_engine')
+    conn = connect()
+    columns = ", ".join(f'"{name}" {column_type}' for name, column_type in schema)
+    conn.execute(f"CREATE TABLE transactions ({columns})")
+    pending = []
+
+    def close_step(step):
+        for chunk in pending:
+            conn.register('replay_chunk', chunk)
+            conn.execute("INSERT INTO transactions BY NAME SELECT * FROM replay_chunk")
+            conn.unregister('replay_chunk')
+        pending.clear()
+        before = table_count(conn, 'rule_alerts') or 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            failures = rules_executor.run_rules(conn, step - 1, step)
+        if failures:
+            raise RuntimeError(f"{failures} rule(s) failed at step {step}")
+        return conn.execute("SELECT COUNT(*) FROM rule_alerts").fetchone()[0] - before
+
+    def detect(step, chunk):
+        pending.append(chunk)
+        return None  # alerts only once the step closes
+
+    return detect, close_step
+
+
+def null_detector():
+    return (lambda step, chunk: 0), None
+
+
+async def consume(queue, detect, close_step):
+    """
+    Run the detector over the queue. Returns per-chunk (rows, latency seconds)
+    and the number of alerts.
+    """
+    latencies = []   # (rows, seconds) per chunk
+    waiting = []     # (rows, emitted_at) of chunks whose step is still open
+    alerts = 0
+    open_step = None
+
+    async def flush(step):
+        nonlocal alerts
+        alerts += await asyncio.to_thread(close_step, step)
+        done = time.perf_counter()
+        latencies.extend((rows, done - emitted_at) for rows, emitted_at in waiting)
+        waiting.clear()
+
+    while True:
+        item = await queue.get()
+        if item is None:
+            if close_step and open_step is not None:
+                await flush(open_step)
+            return latencies, alerts
+
+        step, emitted_at, chunk = item
+        if close_step and open_step is not None and step != open_step:
+            await flush(open_step)
+        open_step = step
+
+        found = await asyncio.to_thread(detect, step, chunk)
+        if found is None:
+            waiting.append((len(chunk), emitted_at))
+        else:
+            alerts += found
+            latencies.append((len(chunk), time.perf_counter() - emitted_at))
+
+
+# ============================================
+# RUN
+# ============================================
+
+def latency_percentiles(latencies, quantiles=(0.5, 0.95, 0.99)):
+    """
+    Per-transaction latency percentiles (each chunk weighted by its rows), in seconds
+    """
+    rows = np.array([r for r, _ in latencies], dtype=np.int64)
+    seconds = np.array([s for _, s in latencies])
+    if not rows.sum():
+        return {q: None for q in quantiles}
+    per_row = np.repeat(seconds, rows)
+    return {q: float(np.quantile(per_row, q)) for q in quantiles}
+
+
+async def replay(steps, speedup, detector='ml', chunks_per_step=10, queue_size=100, parquet=None):
+    conn, relation = open_source(parquet)
+    try:
+        if detector == 'ml':
+            detect, close_step = ml_detector()
+        elif detector == 'rules':
+            schema = conn.execute(f"DESCRIBE {relation}").fetchall()
+            detect, close_step = rules_detector([row[:2] for row in schema])
+        else:
+            detect, close_step = null_detector()
+
+        queue = asyncio.Queue(maxsize=queue_size)
+        start = time.perf_counter()
+        max_lag, (latencies, alerts) = await asyncio.gather(
+            produce(queue, conn, relation, steps, speedup, chunks_per_step),
+            consume(queue, detect, close_step),
+        )
+        wall = time.perf_counter() - start
+    finally:
+        conn.close()
+
+    rows = sum(r for r, _ in latencies)
+    return {
+        'rows_in': rows,
+        'rows_out': alerts,
+        'steps': len(steps),
+        'speedup': speedup,
+        'offered_rows_per_sec': rows / (len(steps) * STEP_SECONDS / speedup),
+        'sustained_rows_per_sec': rows / wall if wall else None,
+        'max_emission_lag_seconds': max_lag,
+        **{f"latency_p{int(q * 100)}_seconds": v for q, v in latency_percentiles(latencies).items()},
+        'latency_max_seconds': max((s for _, s in latencies), default=None),
+    }
+
+
+def select_steps(parquet=None, from_step=None, n_steps=None):
+    conn, relation = open_source(parquet)
+    try:
+        steps = [row[0] for row in conn.execute(
+            f"SELECT DISTINCT step FROM {relation} WHERE ? IS NULL OR step >= ? ORDER BY step",
+            [from_step, from_step]
+        ).fetchall()]
+    finally:
+        conn.close()
+    return steps[:n_steps] if n_steps else steps
+
+
+def print_replay_report(result):
+    def ms(value):
+        return f"{value * 1000:,.0f} ms" if value is not None else "-"
+
+    print("="*60)
+    print("REPLAY REPORT")
+    print("="*60)
+    print(f"Steps: {result['steps']}  |  Speed-up: {result['speedup']:,.0f}x  |  "
+          f"Transactions: {result['rows_in']:,}  |  Alerts: {result['rows_out']:,}")
+    print(f"Offered load:    {result['offered_rows_per_sec']:,.0f} tx/s")
+    print(f"Sustained:       {result['sustained_rows_per_sec']:,.0f} tx/s")
+    print(f"Latency p50/p95/p99: {ms(result['latency_p50_seconds'])} / "
+          f"{ms(result['latency_p95_seconds'])} / {ms(result['latency_p99_seconds'])}  "
+          f"(max {ms(result['latency_max_seconds'])})")
+    if result['max_emission_lag_seconds'] > STEP_SECONDS / result['speedup']:
+        print(f"[WARNING] Emission fell {result['max_emission_lag_seconds']:.1f}s behind schedule: "
+              f"the detector cannot sustain this speed-up")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay transactions by step as live traffic")
+    parser.add_argument('--speedup', type=float, default=3600.0,
+                        help="Replay clock speed-up (3600 = one step per second)")
+    parser.add_argument('--detector', choices=['ml', 'rules', 'none'], default='ml')
+    parser.add_argument('--from-step', type=int, default=None, help="First step to replay")
+    parser.add_argument('--steps', type=int, default=None, help="Number of steps to replay")
+    parser.add_argument('--chunks-per-step', type=int, default=10,
+                        help="Events each step is split into")
+    parser.add_argument('--queue-size', type=int, default=100, help="Queue bound (backpressure)")
+    parser.add_argument('--parquet', default=None, help="Replay a Parquet glob instead of the database")
+    parser.add_argument('--no-record', action='store_true', help="Don't record the run in pipeline_runs")
+    args = parser.parse_args()
+
+    steps = select_steps(args.parquet, args.from_step, args.steps)
+    if not steps:
+        print("[ERROR] No transactions to replay")
+        sys.exit(1)
+
+    print(f"[INFO] Replaying steps {steps[0]}-{steps[-1]} at {args.speedup:,.0f}x "
+          f"into the '{args.detector}' detector")
+
+    run = new_run('replay')
+    metrics = begin_stage(f"replay_{args.detector}")
+    try:
+        result = asyncio.run(replay(steps, args.speedup, args.detector, args.chunks_per_step,
+                                    args.queue_size, args.parquet))
+        run['stages'].append(end_stage(metrics, output=result))
+    except Exception as e:
+        run['stages'].append(end_stage(metrics, 'failed', error=str(e)))
+        print(f"[ERROR] Replay failed: {e}")
+        sys.exit(1)
+
+    print_replay_report(result)
+    print_stage_table(run['stages'])
+    if not args.no_record:
+        print(f"Telemetry: {record_run(run)}")
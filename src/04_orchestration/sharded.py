@@ -0,0 +1,304 @@
+"""
+Sharded Pipeline Runner
+Runs rules, baselines and scoring per customer shard in a process pool
+
+All rules and per-customer features partition cleanly by nameOrig, so:
+1. PARTITION: transactions (with their original rowid) are exported once to
+   Parquet, hash-partitioned by nameOrig into N shards
+2. SHARDS: each worker process loads its shard into an in-memory DuckDB and
+   runs the unchanged rule, baseline and scoring code on it. Outputs are written
+   to Parquet; drift histograms are returned to the parent
+3. MERGE: the parent appends alerts (renumbered, 50 per rule as in batch mode),
+   rebuilds customer_baselines, ml_scores and ml_explanations from the shard
+   outputs and evaluates drift on the merged histograms, then rebuilds
+   customer_profiles (one SQL aggregate in the parent)
+4. PUBLISH: a read-only snapshot for API/dashboard readers (unless disabled)
+
+The model is trained once, in the parent, on the usual global training sample,
+so scores are identical to the single-process pipeline.
+
+Usage:
+    python src/04_orchestration/sharded.py --workers 4
+    python src/04_orchestration/sharded.py --workers 8 --shards 16 --cascade-recall 0.99
+"""
+
+import io
+import os
+import sys
+import glob
+import shutil
+import pickle
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.insert(0, current_dir)
+sys.path.insert(0, os.path.join(project_root, 'src', '02_rules_engine'))
+sys.path.insert(0, os.path.join(project_root, 'src', '03_ml_scoring'))
+sys.path.insert(0, os.path.join(project_root, 'src', 'common'))
+
+from telemetry import (new_run, begin_stage, end_stage, record_run, print_stage_table,
+                       children_cpu_seconds)
+from snapshots import publish_snapshot
+from db import connect, resource_profile
+from system_stats import ensure_stats_tables, refresh_rule_stats
+
+DB_FILE = os.path.join(project_root, 'data', 'fraud_data.duckdb')
+SHARD_ROOT = os.path.join(project_root, 'data', 'shards')
+MODEL_PATH = os.path.join(project_root, 'data', 'isolation_forest.pkl')
+
+# Alerts kept per rule after merging (each rule inserts at most 50 per run)
+ALERTS_PER_RULE = 50
+
+
+def partition_transactions(conn, shard_dir, n_shards):
+    """
+    Export transactions to Parquet hash-partitioned by customer: shard_dir/shard=K/*.parquet
+    """
+    if os.path.exists(shard_dir):
+        shutil.rmtree(shard_dir)
+    os.makedirs(os.path.dirname(shard_dir), exist_ok=True)
+    conn.execute(f"""
+        COPY (
+            SELECT rowid as row_id, *, hash(nameOrig) % {int(n_shards)} as shard
+            FROM transactions
+        ) TO '{shard_dir}' (FORMAT PARQUET, PARTITION_BY (shard))
+    """)
+
+
+def run_shard(shard, input_dir, output_dir, threads, workers=1):
+    """
+    Worker: rules, baselines and scoring for one shard. The memory limit and
+    Python budget of the resource profile are split between the workers.
+    Returns counts, the drift accumulator and the captured log.
+    """
+    from rules import detect_structuring
+    from velocity_rule import detect_velocity_abuse
+    from round_amounts import detect_round_amounts
+    from beneficiary_pattern import detect_beneficiary_rotation
+    from baseline import create_baselines
+    from batch_scoring import score_transactions
+    from explain import explain_anomalies
+
+    files = glob.glob(os.path.join(input_dir, f'shard={shard}', '*.parquet'))
+    log = io.StringIO()
+    result = {'shard': shard, 'rows': 0, 'anomalies': 0, 'drift': None, 'log': ''}
+
+    with contextlib.redirect_stdout(log):
+        conn = connect(memory_share=workers)
+        conn.execute(f"SET threads TO {int(threads)}")
+        if not files:
+            conn.close()
+            result['log'] = log.getvalue()
+            return result
+
+        conn.execute(f"""
+            CREATE TABLE transactions AS
+            SELECT * EXCLUDE (shard) FROM read_parquet({files!r})
+        """)
+        result['rows'] = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+        # Rules (same order as the rules engine)
+        for detect in (detect_structuring, detect_velocity_abuse,
+                       detect_round_amounts, detect_beneficiary_rotation):
+            detect(conn)
+
+        create_baselines(conn=conn)
+
+        # Scoring with the model trained by the parent
+        with open(MODEL_PATH, 'rb') as f:
+            artifacts = pickle.load(f)
+        scored = score_transactions(conn, artifacts, row_id_column='row_id', memory_share=workers)
+        result['drift'] = scored['drift']
+
+        df_anomalies = scored['anomalies'][['row_id', 'step', 'nameOrig', 'anomaly_score']]
+        result['anomalies'] = len(df_anomalies)
+
+        explain_anomalies(conn, artifacts['model'], artifacts['scaler'], artifacts['features'],
+                          scored['X_anomalies'], df_anomalies['row_id'], artifacts['model_version'])
+
+        outputs = {
+            'rule_alerts': f"SELECT *, {int(shard)} as shard FROM rule_alerts",
+            'customer_baselines': "SELECT * FROM customer_baselines",
+            'ml_scores': "SELECT * FROM df_anomalies",
+            'ml_explanations': "SELECT * FROM ml_explanations",
+        }
+        for table, query in outputs.items():
+            os.makedirs(os.path.join(output_dir, table), exist_ok=True)
+            conn.execute(f"COPY ({query}) TO '{os.path.join(output_dir, table, f'shard_{shard}.parquet')}' "
+                         f"(FORMAT PARQUET)")
+        conn.close()
+
+    result['log'] = log.getvalue()
+    return result
+
+
+def merge_outputs(conn, output_dir, artifacts, shard_results):
+    """
+    Fold shard outputs into the main database. Returns merged counts.
+    """
+    from baseline import _drop_customer_baselines
+    from anomaly_detection import write_ml_scores
+    from explain import ensure_explanations_table
+    from drift import new_accumulator, evaluate, persist_drift_metrics
+
+    def shard_files(table):
+        return os.path.join(output_dir, table, '*.parquet')
+
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        # Alerts: keep the first 50 per rule across shards, renumbered after existing ids
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rule_alerts (
+                alert_id INTEGER PRIMARY KEY,
+                customer_id VARCHAR,
+                rule_name VARCHAR,
+                detection_date DATE,
+                amount DECIMAL(18,2),
+                description TEXT
+            )
+        """)
+        max_id = conn.execute("SELECT COALESCE(MAX(alert_id), 0) FROM rule_alerts").fetchone()[0]
+        conn.execute(f"""
+            INSERT INTO rule_alerts
+            SELECT
+                ROW_NUMBER() OVER (ORDER BY rule_name, shard, alert_id) + ? as alert_id,
+                customer_id, rule_name, detection_date, amount, description
+            FROM (
+                SELECT * FROM read_parquet('{shard_files('rule_alerts')}')
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY rule_name ORDER BY shard, alert_id) <= {ALERTS_PER_RULE}
+            )
+        """, [max_id])
+        rule_alerts = conn.execute("SELECT COUNT(*) FROM rule_alerts WHERE alert_id > ?", [max_id]).fetchone()[0]
+        refresh_rule_stats(conn)
+
+        # Baselines: customers never span shards, so shard tables simply concatenate
+        _drop_customer_baselines(conn)
+        conn.execute(f"""
+            CREATE TABLE customer_baselines AS
+            SELECT * FROM read_parquet('{shard_files('customer_baselines')}')
+        """)
+        customers = conn.execute("SELECT COUNT(*) FROM customer_baselines").fetchone()[0]
+
+        # Scores and explanations
+        df_anomalies = conn.execute(f"SELECT * FROM read_parquet('{shard_files('ml_scores')}')").fetchdf()
+        write_ml_scores(conn, df_anomalies, artifacts['model_version'])
+
+        ensure_explanations_table(conn, artifacts['features'])
+        conn.execute(f"""
+            INSERT OR IGNORE INTO ml_explanations BY NAME
+            SELECT * FROM read_parquet('{shard_files('ml_explanations')}')
+        """)
+
+        # Drift: histograms are additive across shards
+        drift_acc = new_accumulator(artifacts['drift_reference'])
+        for result in shard_results:
+            if result['drift'] is None:
+                continue
+            for name, counts in result['drift']['features'].items():
+                drift_acc['features'][name] += counts
+            if drift_acc['score'] is not None:
+                drift_acc['score'] += result['drift']['score']
+            drift_acc['n_rows'] += result['drift']['n_rows']
+        persist_drift_metrics(conn, 'ml_training', artifacts['model_version'], drift_acc['n_rows'],
+                              evaluate(artifacts['drift_reference'], drift_acc))
+
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    return {'rule_alerts': rule_alerts, 'customers': customers, 'anomalies': len(df_anomalies)}
+
+
+def run_sharded(workers=4, n_shards=None, cascade_recall=None, keep_shards=False, publish=True):
+    """
+    Full sharded pipeline run. Returns the telemetry run dict.
+    """
+    from anomaly_detection import train_model
+    from profiles import update_profiles
+
+    os.chdir(project_root)
+    n_shards = n_shards or workers
+    threads = max(1, (resource_profile()['threads'] or os.cpu_count() or 1) // workers)
+    run = new_run(f'sharded_w{workers}')
+    shard_dir = os.path.join(SHARD_ROOT, run['run_id'])
+    input_dir = os.path.join(shard_dir, 'input')
+    output_dir = os.path.join(shard_dir, 'output')
+
+    print(f"[INFO] Sharded run: {n_shards} shards on {workers} workers ({threads} DuckDB threads each)")
+
+    conn = connect(DB_FILE)
+    try:
+        ensure_stats_tables(conn)
+
+        # PHASE 1: partition and train (the model is global, not per shard)
+        metrics = begin_stage('partition')
+        partition_transactions(conn, input_dir, n_shards)
+        total_rows = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        run['stages'].append(end_stage(metrics, output={'rows_in': total_rows, 'rows_out': total_rows}))
+
+        metrics = begin_stage('training')
+        artifacts = train_model(conn, cascade_recall)
+        run['stages'].append(end_stage(metrics))
+
+        # PHASE 2: shards in parallel
+        metrics = begin_stage('shards')
+        cpu_before = children_cpu_seconds()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_shard, shard, input_dir, output_dir, threads, workers)
+                       for shard in range(n_shards)]
+            shard_results = [f.result() for f in futures]
+        anomalies = sum(r['anomalies'] for r in shard_results)
+        cpu_after = children_cpu_seconds()
+        run['stages'].append(end_stage(metrics, output={
+            'rows_in': total_rows, 'rows_out': anomalies,
+            'shard_rows': [r['rows'] for r in shard_results],
+            'worker_cpu_seconds': None if cpu_after is None else cpu_after - cpu_before,
+        }))
+
+        # PHASE 3: merge
+        metrics = begin_stage('merge')
+        merged = merge_outputs(conn, output_dir, artifacts, shard_results)
+        run['stages'].append(end_stage(metrics, output={'rows_out': merged['anomalies'], **merged}))
+
+        metrics = begin_stage('profiles')
+        profile_rows = update_profiles(conn, rebuild=True)
+        run['stages'].append(end_stage(metrics, output={'rows_in': profile_rows}))
+
+        if publish:
+            metrics = begin_stage('publish')
+            run['stages'].append(end_stage(metrics, output={'snapshot': publish_snapshot(conn)}))
+
+        record_run(run, conn)
+    finally:
+        conn.close()
+        if not keep_shards:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
+    print(f"[INFO] Rule alerts added: {merged['rule_alerts']}")
+    print(f"[INFO] Customer baselines: {merged['customers']:,}")
+    print(f"[INFO] Anomalies detected: {merged['anomalies']:,} of {total_rows:,} transactions")
+    return run
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded multi-process pipeline")
+    parser.add_argument('--workers', type=int, default=4, help="Worker processes")
+    parser.add_argument('--shards', type=int, default=None, help="Customer shards (default: workers)")
+    parser.add_argument('--cascade-recall', type=float, default=None,
+                        help="Enable the HBOS prefilter cascade at this recall")
+    parser.add_argument('--keep-shards', action='store_true', help="Keep Parquet shards for inspection")
+    parser.add_argument('--no-publish', action='store_true', help="Don't publish a reader snapshot")
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("SHARDED PIPELINE")
+    print("="*60 + "\n")
+
+    run = run_sharded(args.workers, args.shards, args.cascade_recall, args.keep_shards,
+                      publish=not args.no_publish)
+    print()
+    print_stage_table(run['stages'])
@@ -0,0 +1,353 @@
+"""
+Micro-batch Streaming Service
+Tails newly landed transactions and runs rules + baselines + scoring per batch
+
+Sources (both can be active):
+- Step watermark: transactions appended to the table by another process are
+  picked up when max(step) moves past the stream watermark
+- Drop directory: CSV/Parquet files placed in --drop-dir are appended to
+  transactions, then moved to <drop-dir>/processed/
+
+Data must arrive in step order. Rules and scoring only look at steps past
+their watermarks, so rows for an already processed step would never be
+evaluated: drop files reaching back to or before the stream watermark are
+rejected whole and moved to processed/ with a .late suffix.
+
+Each micro-batch covers the steps (stream watermark, to_step] and runs:
+1. Rules engine restricted to the batch (alerts + stream watermark in one transaction)
+2. Incremental customer baselines and profiles up to to_step
+3. Watermark scoring up to to_step with the already loaded model
+
+Every component keeps its own watermark and commits atomically, so a crash
+mid-batch is recovered by simply restarting the service.
+
+Backpressure: a batch consumes at most --max-steps steps. While behind, the
+service loops without sleeping, and it stops ingesting drop files once the
+backlog exceeds --max-backlog-steps (files wait in the directory).
+
+Latency: ingest-to-alert latency is measured from when the data landed (drop
+file mtime, or when the poll first saw the new steps) to the commit of the
+batch's scoring run, and checked against --slo-seconds. Per-batch metrics go to
+the stream_batches table.
+
+The database is opened per cycle, so the write lock is released between polls.
+Readers see results through published snapshots (--publish-interval). Each
+publish copies the reader tables, transactions included, so it costs roughly a
+full scan and a rewrite of the data set: keep the interval well above the
+batch cadence (default 300s).
+
+Usage:
+    python src/04_orchestration/stream_service.py
+    python src/04_orchestration/stream_service.py --drop-dir data/incoming --slo-seconds 30
+    python src/04_orchestration/stream_service.py --once            # process the backlog and exit
+"""
+
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+from datetime import datetime
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.insert(0, current_dir)
+sys.path.insert(0, os.path.join(project_root, 'src', 'common'))
+
+from master_pipeline import load_executor
+from snapshots import publish_snapshot, READER_TABLES
+from db import connect
+from system_stats import ensure_stats_tables, refresh_transaction_stats
+from telemetry import table_count
+
+DB_FILE = os.path.join(project_root, 'data', 'fraud_data.duckdb')
+WATERMARK_JOB = 'stream_rules'
+
+
+def ensure_stream_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stream_batches (
+            batch_id VARCHAR PRIMARY KEY,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            from_step INTEGER,
+            to_step INTEGER,
+            rows_scored BIGINT,
+            rule_alerts BIGINT,
+            ml_alerts BIGINT,
+            backlog_steps INTEGER,
+            processing_seconds DOUBLE,
+            latency_seconds DOUBLE,
+            slo_seconds DOUBLE,
+            slo_met BOOLEAN
+        )
+    """)
+
+
+def ingest_drop_files(conn, drop_dir, watermark):
+    """
+    Append landed CSV/Parquet files to transactions (oldest first).
+    Files with steps <= watermark (already processed) are quarantined as .late.
+    Returns [(first_step, last_step, landed_at)] for the ingested files.
+    """
+    files = sorted(glob.glob(os.path.join(drop_dir, '*.csv')) +
+                   glob.glob(os.path.join(drop_dir, '*.parquet')), key=os.path.getmtime)
+    arrivals = []
+    processed_dir = os.path.join(drop_dir, 'processed')
+    os.makedirs(processed_dir, exist_ok=True)
+
+    for path in files:
+        landed_at = os.path.getmtime(path)
+        reader = 'read_parquet' if path.endswith('.parquet') else 'read_csv_auto'
+        source = f"{reader}('{path}')"
+
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            first_step, last_step, rows = conn.execute(
+                f"SELECT MIN(step), MAX(step), COUNT(*) FROM {source}"
+            ).fetchone()
+            if rows and first_step <= watermark:
+                conn.execute("ROLLBACK")
+                print(f"[WARNING] Late file {os.path.basename(path)}: steps {first_step}-{last_step} reach "
+                      f"back to step {watermark} or earlier, which is already processed. "
+                      f"{rows:,} rows NOT ingested, moved to processed/ as .late")
+                shutil.move(path, os.path.join(processed_dir, os.path.basename(path) + '.late'))
+                continue
+            # Same (nameOrig, step) clustering as the ETL load, within the file
+            conn.execute(f"INSERT INTO transactions BY NAME SELECT * FROM {source} ORDER BY nameOrig, step")
+            # Only the steps this file touched are recounted
+            if rows:
+                refresh_transaction_stats(conn, from_step=first_step)
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            print(f"[ERROR] Could not ingest {os.path.basename(path)}: {e}")
+            shutil.move(path, os.path.join(processed_dir, os.path.basename(path) + '.failed'))
+            continue
+
+        shutil.move(path, os.path.join(processed_dir, os.path.basename(path)))
+        print(f"[INFO] Ingested {os.path.basename(path)}: {rows:,} rows, steps {first_step}-{last_step}")
+        if rows:
+            arrivals.append((first_step, last_step, landed_at))
+
+    return arrivals
+
+
+def run_batch(conn, rules_executor, ml_modules, artifacts, from_step, to_step):
+    """
+    One micro-batch over the steps (from_step, to_step]. Returns (rule_alerts, scoring summary).
+    """
+    baseline, profiles, scoring_only, watermarks = ml_modules
+
+    # 1. Rules: alerts and the stream watermark commit together
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        alerts_before = table_count(conn, 'rule_alerts') or 0
+        failures = rules_executor.run_rules(conn, from_step, to_step, transaction=False)
+        if failures:
+            raise RuntimeError(f"{failures} rule(s) failed")
+        rule_alerts = conn.execute("SELECT COUNT(*) FROM rule_alerts").fetchone()[0] - alerts_before
+        watermarks.set_watermark(conn, WATERMARK_JOB, to_step)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    # 2. Baselines + profiles and 3. scoring (each transactional behind its own watermark)
+    baseline.update_baselines(conn, to_step=to_step)
+    profiles.update_profiles(conn, to_step=to_step)
+    summary = scoring_only.score_new_transactions(conn=conn, to_step=to_step, artifacts=artifacts)
+    if summary is None:
+        raise RuntimeError("no trained model available for scoring")
+
+    return rule_alerts, summary
+
+
+def record_batch(conn, batch):
+    conn.execute("""
+        INSERT INTO stream_batches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [batch['batch_id'], batch['started_at'], batch['finished_at'], batch['from_step'],
+          batch['to_step'], batch['rows_scored'], batch['rule_alerts'], batch['ml_alerts'],
+          batch['backlog_steps'], batch['processing_seconds'], batch['latency_seconds'],
+          batch['slo_seconds'], batch['slo_met']])
+
+
+def serve(poll_interval=5.0, slo_seconds=60.0, max_steps=24, drop_dir=None,
+          max_backlog_steps=240, from_start=False, once=False, publish_interval=300.0):
+    """
+    Run the micro-batch loop until interrupted (or until the backlog is drained with once=True)
+    """
+    os.chdir(project_root)
+    rules_executor = load_executor('rules_executor', '02_rules_engine')
+    load_executor('ml_executor', '03_ml_scoring')  # puts 03_ml_scoring on sys.path
+    import baseline
+    import profiles
+    import scoring_only
+    import watermarks
+
+    ml_modules = (baseline, profiles, scoring_only, watermarks)
+    artifacts, model_mtime = None, None
+    arrivals = []  # (first_step, last_step, landed_at) not yet covered by a batch
+    seen_step = None
+    last_publish, unpublished = time.time(), False
+
+    if poll_interval >= slo_seconds:
+        print(f"[WARNING] Poll interval {poll_interval}s >= SLO {slo_seconds}s: the SLO cannot be met")
+
+    print(f"[INFO] Streaming service started (poll {poll_interval}s, SLO {slo_seconds}s, "
+          f"max {max_steps} steps/batch{', drop dir ' + drop_dir if drop_dir else ''})")
+
+    try:
+        while True:
+            with connect(DB_FILE) as conn:
+                watermarks.ensure_watermark_table(conn)
+                ensure_stream_tables(conn)
+                ensure_stats_tables(conn)
+
+                max_step = conn.execute("SELECT COALESCE(MAX(step), 0) FROM transactions").fetchone()[0]
+
+                # First start: tail from the current end unless asked to replay history
+                # (scoring too, so the first batch doesn't rescore all of history)
+                start = 0 if from_start else max_step
+                for job in (WATERMARK_JOB, scoring_only.WATERMARK_JOB):
+                    if not conn.execute("SELECT COUNT(*) FROM pipeline_watermarks WHERE job_name = ?",
+                                        [job]).fetchone()[0]:
+                        watermarks.set_watermark(conn, job, start)
+                        print(f"[INFO] Watermark '{job}' initialized at step {start}")
+
+                last_step = watermarks.get_watermark(conn, WATERMARK_JOB)
+
+                if drop_dir and max_step - last_step <= max_backlog_steps:
+                    arrivals += ingest_drop_files(conn, drop_dir, last_step)
+                    max_step = conn.execute("SELECT COALESCE(MAX(step), 0) FROM transactions").fetchone()[0]
+                elif drop_dir:
+                    print(f"[WARNING] Backpressure: {max_step - last_step} steps behind, "
+                          f"not ingesting new files")
+
+                # Steps appended by other writers: landed when first seen
+                if seen_step is None:
+                    seen_step = last_step
+                if max_step > seen_step:
+                    covered = max((a[1] for a in arrivals), default=seen_step)
+                    if max_step > covered:
+                        arrivals.append((max(seen_step, covered) + 1, max_step, time.time()))
+                    seen_step = max_step
+
+                backlog = max_step - last_step
+                if backlog > 0:
+                    # Reload the model only when retraining replaced the file
+                    mtime = os.path.getmtime(scoring_only.MODEL_PATH) \
+                        if os.path.exists(scoring_only.MODEL_PATH) else None
+                    if mtime != model_mtime:
+                        artifacts, model_mtime = scoring_only.load_artifacts(), mtime
+
+                    to_step = min(max_step, last_step + max_steps)
+                    started = datetime.now()
+                    t0 = time.perf_counter()
+                    rule_alerts, summary = run_batch(conn, rules_executor, ml_modules, artifacts,
+                                                     last_step, to_step)
+                    processing = time.perf_counter() - t0
+
+                    covered = [a for a in arrivals if a[0] <= to_step and a[1] > last_step]
+                    landed_at = min((a[2] for a in covered), default=time.time() - processing)
+                    latency = time.time() - landed_at
+                    arrivals = [a for a in arrivals if a[1] > to_step]
+
+                    batch = {
+                        'batch_id': started.strftime('%Y%m%d%H%M%S%f'),
+                        'started_at': started,
+                        'finished_at': datetime.now(),
+                        'from_step': last_step + 1,
+                        'to_step': to_step,
+                        'rows_scored': summary['rows_scored'],
+                        'rule_alerts': rule_alerts,
+                        'ml_alerts': summary['anomalies'],
+                        'backlog_steps': max_step - to_step,
+                        'processing_seconds': processing,
+                        'latency_seconds': latency,
+                        'slo_seconds': slo_seconds,
+                        'slo_met': latency <= slo_seconds,
+                    }
+                    record_batch(conn, batch)
+                    unpublished = True
+
+                    label = "[SUCCESS]" if batch['slo_met'] else "[WARNING] SLO breach:"
+                    print(f"{label} Batch steps {last_step + 1}-{to_step}: {summary['rows_scored']:,} rows, "
+                          f"{rule_alerts} rule alerts, {summary['anomalies']} ML alerts, "
+                          f"latency {latency:.1f}s (processing {processing:.1f}s), "
+                          f"{batch['backlog_steps']} steps behind")
+
+                    if batch['backlog_steps'] > 0:
+                        continue  # catching up: no sleep
+
+                # Publish for readers at most every publish_interval (copies the reader tables),
+                # and always before a --once run exits
+                if unpublished and publish_interval is not None and \
+                        (once or time.time() - last_publish >= publish_interval):
+                    publish_snapshot(conn, tables=READER_TABLES)
+                    last_publish, unpublished = time.time(), False
+
+            if once:
+                break
+            time.sleep(poll_interval)
+
+    except KeyboardInterrupt:
+        # Batches committed since the last publish would stay invisible to readers
+        if unpublished and publish_interval is not None:
+            with connect(DB_FILE) as conn:
+                publish_snapshot(conn, tables=READER_TABLES)
+        print("\n[INFO] Streaming service stopped")
+
+
+def print_latency_report(conn, last_n=100):
+    """
+    Latency percentiles over the most recent batches
+    """
+    row = conn.execute("""
+        SELECT
+            COUNT(*),
+            QUANTILE_CONT(latency_seconds, 0.5),
+            QUANTILE_CONT(latency_seconds, 0.95),
+            MAX(latency_seconds),
+            AVG(CASE WHEN slo_met THEN 1.0 ELSE 0.0 END)
+        FROM (SELECT * FROM stream_batches ORDER BY started_at DESC LIMIT ?)
+    """, [last_n]).fetchone()
+
+    print("="*60)
+    print(f"STREAM LATENCY (last {row[0]} batches)")
+    print("="*60)
+    if not row[0]:
+        print("[INFO] No batches recorded yet")
+    else:
+        print(f"p50: {row[1]:.2f}s  p95: {row[2]:.2f}s  max: {row[3]:.2f}s")
+        print(f"Within SLO: {row[4]*100:.1f}%")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-batch streaming service")
+    parser.add_argument('--poll-interval', type=float, default=5.0, help="Seconds between polls")
+    parser.add_argument('--slo-seconds', type=float, default=60.0,
+                        help="Ingest-to-alert latency target")
+    parser.add_argument('--max-steps', type=int, default=24, help="Max steps per micro-batch")
+    parser.add_argument('--drop-dir', default=None, help="Directory polled for CSV/Parquet files")
+    parser.add_argument('--max-backlog-steps', type=int, default=240,
+                        help="Stop ingesting drop files beyond this backlog")
+    parser.add_argument('--from-start', action='store_true',
+                        help="Process existing history on first start instead of tailing")
+    parser.add_argument('--publish-interval', type=float, default=300.0,
+                        help="Min seconds between reader snapshots (negative disables)")
+    parser.add_argument('--once', action='store_true', help="Drain the backlog and exit")
+    parser.add_argument('--report', action='store_true', help="Print latency percentiles and exit")
+    args = parser.parse_args()
+
+    if args.report:
+        with connect(DB_FILE, read_only=True) as conn:
+            print_latency_report(conn)
+        sys.exit(0)
+
+    serve(poll_interval=args.poll_interval, slo_seconds=args.slo_seconds, max_steps=args.max_steps,
+          drop_dir=args.drop_dir, max_backlog_steps=args.max_backlog_steps,
+          from_start=args.from_start, once=args.once,
+          publish_interval=args.publish_interval if args.publish_interval >= 0 else None)
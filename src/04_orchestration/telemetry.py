@@ -0,0 +1,373 @@
+"""
+Pipeline Telemetry
+Per-stage wall time, CPU time, process RSS during the stage, rows and throughput
+
+Every pipeline entrypoint (master_pipeline.py and both executors) records a run:
+- one row per stage in the pipeline_runs table
+- a JSON file per run in data/telemetry/<run_id>_<entrypoint>.json
+
+Notes:
+- cpu_seconds is process CPU time (all threads, including DuckDB and
+  scikit-learn workers) over the stage; with concurrent stages it overlaps,
+  use --workers 1 for clean per-stage numbers
+- peak_rss_mb is the highest process RSS sampled while the stage ran
+  (every RSS_SAMPLE_INTERVAL seconds) and rss_delta_mb its growth over the
+  RSS at stage start. Both are process-level: with concurrent stages they
+  include the memory of whatever else runs at the same time, use
+  --workers 1 for clean per-stage numbers. None where the current RSS can't
+  be read (/proc or the optional psutil)
+
+Usage:
+    python src/04_orchestration/telemetry.py report
+    python src/04_orchestration/telemetry.py report --window 10 --threshold 1.25
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime
+
+import duckdb
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:  # optional: current RSS without /proc (macOS, Windows)
+    psutil = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from db import connect
+
+DB_PATH = 'data/fraud_data.duckdb'
+TELEMETRY_DIR = 'data/telemetry'
+
+# Seconds between RSS samples while a stage runs
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+def current_rss_mb():
+    """
+    Current process resident set size in MB, None where it can't be read
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    return None
+
+
+class RssSampler:
+    """
+    Highest process RSS between start and stop(), sampled on a daemon thread
+    (ru_maxrss can't be used: it is the process lifetime high-water mark, so
+    every stage after the largest one would inherit it)
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.start_mb = self.peak_mb = current_rss_mb()
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        if self.start_mb is not None:
+            self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self._sample()
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and rss > self.peak_mb:
+            self.peak_mb = rss
+
+    def stop(self):
+        """
+        (peak_mb, delta_mb) over the sampled interval, (None, None) if unavailable
+        """
+        if self._thread is None:
+            return None, None
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return self.peak_mb, self.peak_mb - self.start_mb
+
+
+def children_cpu_seconds():
+    """
+    CPU time of terminated child processes (process-pool workers), None if unavailable
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def new_run(entrypoint):
+    return {
+        'run_id': datetime.now().strftime('%Y%m%d%H%M%S'),
+        'entrypoint': entrypoint,
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'finished_at': None,
+        'stages': [],
+    }
+
+
+def begin_stage(name):
+    """
+    Start measuring a stage; pass the returned dict to end_stage()
+    """
+    return {
+        'stage': name,
+        'status': 'running',
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'seconds': None,
+        'cpu_seconds': None,
+        'peak_rss_mb': None,
+        'rss_delta_mb': None,
+        'rows_in': None,
+        'rows_out': None,
+        'rows_per_sec': None,
+        'error': None,
+        'details': {},
+        '_wall': time.perf_counter(),
+        '_cpu': time.process_time(),
+        '_rss': RssSampler(),
+    }
+
+
+def end_stage(metrics, status='success', output=None, error=None):
+    """
+    Finish a stage. output is the stage function's return value: a dict with
+    rows_in / rows_out and optional extra numbers (kept under details).
+    """
+    metrics['seconds'] = time.perf_counter() - metrics.pop('_wall')
+    metrics['cpu_seconds'] = time.process_time() - metrics.pop('_cpu')
+    metrics['peak_rss_mb'], metrics['rss_delta_mb'] = metrics.pop('_rss').stop()
+    metrics['status'] = status
+    metrics['error'] = error
+
+    if isinstance(output, dict):
+        output = dict(output)
+        metrics['rows_in'] = output.pop('rows_in', None)
+        metrics['rows_out'] = output.pop('rows_out', None)
+        metrics['details'] = output
+
+    if metrics['rows_in'] and metrics['seconds'] > 0:
+        metrics['rows_per_sec'] = metrics['rows_in'] / metrics['seconds']
+    return metrics
+
+
+def not_run(name, status, error=None):
+    """
+    Metrics entry for a stage that was skipped or served from checkpoints
+    """
+    metrics = begin_stage(name)
+    metrics.pop('_wall')
+    metrics.pop('_cpu')
+    metrics.pop('_rss').stop()
+    metrics.update({'status': status, 'seconds': 0.0, 'error': error})
+    return metrics
+
+
+def table_count(conn, table):
+    """
+    Row count of a table or view, None if it doesn't exist (stage row accounting)
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = connect(DB_PATH, read_only=True)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    except duckdb.Error:
+        return None
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def ensure_runs_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_runs (
+            run_id VARCHAR,
+            entrypoint VARCHAR,
+            stage VARCHAR,
+            status VARCHAR,
+            started_at TIMESTAMP,
+            wall_seconds DOUBLE,
+            cpu_seconds DOUBLE,
+            peak_rss_mb DOUBLE,
+            rows_in BIGINT,
+            rows_out BIGINT,
+            rows_per_sec DOUBLE,
+            details VARCHAR,
+            error VARCHAR
+        )
+    """)
+    conn.execute("ALTER TABLE pipeline_runs ADD COLUMN IF NOT EXISTS rss_delta_mb DOUBLE")
+
+
+def record_run(run, conn=None):
+    """
+    Persist a finished run to pipeline_runs and data/telemetry/<run_id>_<entrypoint>.json.
+    Returns the JSON path.
+    """
+    run['finished_at'] = datetime.now().isoformat(timespec='seconds')
+
+    os.makedirs(TELEMETRY_DIR, exist_ok=True)
+    path = os.path.join(TELEMETRY_DIR, f"{run['run_id']}_{run['entrypoint']}.json")
+    with open(path, 'w') as f:
+        json.dump(run, f, indent=2, default=str)
+
+    own_conn = conn is None
+    if own_conn:
+        conn = connect(DB_PATH)
+    try:
+        ensure_runs_table(conn)
+        conn.executemany(
+            """
+            INSERT INTO pipeline_runs (run_id, entrypoint, stage, status, started_at, wall_seconds,
+                                       cpu_seconds, peak_rss_mb, rss_delta_mb, rows_in, rows_out,
+                                       rows_per_sec, details, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [[run['run_id'], run['entrypoint'], m['stage'], m['status'], m['started_at'],
+              m['seconds'], m['cpu_seconds'], m['peak_rss_mb'], m['rss_delta_mb'], m['rows_in'],
+              m['rows_out'], m['rows_per_sec'], json.dumps(m['details'], default=str), m['error']]
+             for m in run['stages']]
+        )
+    finally:
+        if own_conn:
+            conn.close()
+
+    return path
+
+
+def print_stage_table(stages):
+    """
+    Per-stage status, wall/CPU time, process RSS during the stage (peak and
+    growth) and throughput
+    """
+    print(f"{'Stage':<20}{'Status':<9}{'Wall s':>8}{'CPU s':>8}{'RSS MB':>9}{'+MB':>7}{'Rows in':>12}{'Rows/s':>11}")
+    print("-" * 84)
+    def fmt(value, width, spec):
+        return format(value, f">{width}{spec}") if value is not None else '-'.rjust(width)
+
+    for m in stages:
+        print(f"{m['stage']:<20}{m['status']:<9}{fmt(m['seconds'], 8, '.1f')}"
+              f"{fmt(m['cpu_seconds'], 8, '.1f')}{fmt(m['peak_rss_mb'], 9, '.0f')}"
+              f"{fmt(m['rss_delta_mb'], 7, '.0f')}"
+              f"{fmt(m['rows_in'], 12, ',')}{fmt(m['rows_per_sec'], 11, ',.0f')}")
+
+
+def regression_report(conn, window=10, threshold=1.25, min_seconds=1.0):
+    """
+    Compare each stage's latest successful run with the median of its previous
+    `window` successful runs. A stage regresses when wall time or the peak
+    process RSS sampled while it ran grows, or throughput drops, by more than
+    `threshold`x. Stages faster than min_seconds are reported but never
+    flagged (timer noise).
+    """
+    return conn.execute("""
+        WITH ranked AS (
+            SELECT *,
+                ROW_NUMBER() OVER (PARTITION BY stage ORDER BY started_at DESC, run_id DESC) as rn
+            FROM pipeline_runs
+            WHERE status = 'success'
+        ),
+        baseline AS (
+            SELECT
+                stage,
+                COUNT(*) as baseline_runs,
+                MEDIAN(wall_seconds) as base_seconds,
+                MEDIAN(peak_rss_mb) as base_rss_mb,
+                MEDIAN(rows_per_sec) as base_rows_per_sec
+            FROM ranked
+            WHERE rn BETWEEN 2 AND ? + 1
+            GROUP BY stage
+        )
+        SELECT
+            l.stage,
+            l.run_id,
+            l.wall_seconds,
+            b.base_seconds,
+            l.wall_seconds / NULLIF(b.base_seconds, 0) as time_ratio,
+            l.peak_rss_mb,
+            b.base_rss_mb,
+            l.peak_rss_mb / NULLIF(b.base_rss_mb, 0) as rss_ratio,
+            l.rows_per_sec,
+            b.base_rows_per_sec,
+            b.base_rows_per_sec / NULLIF(l.rows_per_sec, 0) as throughput_ratio,
+            b.baseline_runs,
+            l.wall_seconds >= ? AND COALESCE(GREATEST(
+                l.wall_seconds / NULLIF(b.base_seconds, 0),
+                l.peak_rss_mb / NULLIF(b.base_rss_mb, 0),
+                b.base_rows_per_sec / NULLIF(l.rows_per_sec, 0)
+            ) > ?, FALSE) as regression
+        FROM ranked l
+        LEFT JOIN baseline b ON b.stage = l.stage
+        WHERE l.rn = 1
+        ORDER BY l.stage
+    """, [window, min_seconds, threshold]).fetchdf()
+
+
+def print_report(window=10, threshold=1.25):
+    conn = connect(DB_PATH, read_only=True)
+    try:
+        report = regression_report(conn, window, threshold)
+    except duckdb.CatalogException:
+        report = pd.DataFrame()  # no pipeline_runs table yet
+    finally:
+        conn.close()
+
+    print("="*60)
+    print(f"PIPELINE TELEMETRY (latest vs median of previous {window} runs)")
+    print("="*60)
+
+    if report.empty:
+        print("[INFO] No successful runs recorded yet")
+        return 0
+
+    for _, row in report.iterrows():
+        if pd.isna(row['baseline_runs']):
+            print(f"  {row['stage']:<20}{row['wall_seconds']:>8.1f}s  (no baseline yet)")
+            continue
+        label = "[REGRESSION]" if row['regression'] else "[OK]"
+        line = (f"  {row['stage']:<20}{row['wall_seconds']:>8.1f}s vs {row['base_seconds']:.1f}s "
+                f"(x{row['time_ratio']:.2f})")
+        if pd.notna(row['peak_rss_mb']) and pd.notna(row['base_rss_mb']):
+            line += f", process RSS {row['peak_rss_mb']:.0f} vs {row['base_rss_mb']:.0f} MB"
+        if pd.notna(row['rows_per_sec']) and pd.notna(row['base_rows_per_sec']):
+            line += f", {row['rows_per_sec']:,.0f} vs {row['base_rows_per_sec']:,.0f} rows/s"
+        print(f"{label} {line}")
+
+    print("="*60)
+    regressions = int(report['regression'].sum())
+    if regressions:
+        print(f"[WARNING] {regressions} stage(s) regressed beyond x{threshold}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline telemetry")
+    sub = parser.add_subparsers(dest='command', required=True)
+    report_cmd = sub.add_parser('report', help="Show regressions against a rolling baseline")
+    report_cmd.add_argument('--window', type=int, default=10,
+                            help="Previous successful runs in the baseline")
+    report_cmd.add_argument('--threshold', type=float, default=1.25,
+                            help="Ratio that counts as a regression")
+    args = parser.parse_args()
+
+    sys.exit(print_report(args.window, args.threshold))
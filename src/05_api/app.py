@@ -12,14 +12,27 @@ Use Cases:
 - Investigator portal backend
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
-import duckdb
+from functools import wraps
 import os
 import sys
+import time
 
 # Add ML scoring to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '03_ml_scoring'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'common'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from snapshots import snapshot_id
+from db_pool import ReadPool, CONNECTION_ERRORS, DatabaseUnavailable
+from response_cache import ResponseCache
+from export import EXPORT_FORMATS, export_chunks
+from serialization import dumps
+import metrics
+from queries import (QueryError, parse_params, ALERTS_PARAMS, EXPORT_PARAMS, ML_ALERTS_PARAMS,
+                     EXPLANATION_PARAMS, TRANSACTIONS_PARAMS)
+import queries
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DB_FILE = os.path.join(BASE_DIR, "data", "fraud_data.duckdb")
@@ -27,9 +40,95 @@ DB_FILE = os.path.join(BASE_DIR, "data", "fraud_data.duckdb")
 app = Flask(__name__)
 CORS(app)
 
+# One read-only connection per worker process, a cursor per request
+POOL = ReadPool()
+
+# Per-worker cache of read responses, dropped whenever a new snapshot is published
+CACHE = ResponseCache(max_entries=int(os.environ.get('AML_API_CACHE_ENTRIES', 256)))
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    """Request latency per handler (view function name, as in the ASGI app)"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                        (request.endpoint or 'not_found', request.method,
+                                         str(response.status_code)))
+    return response
+
 def get_db():
-    """Get database connection"""
-    return duckdb.connect(DB_FILE, read_only=True)
+    """Get a cursor on the worker's connection to the currently published snapshot
+    (a connection of its own before the first publish, see db_pool.py)"""
+    return POOL.cursor()
+
+@app.errorhandler(DatabaseUnavailable)
+def database_unavailable(e):
+    """503 while nothing is published and the pipeline holds the database"""
+    return jsonify({"error": str(e)}), 503
+
+def db_error(e):
+    """500 response for a failed query; connection-level errors trigger a health check"""
+    if isinstance(e, CONNECTION_ERRORS):
+        POOL.mark_suspect()
+    return jsonify({"error": str(e)}), 500
+
+def json_response(body, status=200):
+    """JSON response encoded by the serialization layer (no pandas, DECIMAL/DATE/numpy aware)"""
+    return Response(dumps(body), status=status, mimetype='application/json')
+
+def request_params(spec):
+    """Query parameters declared in spec ({name: (type, default)}), parsed and defaulted"""
+    return parse_params(spec, request.args.get)
+
+def run_query(query_fn, *args, **kwargs):
+    """Run one of the shared endpoint queries (queries.py) on a request cursor"""
+    conn = get_db()
+    try:
+        return json_response(query_fn(conn, *args, **kwargs))
+    except QueryError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return db_error(e)
+    finally:
+        conn.close()
+
+def cached_response(params=None):
+    """
+    Serve a read endpoint from CACHE with an ETag, answering If-None-Match with 304.
+    
+    params declares the query parameters that shape the response as
+    {name: (type, default)}; they are parsed and defaulted for the cache key,
+    so equivalent requests share an entry and unrelated parameters are ignored.
+    Responses from the live pipeline database (nothing published yet) have no
+    stable version and bypass the cache.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = POOL.version()
+            if version == 'live':
+                return view(*args, **kwargs)
+            
+            key = (request.path, tuple(sorted(request_params(params or {}).items())))
+            entry = CACHE.get(key, version)
+            if entry is None:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = CACHE.put(key, version, response.get_data())
+            
+            body, etag = entry
+            headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+            if request.if_none_match.contains(etag.strip('"')):
+                CACHE.stats['not_modified'] += 1
+                return Response(status=304, headers=headers)
+            return Response(body, mimetype='application/json', headers=headers)
+        return wrapper
+    return decorator
 
 @app.route('/api/v1/health', methods=['GET'])
 def health_check():
@@ -40,73 +139,94 @@ def health_check():
     {
         "status": "healthy",
         "database": "connected",
+        "snapshot": "20250101120000000000",
+        "pool": {"pid": 4242, "path": "...", "connects": 1, "reconnects": 0, ...},
+        "cache": {"version": "20250101120000000000", "entries": 12, "hits": 340, ...},
         "version": "1.0.0"
     }
     """
     try:
         conn = get_db()
-        conn.execute("SELECT 1").fetchone()
+        queries.health(conn)
         conn.close()
         db_status = "connected"
     except:
+        POOL.mark_suspect()
         db_status = "disconnected"
     
     return jsonify({
         "status": "healthy" if db_status == "connected" else "degraded",
         "database": db_status,
+        "snapshot": snapshot_id(),
+        "pool": POOL.info(),
+        "cache": CACHE.info(),
         "version": "1.0.0"
     })
 
 @app.route('/api/v1/alerts', methods=['GET'])
+@cached_response(ALERTS_PARAMS)
 def get_alerts():
     """
-    Retrieve all alerts from rules engine.
+    Retrieve all alerts from rules engine, highest risk first.
     
     Query Parameters:
-    - alert_type: Filter by specific alert type
+    - alert_type: Filter by specific alert type (rule name)
     - min_risk_score: Minimum risk score threshold
-    - limit: Maximum number of results (default 100)
+    - limit: Maximum number of results (default 100, at most MAX_LIMIT)
+    - cursor: next_cursor of the previous page
+    - orient: records (default) or columns ({"alert_id": [...], ...})
     
     Response:
     {
         "count": 10,
-        "alerts": [...]
+        "alerts": [...],
+        "next_cursor": "ODA6MTIz"    (null on the last page)
     }
-    """
-    alert_type = request.args.get('alert_type')
-    min_risk_score = request.args.get('min_risk_score', type=int, default=0)
-    limit = request.args.get('limit', type=int, default=100)
-    
-    conn = get_db()
     
-    query = "SELECT * FROM alerts WHERE risk_score >= ?"
-    params = [min_risk_score]
+    Pages are keyset-paginated on (risk_score, alert_id): each page continues
+    after the last row of the previous one, so every page costs the same and
+    concurrent publishes can't shift rows between pages of one snapshot.
+    """
+    return run_query(queries.rule_alerts, **request_params(ALERTS_PARAMS))
+
+@app.route('/api/v1/alerts/export', methods=['GET'])
+def export_alerts():
+    """
+    Stream all rule alerts matching the filters, highest risk first.
     
-    if alert_type:
-        query += " AND alert_type = ?"
-        params.append(alert_type)
+    Query Parameters:
+    - format: ndjson (default), csv or arrow (Arrow IPC stream)
+    - alert_type, min_risk_score: as for /api/v1/alerts
     
-    query += f" ORDER BY risk_score DESC LIMIT {limit}"
+    The body is written in chunks while DuckDB produces record batches, so
+    memory stays flat regardless of the number of alerts.
+    """
+    params = request_params(EXPORT_PARAMS)
+    conn = get_db()
     
     try:
-        alerts = conn.execute(query, params).df().to_dict('records')
+        reader = queries.open_alert_export(conn, **params)
+    except QueryError as e:
         conn.close()
-        
-        return jsonify({
-            "count": len(alerts),
-            "alerts": alerts
-        })
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         conn.close()
-        return jsonify({"error": str(e)}), 500
+        return db_error(e)
+    
+    fmt = params['format']
+    return Response(export_chunks(conn, reader, fmt), mimetype=EXPORT_FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename="rule_alerts_{POOL.version()}.{fmt}"'
+    })
 
 @app.route('/api/v1/alerts/ml', methods=['GET'])
+@cached_response(ML_ALERTS_PARAMS)
 def get_ml_alerts():
     """
     Retrieve ML anomaly detection alerts.
     
     Query Parameters:
-    - limit: Maximum number of results (default 50)
+    - limit: Maximum number of results (default 50, at most MAX_LIMIT)
+    - orient: records (default) or columns
     
     Response:
     {
@@ -114,22 +234,25 @@ def get_ml_alerts():
         "anomalies": [...]
     }
     """
-    limit = request.args.get('limit', type=int, default=50)
+    return run_query(queries.ml_alerts, **request_params(ML_ALERTS_PARAMS))
+
+@app.route('/api/v1/alerts/ml/<int:row_id>/explanation', methods=['GET'])
+def get_ml_explanation(row_id):
+    """
+    Per-feature attribution for an ML anomaly (precomputed by the scoring pipeline).
     
-    conn = get_db()
+    Query Parameters:
+    - model_version: Model that scored the row (default: latest explanation)
     
-    try:
-        query = f"SELECT * FROM ml_alerts ORDER BY anomaly_score ASC LIMIT {limit}"
-        anomalies = conn.execute(query).df().to_dict('records')
-        conn.close()
-        
-        return jsonify({
-            "count": len(anomalies),
-            "anomalies": anomalies
-        })
-    except Exception as e:
-        conn.close()
-        return jsonify({"error": str(e)}), 500
+    Response:
+    {
+        "row_id": 4821,
+        "model_version": "20251201020000",
+        "top_feature": "amount",
+        "contributions": {"amount": 0.41, ...}
+    }
+    """
+    return run_query(queries.ml_explanation, row_id, **request_params(EXPLANATION_PARAMS))
 
 @app.route('/api/v1/customer/<client_id>', methods=['GET'])
 def get_customer_profile(client_id):
@@ -146,46 +269,52 @@ def get_customer_profile(client_id):
         "alerts": [...]
     }
     """
-    conn = get_db()
+    return run_query(queries.customer_profile, client_id)
+
+@app.route('/api/v1/customer/<client_id>/transactions', methods=['GET'])
+def get_customer_transactions(client_id):
+    """
+    A customer's transactions, oldest step first.
     
-    try:
-        # Customer profile
-        profile_query = """
-            SELECT 
-                nameOrig as client_id,
-                COUNT(*) as total_transactions,
-                CAST(SUM(amount) AS DECIMAL(18,2)) as total_volume,
-                CAST(AVG(amount) AS DECIMAL(18,2)) as avg_amount,
-                COUNT(DISTINCT type) as transaction_types,
-                COUNT(DISTINCT nameDest) as unique_recipients
-            FROM transactions
-            WHERE nameOrig = ?
-            GROUP BY nameOrig
-        """
-        profile = conn.execute(profile_query, [client_id]).df()
-        
-        if profile.empty:
-            conn.close()
-            return jsonify({"error": "Customer not found"}), 404
-        
-        # Associated alerts
-        alerts_query = "SELECT * FROM alerts WHERE client_id = ?"
-        alerts = conn.execute(alerts_query, [client_id]).df().to_dict('records')
-        
-        conn.close()
-        
-        return jsonify({
-            "client_id": client_id,
-            "profile": profile.to_dict('records')[0],
-            "alerts": alerts,
-            "alert_count": len(alerts)
-        })
+    Query Parameters:
+    - from_step, to_step: Inclusive step range (default: all steps)
+    - limit: Maximum number of results (default 100, at most MAX_LIMIT)
+    - cursor: next_cursor of the previous page
+    - orient: records (default) or columns
     
-    except Exception as e:
-        conn.close()
-        return jsonify({"error": str(e)}), 500
+    Response:
+    {
+        "client_id": "C363736674",
+        "count": 2,
+        "transactions": [{"row_id": 1822, "step": 1, "type": "TRANSFER", ...}, ...],
+        "next_cursor": null
+    }
+    
+    Keyset-paginated on (step, row_id); row_id is the one ML explanations use.
+    """
+    return run_query(queries.customer_transactions, client_id, **request_params(TRANSACTIONS_PARAMS))
+
+@app.route('/api/v1/customers:batch', methods=['POST'])
+def get_customer_profiles():
+    """
+    Profiles and alerts of many customers in one round-trip.
+    
+    Body:
+    {"client_ids": ["C363736674", "C1305486145", ...]}    (at most MAX_BATCH_IDS)
+    
+    Response (customers in request order):
+    {
+        "count": 2,
+        "customers": [
+            {"client_id": "C363736674", "found": true, "profile": {...}, "alerts": [...], "alert_count": 1},
+            {"client_id": "C1305486145", "found": false, "profile": null, "alerts": [], "alert_count": 0}
+        ]
+    }
+    """
+    return run_query(queries.customers_batch, request.get_json(silent=True))
 
 @app.route('/api/v1/stats', methods=['GET'])
+@cached_response()
 def get_statistics():
     """
     Get overall system statistics and metrics.
@@ -198,26 +327,17 @@ def get_statistics():
         ...
     }
     """
-    conn = get_db()
-    
-    try:
-        stats = {}
-        
-        stats['total_transactions'] = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
-        stats['total_rule_alerts'] = conn.execute("SELECT COUNT(*) FROM alerts").fetchone()[0]
-        stats['total_ml_alerts'] = conn.execute("SELECT COUNT(*) FROM ml_alerts").fetchone()[0]
-        stats['high_risk_alerts'] = conn.execute("SELECT COUNT(*) FROM alerts WHERE risk_score >= 80").fetchone()[0]
-        
-        total_alerts = stats['total_rule_alerts'] + stats['total_ml_alerts']
-        stats['alert_rate'] = round(total_alerts / stats['total_transactions'] * 100, 4) if stats['total_transactions'] > 0 else 0
-        
-        conn.close()
-        
-        return jsonify(stats)
-    
-    except Exception as e:
-        conn.close()
-        return jsonify({"error": str(e)}), 500
+    return run_query(queries.statistics)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus metrics of this worker process (text exposition format):
+    request latency per handler, DuckDB query time and rows, serialization
+    time, connection pool and response cache counters. See metrics.py.
+    """
+    return Response(metrics.render(metrics.pool_cache_metrics(POOL, CACHE)),
+                    mimetype=metrics.CONTENT_TYPE)
 
 if __name__ == '__main__':
     """
@@ -225,7 +345,9 @@ if __name__ == '__main__':
     python src/05_api/app.py
     
     Production deployment:
-    - Gunicorn: gunicorn -w 4 -b 0.0.0.0:8000 src.05_api.app:app
+    - Gunicorn: gunicorn -w 4 -b 0.0.0.0:8000 --chdir src/05_api app:app
+      (each worker opens its own pooled read-only connection to the published
+      snapshot on first request)
     - Docker: Containerize with nginx reverse proxy
     - AWS ECS/Lambda: Serverless deployment with API Gateway
     """
@@ -235,9 +357,14 @@ if __name__ == '__main__':
     print("Endpoints available:")
     print("  GET  /api/v1/health")
     print("  GET  /api/v1/alerts")
+    print("  GET  /api/v1/alerts/export")
     print("  GET  /api/v1/alerts/ml")
+    print("  GET  /api/v1/alerts/ml/<row_id>/explanation")
     print("  GET  /api/v1/customer/<client_id>")
+    print("  GET  /api/v1/customer/<client_id>/transactions")
+    print("  POST /api/v1/customers:batch")
     print("  GET  /api/v1/stats")
+    print("  GET  /metrics")
     print("=" * 60)
     print("\nStarting development server on http://localhost:5000")
     print("Press CTRL+C to stop\n")
@@ -0,0 +1,421 @@
+"""
+AML Monitoring Engine - ASGI API
+The /api/v1/* endpoints of app.py on an asyncio server
+
+The Flask app serves one request at a time per worker thread, so a slow scan
+holds the worker. Here the event loop only parses requests and writes
+responses; every DuckDB query runs on a bounded thread pool, each on its own
+cursor of the worker's pooled connection (db_pool.py; a connection per query
+until the first snapshot is published):
+- queries are limited to AML_API_QUERY_THREADS concurrent threads (default 4);
+  further requests queue for a thread
+- a request that isn't answered within AML_API_TIMEOUT seconds (default 30,
+  queueing included) gets a 504 and its query is interrupted (cursor.interrupt)
+- a client that disconnects mid-query interrupts its query the same way
+- /health runs on its own thread, so it answers while the query pool is busy
+- /metrics exposes the same Prometheus metrics as the Flask app, plus the
+  running/timed-out/disconnected query counters
+
+Endpoint logic, parameters, the response cache and ETags are shared with the
+Flask app (queries.py, response_cache.py), so both return identical bodies.
+
+Run (uvicorn is optional, any ASGI server works):
+    pip install uvicorn
+    python src/05_api/asgi_app.py
+    uvicorn asgi_app:app --app-dir src/05_api --host 0.0.0.0 --port 8000 --workers 4
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from snapshots import snapshot_id
+from db_pool import ReadPool, CONNECTION_ERRORS, DatabaseUnavailable
+from response_cache import ResponseCache
+from export import EXPORT_FORMATS, export_chunks
+from serialization import dumps
+import metrics
+from queries import (QueryError, parse_params, ALERTS_PARAMS, EXPORT_PARAMS, ML_ALERTS_PARAMS,
+                     EXPLANATION_PARAMS, TRANSACTIONS_PARAMS)
+import queries
+
+QUERY_THREADS = int(os.environ.get('AML_API_QUERY_THREADS', 4))
+REQUEST_TIMEOUT = float(os.environ.get('AML_API_TIMEOUT', 30))
+HEALTH_TIMEOUT = 2.0
+
+# Largest accepted request body (batch lookups)
+MAX_BODY_BYTES = 1024 * 1024
+
+# One read-only connection per worker process, a cursor per query
+POOL = ReadPool()
+
+# Per-worker cache of read responses, dropped whenever a new snapshot is published
+CACHE = ResponseCache(max_entries=int(os.environ.get('AML_API_CACHE_ENTRIES', 256)))
+
+QUERY_EXECUTOR = ThreadPoolExecutor(QUERY_THREADS, thread_name_prefix='api-query')
+HEALTH_EXECUTOR = ThreadPoolExecutor(1, thread_name_prefix='api-health')
+
+stats = {'requests': 0, 'timeouts': 0, 'disconnects': 0, 'running': 0}
+
+
+class RequestAborted(Exception):
+    """Query stopped before it finished (timeout or client disconnect)"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+# ============================================
+# QUERY EXECUTION
+# ============================================
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def _discard(future):
+    # Interrupted queries end with an exception nobody awaits anymore
+    if not future.cancelled():
+        future.exception()
+
+
+async def run_blocking(request, query_fn, *args, executor=QUERY_EXECUTOR, timeout=None, close=True):
+    """
+    Run query_fn(cursor, *args) on the executor and await its result.
+    On timeout or client disconnect the cursor's query is interrupted and
+    RequestAborted raised. close=False leaves the cursor open for the caller.
+    """
+    conn = POOL.cursor()
+
+    def job():
+        stats['running'] += 1
+        try:
+            return query_fn(conn, *args)
+        finally:
+            stats['running'] -= 1
+            if close:
+                conn.close()
+
+    future = executor.submit(job)
+    result = asyncio.wrap_future(future)
+    disconnect = asyncio.ensure_future(wait_disconnect(request['receive']))
+    try:
+        done, _ = await asyncio.wait({result, disconnect}, timeout=timeout or REQUEST_TIMEOUT,
+                                     return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+
+    if result in done:
+        return result.result()
+
+    conn.interrupt()
+    if future.cancel():
+        conn.close()
+    result.add_done_callback(_discard)
+    raise RequestAborted('disconnect' if done else 'timeout')
+
+
+# ============================================
+# RESPONSES
+# ============================================
+async def send_response(send, status, body=b'', content_type='application/json', headers=None):
+    raw_headers = [(b'content-type', content_type.encode()),
+                   (b'content-length', str(len(body)).encode()),
+                   (b'access-control-allow-origin', b'*')]
+    raw_headers += [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def error_body(message):
+    return dumps({"error": message})
+
+
+def db_error_status(e):
+    """503 while nothing is published and the pipeline holds the database, else 500;
+    connection-level errors trigger a health check"""
+    if isinstance(e, DatabaseUnavailable):
+        return 503
+    if isinstance(e, CONNECTION_ERRORS):
+        POOL.mark_suspect()
+    return 500
+
+
+def if_none_match(request, etag):
+    header = request['headers'].get('if-none-match', '')
+    tags = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    return etag in tags or '*' in tags
+
+
+async def query_response(request, send, query_fn, *args, cache_params=None):
+    """
+    Run a shared endpoint query and send its JSON (through CACHE when
+    cache_params is given, as Flask's cached_response does)
+    """
+    key = version = None
+    if cache_params is not None:
+        version = POOL.version()
+        if version != 'live':
+            key = (request['path'], tuple(sorted(request_params(request, cache_params).items())))
+
+    entry = CACHE.get(key, version) if key else None
+    if entry is None:
+        try:
+            body = dumps(await run_blocking(request, query_fn, *args))
+        except RequestAborted as e:
+            return await aborted_response(send, e)
+        except QueryError as e:
+            return await send_response(send, e.status, error_body(str(e)))
+        except Exception as e:
+            return await send_response(send, db_error_status(e), error_body(str(e)))
+        if key is None:
+            return await send_response(send, 200, body)
+        entry = CACHE.put(key, version, body)
+
+    body, etag = entry
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if if_none_match(request, etag):
+        CACHE.stats['not_modified'] += 1
+        return await send_response(send, 304, headers=headers)
+    await send_response(send, 200, body, headers=headers)
+
+
+async def aborted_response(send, e):
+    if e.reason == 'timeout':
+        stats['timeouts'] += 1
+        await send_response(send, 504, error_body(f"Query timed out after {REQUEST_TIMEOUT:g}s"))
+    else:
+        stats['disconnects'] += 1  # nobody left to answer
+
+
+def request_params(request, spec):
+    return parse_params(spec, lambda name: request['query'].get(name, [None])[0])
+
+
+# ============================================
+# ENDPOINTS
+# ============================================
+async def health_check(request, send):
+    try:
+        await run_blocking(request, queries.health, executor=HEALTH_EXECUTOR, timeout=HEALTH_TIMEOUT)
+        db_status = "connected"
+    except Exception:
+        POOL.mark_suspect()
+        db_status = "disconnected"
+
+    await send_response(send, 200, dumps({
+        "status": "healthy" if db_status == "connected" else "degraded",
+        "database": db_status,
+        "snapshot": snapshot_id(),
+        "pool": POOL.info(),
+        "cache": CACHE.info(),
+        "queries": {'threads': QUERY_THREADS, 'timeout': REQUEST_TIMEOUT, **stats},
+        "version": "1.0.0"
+    }))
+
+
+async def get_alerts(request, send):
+    await query_response(request, send, lambda conn: queries.rule_alerts(
+        conn, **request_params(request, ALERTS_PARAMS)), cache_params=ALERTS_PARAMS)
+
+
+async def export_alerts(request, send):
+    params = request_params(request, EXPORT_PARAMS)
+    try:
+        reader = await run_blocking(request, lambda conn: (conn, queries.open_alert_export(conn, **params)),
+                                    close=False)
+    except RequestAborted as e:
+        return await aborted_response(send, e)
+    except QueryError as e:
+        return await send_response(send, e.status, error_body(str(e)))
+    except Exception as e:
+        return await send_response(send, db_error_status(e), error_body(str(e)))
+
+    conn, reader = reader
+    fmt = params['format']
+    chunks = export_chunks(conn, reader, fmt)
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', EXPORT_FORMATS[fmt].encode()),
+        (b'content-disposition', f'attachment; filename="rule_alerts_{POOL.version()}.{fmt}"'.encode()),
+        (b'access-control-allow-origin', b'*'),
+    ]})
+
+    # Encode batches on the query pool; stop (and interrupt) when the client goes away
+    disconnect = asyncio.ensure_future(wait_disconnect(request['receive']))
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            chunk = loop.run_in_executor(QUERY_EXECUTOR, next, chunks, None)
+            done, _ = await asyncio.wait({chunk, disconnect}, timeout=REQUEST_TIMEOUT,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if chunk not in done:
+                conn.interrupt()
+                chunk.add_done_callback(_discard)
+                stats['disconnects' if done else 'timeouts'] += 1
+                break
+            data = chunk.result()
+            if data is None:
+                break
+            await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+    finally:
+        disconnect.cancel()
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def get_ml_alerts(request, send):
+    await query_response(request, send, lambda conn: queries.ml_alerts(
+        conn, **request_params(request, ML_ALERTS_PARAMS)), cache_params=ML_ALERTS_PARAMS)
+
+
+async def get_ml_explanation(request, send, row_id):
+    await query_response(request, send, lambda conn: queries.ml_explanation(
+        conn, int(row_id), **request_params(request, EXPLANATION_PARAMS)))
+
+
+async def get_customer_profile(request, send, client_id):
+    await query_response(request, send, queries.customer_profile, client_id)
+
+
+async def get_customer_transactions(request, send, client_id):
+    await query_response(request, send, lambda conn: queries.customer_transactions(
+        conn, client_id, **request_params(request, TRANSACTIONS_PARAMS)))
+
+
+async def read_body(receive):
+    """
+    Request body bytes, None when larger than MAX_BODY_BYTES
+    """
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise RequestAborted('disconnect')
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_BYTES:
+            return None
+        if not message.get('more_body'):
+            return body
+
+
+async def get_customer_profiles(request, send):
+    try:
+        body = await read_body(request['receive'])
+    except RequestAborted as e:
+        return await aborted_response(send, e)
+    if body is None:
+        return await send_response(send, 413, error_body(f"Body larger than {MAX_BODY_BYTES} bytes"))
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        payload = None
+    await query_response(request, send, queries.customers_batch, payload)
+
+
+async def get_statistics(request, send):
+    await query_response(request, send, queries.statistics, cache_params={})
+
+
+async def get_metrics(request, send):
+    extra = metrics.pool_cache_metrics(POOL, CACHE) + [
+        ('aml_api_queries_running', 'gauge', "Queries running on the query thread pool", stats['running']),
+        ('aml_api_query_timeouts_total', 'counter', "Requests answered 504 (query interrupted)",
+         stats['timeouts']),
+        ('aml_api_client_disconnects_total', 'counter', "Queries interrupted by a client disconnect",
+         stats['disconnects']),
+    ]
+    await send_response(send, 200, metrics.render(extra), content_type=metrics.CONTENT_TYPE)
+
+
+ROUTES = [
+    ('GET', re.compile(r'/api/v1/health'), health_check),
+    ('GET', re.compile(r'/api/v1/alerts'), get_alerts),
+    ('GET', re.compile(r'/api/v1/alerts/export'), export_alerts),
+    ('GET', re.compile(r'/api/v1/alerts/ml'), get_ml_alerts),
+    ('GET', re.compile(r'/api/v1/alerts/ml/(\d+)/explanation'), get_ml_explanation),
+    ('GET', re.compile(r'/api/v1/customer/([^/]+)'), get_customer_profile),
+    ('GET', re.compile(r'/api/v1/customer/([^/]+)/transactions'), get_customer_transactions),
+    ('POST', re.compile(r'/api/v1/customers:batch'), get_customer_profiles),
+    ('GET', re.compile(r'/api/v1/stats'), get_statistics),
+    ('GET', re.compile(r'/metrics'), get_metrics),
+]
+
+
+# ============================================
+# ASGI ENTRYPOINT
+# ============================================
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            QUERY_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+            HEALTH_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    stats['requests'] += 1
+    request = {
+        'path': scope['path'],
+        'query': parse_qs(scope.get('query_string', b'').decode()),
+        'headers': {name.decode().lower(): value.decode() for name, value in scope.get('headers', [])},
+        'receive': receive,
+    }
+
+    # Request latency per handler (same labels as the Flask app)
+    start = time.perf_counter()
+    handler_name, status = 'not_found', 'aborted'
+
+    async def send_recorded(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = str(message['status'])
+        await send(message)
+
+    try:
+        for method, pattern, handler in ROUTES:
+            match = pattern.fullmatch(scope['path'])
+            if match:
+                if scope['method'] != method:
+                    return await send_response(send_recorded, 405, error_body("Method not allowed"))
+                handler_name = handler.__name__
+                return await handler(request, send_recorded, *match.groups())
+
+        await send_response(send_recorded, 404, error_body("Not found"))
+    finally:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, (handler_name, scope['method'], status))
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        print("[ERROR] uvicorn is not installed: pip install uvicorn (or run asgi_app:app on any ASGI server)")
+        sys.exit(1)
+
+    print("=" * 60)
+    print("AML Monitoring Engine - ASGI API")
+    print("=" * 60)
+    print(f"Query threads: {QUERY_THREADS}  |  Request timeout: {REQUEST_TIMEOUT:g}s")
+    print("Endpoints: same as app.py (/api/v1/*)")
+    print("=" * 60)
+    print("\nStarting server on http://localhost:8000")
+    print("Press CTRL+C to stop\n")
+
+    uvicorn.run(app, host='0.0.0.0', port=8000)
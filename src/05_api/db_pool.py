@@ -0,0 +1,154 @@
+"""
+Read Connection Pool
+One long-lived read-only DuckDB connection per API worker process
+
+Opening a connection per request throws away DuckDB's catalog, buffer cache and
+metadata every time. The pool keeps a single read-only connection per process
+and hands out a cursor per request (cursors share the connection's database
+instance and are safe to use from the request's thread).
+
+The connection is reopened when:
+- the process id changed (gunicorn forks workers after importing the app)
+- a new snapshot was published (data/snapshots/CURRENT points elsewhere)
+- a health check fails (checked every health_interval seconds, or right away
+  after a request failed with a connection-level error)
+
+A replaced connection is not closed explicitly: requests still running on its
+cursors finish on the old snapshot, and it is released with the last cursor.
+
+Only published snapshots are pooled. Until data/snapshots/CURRENT exists the
+readers fall back to the pipeline database, and a connection held open there
+would keep DuckDB's file lock and stop the pipeline (and so the first publish)
+from opening it read-write. In that state every request opens its own
+connection and closes it when done; while the pipeline holds the lock the
+request fails with DatabaseUnavailable (503).
+"""
+
+import os
+import sys
+import time
+import threading
+
+import duckdb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from db import connect
+from snapshots import current_snapshot, snapshot_id
+
+# Errors after which the connection itself is suspect (vs. a bad query)
+CONNECTION_ERRORS = (duckdb.ConnectionException, duckdb.IOException, duckdb.FatalException,
+                     duckdb.InternalException)
+
+
+class DatabaseUnavailable(Exception):
+    """Nothing published yet and the pipeline database is locked by a writer"""
+
+
+def _poolable(path):
+    return snapshot_id(path) != 'live'
+
+
+class ReadPool:
+    def __init__(self, resolve_path=current_snapshot, health_interval=30.0, path_check_interval=1.0):
+        self.resolve_path = resolve_path
+        self.health_interval = health_interval
+        self.path_check_interval = path_check_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._path = None
+        self._checked_at = 0.0
+        self._path_checked_at = 0.0
+        self._suspect = False
+        self.stats = {'connects': 0, 'reconnects': 0, 'cursors': 0, 'health_failures': 0, 'unpooled': 0}
+
+    def _open(self, path):
+        reconnect = self._conn is not None and self._pid == os.getpid()
+        self._pid = os.getpid()
+        self._path = path
+        self._suspect = False
+        if not _poolable(path):
+            self._conn = None  # per-request connections only (see module docstring)
+            return
+        self._conn = connect(path, read_only=True)
+        self._checked_at = time.monotonic()
+        self.stats['connects'] += 1
+        self.stats['reconnects'] += reconnect
+
+    def _healthy(self):
+        try:
+            self._conn.execute("SELECT 1").fetchone()
+            return True
+        except duckdb.Error:
+            self.stats['health_failures'] += 1
+            return False
+
+    def connection(self):
+        """
+        The worker's connection, (re)opened as needed; None while nothing is published
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._conn is None or self._pid != os.getpid():
+                if self._pid != os.getpid():
+                    self.stats = dict.fromkeys(self.stats, 0)  # forked: fresh per-worker counters
+                self._conn = None
+                self._open(self.resolve_path())
+                self._path_checked_at = now
+                return self._conn
+
+            if now - self._path_checked_at >= self.path_check_interval:
+                self._path_checked_at = now
+                path = self.resolve_path()
+                if path != self._path:
+                    self._open(path)
+                    return self._conn
+
+            if self._suspect or now - self._checked_at >= self.health_interval:
+                self._checked_at = now
+                if not self._healthy():
+                    self._open(self.resolve_path())
+                self._suspect = False
+
+            return self._conn
+
+    def cursor(self):
+        """
+        A new cursor for one request; close it when the request is done
+        """
+        conn = self.connection()
+        if conn is None:
+            return self._unpooled(self._path)
+        try:
+            cursor = conn.cursor()
+        except duckdb.Error:
+            self.mark_suspect()
+            cursor = self.connection().cursor()
+        self.stats['cursors'] += 1
+        return cursor
+
+    def _unpooled(self, path):
+        # A connection serves as the request's cursor; closing it releases the file lock
+        try:
+            conn = connect(path, read_only=True)
+        except duckdb.IOException as e:
+            raise DatabaseUnavailable(f"No snapshot published yet and the pipeline database is busy: {e}") from e
+        self.stats['unpooled'] += 1
+        return conn
+
+    def version(self):
+        """
+        Snapshot id the worker's connection currently reads ('live' before the first publish)
+        """
+        self.connection()
+        return snapshot_id(self._path)
+
+    def mark_suspect(self):
+        """
+        Force a health check before the next cursor (after a connection-level error)
+        """
+        self._suspect = True
+
+    def info(self):
+        return {'pid': self._pid, 'path': self._path, 'pooled': self._conn is not None, **self.stats}
@@ -0,0 +1,85 @@
+"""
+Streaming Export
+Encode a DuckDB result as NDJSON, CSV or Arrow IPC chunks while it is fetched
+
+The query result is read as an Arrow record batch stream (to_arrow_reader), so
+at most one batch of rows is materialized at a time no matter how many rows
+the export covers. Each generator yields the encoded bytes of one batch and is
+meant to be handed to a streaming HTTP response.
+"""
+
+import io
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+from serialization import dumps, to_records
+
+# Rows fetched and encoded per chunk
+EXPORT_BATCH_ROWS = 10_000
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+def _drain(sink):
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+def ndjson_chunks(reader):
+    for batch in reader:
+        rows = to_records(pa.Table.from_batches([batch]))
+        if rows:
+            yield b'\n'.join(dumps(row) for row in rows) + b'\n'
+
+
+def csv_chunks(reader):
+    header = True
+    for batch in reader:
+        sink = io.BytesIO()
+        pa_csv.write_csv(pa.Table.from_batches([batch]), sink,
+                         write_options=pa_csv.WriteOptions(include_header=header))
+        header = False
+        yield sink.getvalue()
+    if header:
+        # No rows: still send the header line
+        sink = io.BytesIO()
+        pa_csv.write_csv(reader.schema.empty_table(), sink)
+        yield sink.getvalue()
+
+
+def arrow_chunks(reader):
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            yield _drain(sink)
+    yield _drain(sink)
+
+
+ENCODERS = {'ndjson': ndjson_chunks, 'csv': csv_chunks, 'arrow': arrow_chunks}
+
+
+def open_export(cursor, query, params, batch_rows=EXPORT_BATCH_ROWS):
+    """
+    Run query and return its record batch reader (query errors surface here,
+    before any response bytes are sent)
+    """
+    return cursor.execute(query, params).to_arrow_reader(batch_rows)
+
+
+def export_chunks(cursor, reader, fmt):
+    """
+    Yield the reader's rows encoded as fmt, one batch at a time.
+    The cursor is closed when the stream ends or the client goes away.
+    """
+    try:
+        yield from ENCODERS[fmt](reader)
+    finally:
+        cursor.close()
@@ -0,0 +1,197 @@
+"""
+API Metrics
+Prometheus histograms recorded per thread and merged when /metrics is scraped
+
+Recording touches only the calling thread's own counters (no lock, no
+shared writes): each thread gets a private {(metric, labels): series} store
+on first use, where a series is the bucket counts plus the sum. A scrape
+merges the stores of all threads of the process, and stores of threads that
+have exited are folded into a retired total so per-request threads don't
+accumulate. Counters start from zero in each forked worker.
+
+Histograms:
+- aml_api_request_duration_seconds{handler, method, status}: whole request
+- aml_api_query_duration_seconds: DuckDB execute + Arrow fetch (fetch_table)
+- aml_api_query_rows: rows returned per query
+- aml_api_serialization_duration_seconds{stage}: Arrow -> Python values
+  (convert) and JSON encoding (encode)
+
+Pool and cache counters/gauges are read from ReadPool / ResponseCache at
+scrape time (pool_cache_metrics).
+"""
+
+import os
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10_000, 100_000, 1_000_000)
+
+_local = threading.local()
+_lock = threading.Lock()
+_stores = []     # (thread, store) of live recording threads
+_retired = {}    # merged series of exited threads
+_histograms = []
+
+
+def _merge(into, store):
+    for key, series in store.items():
+        total = into.get(key)
+        if total is None:
+            into[key] = list(series)
+        else:
+            for i, value in enumerate(series):
+                total[i] += value
+
+
+def _retire_dead():
+    # Caller holds _lock
+    alive = []
+    for thread, store in _stores:
+        if thread.is_alive():
+            alive.append((thread, store))
+        else:
+            _merge(_retired, store)
+    _stores[:] = alive
+
+
+def _thread_store():
+    store = getattr(_local, 'store', None)
+    if store is None:
+        store = _local.store = {}
+        with _lock:
+            _retire_dead()
+            _stores.append((threading.current_thread(), store))
+    return store
+
+
+def _reset():
+    global _lock
+    _lock = threading.Lock()  # may have been held by another thread at fork
+    _stores.clear()
+    _retired.clear()
+    _local.__dict__.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset)  # fresh counters per worker
+
+
+class Histogram:
+    """Cumulative histogram; observe() writes only to the calling thread's store"""
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        _histograms.append(self)
+
+    def observe(self, value, labels=()):
+        store = _thread_store()
+        key = (self.name, labels)
+        series = store.get(key)
+        if series is None:
+            # bucket counts (last one is +Inf), then the sum
+            series = store[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+
+REQUEST_SECONDS = Histogram('aml_api_request_duration_seconds', "Request latency by handler",
+                            LATENCY_BUCKETS, ('handler', 'method', 'status'))
+QUERY_SECONDS = Histogram('aml_api_query_duration_seconds', "DuckDB query execution and Arrow fetch time",
+                          LATENCY_BUCKETS)
+QUERY_ROWS = Histogram('aml_api_query_rows', "Rows returned per DuckDB query", ROW_BUCKETS)
+SERIALIZATION_SECONDS = Histogram('aml_api_serialization_duration_seconds',
+                                  "Result conversion (Arrow to Python) and JSON encoding time",
+                                  LATENCY_BUCKETS, ('stage',))
+
+
+def snapshot():
+    """
+    {(metric, labels): [bucket counts..., sum]} over all threads of this process
+    """
+    with _lock:
+        _retire_dead()
+        merged = {key: list(series) for key, series in _retired.items()}
+        stores = [store for _, store in _stores]
+    for store in stores:
+        _merge(merged, store.copy())
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def pool_cache_metrics(pool, cache):
+    """
+    Connection pool and response cache counters/gauges as
+    [(name, type, documentation, value)]
+    """
+    pool_stats = pool.info()
+    cache_stats = cache.info()
+    lookups = cache_stats['hits'] + cache_stats['misses']
+    return [
+        ('aml_api_pool_connects_total', 'counter', "Connections opened by this worker",
+         pool_stats['connects']),
+        ('aml_api_pool_reconnects_total', 'counter', "Connections reopened (publish or failed health check)",
+         pool_stats['reconnects']),
+        ('aml_api_pool_cursors_total', 'counter', "Cursors handed out", pool_stats['cursors']),
+        ('aml_api_pool_health_failures_total', 'counter', "Failed connection health checks",
+         pool_stats['health_failures']),
+        ('aml_api_pool_connected', 'gauge', "1 while the worker holds an open snapshot connection",
+         int(pool_stats['pooled'])),
+        ('aml_api_pool_unpooled_total', 'counter',
+         "Per-request connections to the pipeline database (nothing published yet)", pool_stats['unpooled']),
+        ('aml_api_cache_entries', 'gauge', "Cached responses", cache_stats['entries']),
+        ('aml_api_cache_hits_total', 'counter', "Response cache hits", cache_stats['hits']),
+        ('aml_api_cache_misses_total', 'counter', "Response cache misses", cache_stats['misses']),
+        ('aml_api_cache_evictions_total', 'counter', "Entries evicted (LRU)", cache_stats['evictions']),
+        ('aml_api_cache_not_modified_total', 'counter', "304 responses to If-None-Match",
+         cache_stats['not_modified']),
+        ('aml_api_cache_hit_ratio', 'gauge', "Hits / lookups since the worker started",
+         cache_stats['hits'] / lookups if lookups else 0.0),
+    ]
+
+
+def render(extra=()):
+    """
+    Prometheus text exposition of the histograms plus extra
+    [(name, type, documentation, value)] samples
+    """
+    samples = snapshot()
+    lines = []
+    for histogram in _histograms:
+        lines.append(f"# HELP {histogram.name} {histogram.documentation}")
+        lines.append(f"# TYPE {histogram.name} histogram")
+        series_by_labels = sorted((labels, series) for (name, labels), series in samples.items()
+                                  if name == histogram.name)
+        for labels, series in series_by_labels:
+            pairs = list(zip(histogram.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format(float(bound))
+                lines.append(f"{histogram.name}_bucket{_labels(pairs + [('le', le)])} {cumulative}")
+            lines.append(f"{histogram.name}_sum{_labels(pairs)} {_format(series[-1])}")
+            lines.append(f"{histogram.name}_count{_labels(pairs)} {cumulative}")
+
+    for name, metric_type, documentation, value in extra:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"{name} {_format(value)}")
+    return ('\n'.join(lines) + '\n').encode()
@@ -0,0 +1,359 @@
+"""
+API Queries
+Endpoint logic shared by the Flask app (app.py) and the ASGI app (asgi_app.py)
+
+Each function takes a DuckDB cursor plus the endpoint's parsed parameters and
+returns the JSON payload as plain Python data (or raises QueryError for a
+4xx). The web layers only parse requests, hand out cursors and encode
+responses, so both servers return identical bodies.
+
+Parameters are declared per endpoint as {name: (type, default)} and parsed
+with parse_params(); the parsed values double as the response cache key.
+"""
+
+import os
+import sys
+import base64
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '03_ml_scoring'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from export import EXPORT_FORMATS, open_export
+from serialization import ORIENTS, fetch_table, payload, to_records
+from profiles import PROFILE_COLUMNS, PROFILE_QUERY
+from system_stats import RISK_BANDS, read_system_stats
+
+# Upper bound on rows returned per request (responses are built in memory)
+MAX_LIMIT = 1000
+
+# Upper bound on customer IDs per batch lookup
+MAX_BATCH_IDS = 1000
+
+# Risk score of each rule's alerts (rule_alerts stores the rule, not a score)
+RULE_RISK_SCORES = {
+    'Structuring_Detection': 80,
+    'Beneficiary_Rotation': 75,
+    'Velocity_Abuse': 70,
+    'Round_Amount_Pattern': 60,
+}
+RULE_RISK_SCORE_SQL = "CASE rule_name " + " ".join(
+    f"WHEN '{rule}' THEN {score}" for rule, score in RULE_RISK_SCORES.items()
+) + " ELSE 50 END"
+
+ALERTS_PARAMS = {'alert_type': (str, None), 'min_risk_score': (int, 0), 'limit': (int, 100),
+                 'cursor': (str, None), 'orient': (str, 'records')}
+EXPORT_PARAMS = {'format': (str, 'ndjson'), 'alert_type': (str, None), 'min_risk_score': (int, 0)}
+ML_ALERTS_PARAMS = {'limit': (int, 50), 'orient': (str, 'records')}
+EXPLANATION_PARAMS = {'model_version': (str, None)}
+TRANSACTIONS_PARAMS = {'from_step': (int, None), 'to_step': (int, None), 'limit': (int, 100),
+                       'cursor': (str, None), 'orient': (str, 'records')}
+
+
+class QueryError(Exception):
+    """Invalid request or missing resource (mapped to an HTTP 4xx)"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_params(spec, get):
+    """
+    Parse query parameters declared as {name: (type, default)}. get(name)
+    returns the raw string or None; missing or unparseable values fall back
+    to the default (like Flask's request.args.get(type=...)).
+    """
+    parsed = {}
+    for name, (cast, default) in spec.items():
+        raw = get(name)
+        try:
+            parsed[name] = default if raw is None else cast(raw)
+        except ValueError:
+            parsed[name] = default
+    return parsed
+
+
+def _check_orient(orient):
+    if orient not in ORIENTS:
+        raise QueryError(f"Unknown orient, expected one of {list(ORIENTS)}")
+
+
+def alerts_query(alert_type=None, min_risk_score=0, after=None):
+    """
+    Rule alerts query ordered by (risk_score, alert_id) descending, starting
+    after the (risk_score, alert_id) key `after` when given. Returns (query, params).
+    """
+    query = f"""
+        SELECT * FROM (
+            SELECT
+                alert_id,
+                customer_id,
+                rule_name as alert_type,
+                {RULE_RISK_SCORE_SQL} as risk_score,
+                detection_date,
+                amount,
+                description
+            FROM rule_alerts
+        )
+        WHERE risk_score >= ?
+    """
+    params = [min_risk_score]
+
+    if alert_type:
+        query += " AND alert_type = ?"
+        params.append(alert_type)
+
+    if after:
+        query += " AND (risk_score, alert_id) < (?, ?)"
+        params.extend(after)
+
+    query += " ORDER BY risk_score DESC, alert_id DESC"
+    return query, params
+
+
+def encode_cursor(sort_value, row_key):
+    return base64.urlsafe_b64encode(f"{sort_value}:{row_key}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    (sort_value, row_key) of a page cursor, e.g. (risk_score, alert_id), None
+    for the first page; ValueError if malformed
+    """
+    if not cursor:
+        return None
+    try:
+        sort_value, row_key = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return int(sort_value), int(row_key)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def health(conn):
+    conn.execute("SELECT 1").fetchone()
+
+
+def rule_alerts(conn, alert_type=None, min_risk_score=0, limit=100, cursor=None, orient='records'):
+    """
+    One keyset page of rule alerts, highest risk first
+    """
+    limit = min(limit, MAX_LIMIT)
+    _check_orient(orient)
+    try:
+        after = decode_cursor(cursor)
+    except ValueError:
+        raise QueryError("Invalid cursor")
+
+    query, params = alerts_query(alert_type, min_risk_score, after)
+    query += " LIMIT ?"
+    params.append(limit)
+
+    alerts = fetch_table(conn, query, params)
+
+    next_cursor = None
+    if alerts.num_rows == limit:
+        next_cursor = encode_cursor(alerts['risk_score'][-1].as_py(), alerts['alert_id'][-1].as_py())
+
+    return {
+        "count": alerts.num_rows,
+        "alerts": payload(alerts, orient),
+        "next_cursor": next_cursor
+    }
+
+
+def open_alert_export(conn, format='ndjson', alert_type=None, min_risk_score=0):
+    """
+    Record batch reader over all matching rule alerts (see export.py)
+    """
+    if format not in EXPORT_FORMATS:
+        raise QueryError(f"Unknown format, expected one of {sorted(EXPORT_FORMATS)}")
+    query, params = alerts_query(alert_type, min_risk_score)
+    return open_export(conn, query, params)
+
+
+def ml_alerts(conn, limit=50, orient='records'):
+    limit = min(limit, MAX_LIMIT)
+    _check_orient(orient)
+
+    query = "SELECT * FROM ml_alerts ORDER BY anomaly_score DESC LIMIT ?"
+    anomalies = fetch_table(conn, query, [limit])
+
+    return {
+        "count": anomalies.num_rows,
+        "anomalies": payload(anomalies, orient)
+    }
+
+
+def ml_explanation(conn, row_id, model_version=None):
+    query = "SELECT * FROM ml_explanations WHERE row_id = ?"
+    params = [row_id]
+    if model_version:
+        query += " AND model_version = ?"
+        params.append(model_version)
+    query += " ORDER BY model_version DESC LIMIT 1"
+
+    explanation = to_records(fetch_table(conn, query, params))
+    if not explanation:
+        raise QueryError("Explanation not found", 404)
+
+    record = explanation[0]
+    contributions = {
+        key[len('contrib_'):]: round(value, 4)
+        for key, value in record.items() if key.startswith('contrib_')
+    }
+
+    return {
+        "row_id": row_id,
+        "model_version": record['model_version'],
+        "top_feature": record['top_feature'],
+        "contributions": contributions
+    }
+
+
+def customer_profile(conn, client_id):
+    # Customer profile: index point lookup on the materialized profiles
+    profile = to_records(fetch_table(conn, PROFILE_QUERY, [client_id]))
+    if not profile:
+        raise QueryError("Customer not found", 404)
+
+    # Associated alerts
+    alerts_query = "SELECT * FROM rule_alerts WHERE customer_id = ? ORDER BY alert_id"
+    alerts = to_records(fetch_table(conn, alerts_query, [client_id]))
+
+    return {
+        "client_id": client_id,
+        "profile": profile[0],
+        "alerts": alerts,
+        "alert_count": len(alerts)
+    }
+
+
+def customer_transactions(conn, client_id, from_step=None, to_step=None, limit=100, cursor=None,
+                          orient='records'):
+    """
+    One keyset page of a customer's transactions in (step, row_id) order,
+    optionally restricted to from_step <= step <= to_step. transactions is
+    stored sorted by (nameOrig, step), so the nameOrig filter reads only the
+    few row groups whose min/max range contains the customer.
+    """
+    limit = min(limit, MAX_LIMIT)
+    _check_orient(orient)
+    try:
+        after = decode_cursor(cursor)
+    except ValueError:
+        raise QueryError("Invalid cursor")
+
+    query = "SELECT rowid as row_id, * FROM transactions WHERE nameOrig = ?"
+    params = [client_id]
+    if from_step is not None:
+        query += " AND step >= ?"
+        params.append(from_step)
+    if to_step is not None:
+        query += " AND step <= ?"
+        params.append(to_step)
+    if after:
+        query += " AND (step, rowid) > (?, ?)"
+        params.extend(after)
+    query += " ORDER BY step, rowid LIMIT ?"
+    params.append(limit)
+
+    transactions = fetch_table(conn, query, params)
+
+    next_cursor = None
+    if transactions.num_rows == limit:
+        next_cursor = encode_cursor(transactions['step'][-1].as_py(), transactions['row_id'][-1].as_py())
+
+    return {
+        "client_id": client_id,
+        "count": transactions.num_rows,
+        "transactions": payload(transactions, orient),
+        "next_cursor": next_cursor
+    }
+
+
+# Profiles and alerts of a list of customers in one statement: the IDs are
+# unnested into a positioned list and joined against customer_profiles and
+# the (once-scanned) rule_alerts, in input order
+BATCH_QUERY = f"""
+    WITH ids AS (
+        SELECT UNNEST(ids) as requested_id, generate_subscripts(ids, 1) as position
+        FROM (SELECT ?::VARCHAR[] as ids)
+    ),
+    customer_alerts AS (
+        SELECT customer_id, LIST(r ORDER BY r.alert_id) as alerts
+        FROM rule_alerts r
+        WHERE customer_id IN (SELECT requested_id FROM ids)
+        GROUP BY customer_id
+    )
+    SELECT ids.position, ids.requested_id, {PROFILE_COLUMNS}, a.alerts
+    FROM ids
+    LEFT JOIN customer_profiles p ON p.client_id = ids.requested_id
+    LEFT JOIN customer_alerts a ON a.customer_id = ids.requested_id
+    ORDER BY ids.position
+"""
+
+
+def customers_batch(conn, body):
+    """
+    Profiles and alerts for {"client_ids": [...]}, one entry per requested ID
+    in input order (unknown IDs come back with found=false)
+    """
+    client_ids = body.get('client_ids') if isinstance(body, dict) else None
+    if not isinstance(client_ids, list) or not all(isinstance(c, str) for c in client_ids):
+        raise QueryError('Expected a JSON body {"client_ids": ["C123", ...]}')
+    if len(client_ids) > MAX_BATCH_IDS:
+        raise QueryError(f"At most {MAX_BATCH_IDS} client_ids per request, got {len(client_ids)}")
+    if not client_ids:
+        return {"count": 0, "customers": []}
+
+    customers = []
+    for row in to_records(fetch_table(conn, BATCH_QUERY, [client_ids])):
+        row.pop('position')
+        client_id = row.pop('requested_id')
+        alerts = row.pop('alerts') or []
+        found = row['client_id'] is not None
+        customers.append({
+            "client_id": client_id,
+            "found": found,
+            "profile": row if found else None,
+            "alerts": alerts,
+            "alert_count": len(alerts)
+        })
+
+    return {"count": len(customers), "customers": customers}
+
+
+def _scanned_statistics(conn):
+    # Databases published before system_stats existed
+    stats = {}
+
+    stats['total_transactions'] = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    stats['total_rule_alerts'] = conn.execute("SELECT COUNT(*) FROM rule_alerts").fetchone()[0]
+    stats['total_ml_alerts'] = conn.execute("SELECT COUNT(*) FROM ml_alerts").fetchone()[0]
+    stats['high_risk_alerts'] = conn.execute("SELECT COUNT(*) FROM ml_alerts WHERE risk_score >= 80").fetchone()[0]
+    return stats
+
+
+def statistics(conn):
+    """
+    Headline counters: one row of the pipeline-maintained system_stats
+    """
+    row = read_system_stats(conn)
+    if row is None:
+        stats = _scanned_statistics(conn)
+    else:
+        stats = {
+            'total_transactions': row['total_transactions'],
+            'total_rule_alerts': row['rule_alerts'],
+            'total_ml_alerts': row['ml_alerts'],
+            'high_risk_alerts': row['high_risk_alerts'],
+            'alerts_by_rule': dict(row['alerts_by_rule']),
+            'ml_anomalies': row['ml_anomalies'],
+            'risk_bands': {name: row[f'risk_{name}'] for name, _, _ in RISK_BANDS},
+            'last_step': row['last_step'],
+        }
+
+    total_alerts = stats['total_rule_alerts'] + stats['total_ml_alerts']
+    stats['alert_rate'] = round(total_alerts / stats['total_transactions'] * 100, 4) if stats['total_transactions'] > 0 else 0
+
+    return stats
@@ -0,0 +1,78 @@
+"""
+Response Cache
+In-process LRU cache of JSON response bodies, keyed by data version
+
+Read endpoints only change when the pipeline publishes a new snapshot, so a
+response is fully determined by (endpoint, normalized query params, snapshot
+id). Each worker process keeps the most recently used bodies together with an
+ETag (hash of the body) so polling clients can revalidate with If-None-Match
+and get a 304 without a query or a body.
+
+Entries belong to one data version: the first lookup with a newer snapshot id
+drops everything cached for the previous one.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def make_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class ResponseCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'not_modified': 0}
+
+    def _switch_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.stats['invalidations'] += 1
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key, version):
+        """
+        (body, etag) cached for key under this data version, or None
+        """
+        with self._lock:
+            self._switch_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry
+
+    def put(self, key, version, body):
+        """
+        Store a response body; returns (body, etag)
+        """
+        entry = (body, make_etag(body))
+        if self.max_entries <= 0:
+            return entry
+        with self._lock:
+            # Computed against a version that has been replaced meanwhile: don't keep it
+            if version != self._version:
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+    def info(self):
+        return {'version': self._version, 'entries': len(self._entries),
+                'max_entries': self.max_entries, **self.stats}
@@ -1,13 +1,21 @@
 
 
 
+import os
+import sys
 import streamlit as st
-import duckdb
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '03_ml_scoring'))
+from snapshots import current_snapshot
+from db import connect
+from profiles import PROFILE_QUERY
+from system_stats import RISK_BANDS, read_system_stats
+
 # ============================================
 # PAGE CONFIG
 # ============================================
@@ -21,11 +29,12 @@ st.set_page_config(
 # ============================================
 # DATABASE CONNECTION
 # ============================================
-@st.cache_resource
-def get_connection():
-    return duckdb.connect('data/fraud_data.duckdb', read_only=True)
+@st.cache_resource(max_entries=2)
+def get_connection(path):
+    # One connection per published snapshot; a new publish opens a new one
+    return connect(path, read_only=True)
 
-conn = get_connection()
+conn = get_connection(current_snapshot())
 
 # ============================================
 # SIDEBAR
@@ -47,14 +56,19 @@ st.sidebar.info(f"Last updated: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
 # ============================================
 @st.cache_data(ttl=60)
 def get_stats():
+    # One row of pipeline-maintained counters (system_stats)
+    stats = read_system_stats(conn)
+    if stats is not None:
+        return stats
+    # Database published before system_stats existed
     query = """
     SELECT 
         COUNT(*) as total_transactions,
         (SELECT COUNT(*) FROM rule_alerts) as rule_alerts,
-        (SELECT COUNT(*) FROM ml_scores WHERE anomaly_score >= 0.5) as ml_alerts
+        (SELECT COUNT(*) FROM ml_scores WHERE anomaly_score >= 0.5) as ml_anomalies
     FROM transactions
     """
-    return conn.execute(query).fetchdf()
+    return conn.execute(query).fetchdf().iloc[0].to_dict()
 
 @st.cache_data(ttl=60)
 def get_rule_alerts(limit=50):
@@ -74,15 +88,26 @@ def get_rule_alerts(limit=50):
 
 @st.cache_data(ttl=60)
 def get_ml_alerts(limit=50):
+    # ml_explanations only exists once the explain step has run
+    has_explanations = conn.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = 'ml_explanations'"
+    ).fetchone()[0]
+    driver = "e.top_feature" if has_explanations else "NULL"
+    explanations = (
+        "LEFT JOIN ml_explanations e ON e.row_id = m.row_id AND e.model_version = m.model_version"
+        if has_explanations else ""
+    )
     query = f"""
     SELECT 
         m.customer_id,
         m.step,
         t.type,
         ROUND(t.amount, 2) as amount,
-        ROUND(m.anomaly_score, 4) as anomaly_score
+        ROUND(m.anomaly_score, 4) as anomaly_score,
+        {driver} as main_driver
     FROM ml_scores m
-    JOIN transactions t ON m.step = t.step AND m.customer_id = t.nameOrig
+    JOIN transactions t ON t.rowid = m.row_id
+    {explanations}
     WHERE m.anomaly_score >= 0.5
     ORDER BY m.anomaly_score DESC
     LIMIT {limit}
@@ -91,19 +116,9 @@ def get_ml_alerts(limit=50):
 
 @st.cache_data(ttl=60)
 def get_customer_profile(customer_id):
-    query = f"""
-    SELECT 
-        nameOrig as customer_id,
-        COUNT(*) as total_transactions,
-        ROUND(SUM(amount), 2) as total_amount,
-        ROUND(AVG(amount), 2) as avg_amount,
-        ROUND(MAX(amount), 2) as max_amount,
-        COUNT(DISTINCT type) as transaction_types
-    FROM transactions
-    WHERE nameOrig = '{customer_id}'
-    GROUP BY nameOrig
-    """
-    return conn.execute(query).fetchdf()
+    # Point lookup on the materialized customer_profiles (same query as the API)
+    profile = conn.execute(PROFILE_QUERY, [customer_id]).fetchdf()
+    return profile.rename(columns={'total_volume': 'total_amount'})
 
 @st.cache_data(ttl=60)
 def get_customer_alerts(customer_id):
@@ -121,6 +136,10 @@ def get_customer_alerts(customer_id):
 
 @st.cache_data(ttl=60)
 def get_alert_distribution():
+    stats = get_stats()
+    if 'alerts_by_rule' in stats:
+        by_rule = pd.DataFrame(list(stats['alerts_by_rule'].items()), columns=['rule_name', 'count'])
+        return by_rule.sort_values('count', ascending=False, ignore_index=True)
     query = """
     SELECT 
         rule_name,
@@ -133,6 +152,11 @@ def get_alert_distribution():
 
 @st.cache_data(ttl=60)
 def get_risk_distribution():
+    stats = get_stats()
+    if 'risk_critical' in stats:
+        bands = pd.DataFrame([(name.capitalize(), stats[f'risk_{name}']) for name, _, _ in RISK_BANDS],
+                             columns=['risk_level', 'count'])
+        return bands[bands['count'] > 0]
     query = """
     SELECT 
         CASE 
@@ -171,24 +195,24 @@ if page == "Dashboard":
     with col1:
         st.metric(
             label="Total Transactions",
-            value=f"{stats['total_transactions'].iloc[0]:,}"
+            value=f"{stats['total_transactions']:,}"
         )
     
     with col2:
         st.metric(
             label="Rule Alerts",
-            value=int(stats['rule_alerts'].iloc[0])
+            value=int(stats['rule_alerts'])
         )
     
     with col3:
         st.metric(
             label="ML Anomalies",
-            value=int(stats['ml_alerts'].iloc[0])
+            value=int(stats['ml_anomalies'])
         )
     
     with col4:
-        alert_rate = ((stats['rule_alerts'].iloc[0] + stats['ml_alerts'].iloc[0]) / 
-                      stats['total_transactions'].iloc[0] * 100)
+        alert_rate = ((stats['rule_alerts'] + stats['ml_anomalies']) / 
+                      stats['total_transactions'] * 100) if stats['total_transactions'] else 0
         st.metric(
             label="Alert Rate %",
             value=f"{alert_rate:.4f}%"
@@ -0,0 +1,107 @@
+"""
+Database Connections
+Resource profile applied to every DuckDB connection the project opens
+
+The profile is set once through environment variables:
+- AML_MEMORY_LIMIT:   DuckDB memory_limit (e.g. '24GB'); operators beyond it spill to disk
+- AML_THREADS:        DuckDB threads
+- AML_TEMP_DIR:       spill directory (default data/tmp when a memory limit is set)
+- AML_PYTHON_BUDGET:  memory budget for results pulled into pandas/numpy (e.g. '4GB').
+                      Python-side stages switch to chunked processing when the
+                      estimated result size exceeds it.
+
+Unset variables keep DuckDB's defaults (80% of RAM, all cores) and load results in one piece.
+"""
+
+import os
+import re
+import math
+
+import duckdb
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_TEMP_DIR = os.path.join(BASE_DIR, "data", "tmp")
+
+_UNITS = {'': 1, 'B': 1, 'KB': 1024, 'MB': 1024**2, 'GB': 1024**3, 'TB': 1024**4}
+
+
+def parse_size(text):
+    """
+    Bytes in a size string such as '512MB', '24GB' or '1.5 GiB' (None for empty)
+    """
+    if not text:
+        return None
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMGT]?)I?B?\s*', text.upper())
+    if not match:
+        raise ValueError(f"Invalid size: {text!r}")
+    number, unit = match.groups()
+    return int(float(number) * _UNITS[unit + 'B' if unit else ''])
+
+
+def resource_profile():
+    """
+    Current resource profile from the environment
+    """
+    memory_limit = os.environ.get('AML_MEMORY_LIMIT') or None
+    threads = os.environ.get('AML_THREADS')
+    return {
+        'memory_limit': memory_limit,
+        'threads': int(threads) if threads else None,
+        'temp_directory': os.environ.get('AML_TEMP_DIR') or (DEFAULT_TEMP_DIR if memory_limit else None),
+        'python_budget_bytes': parse_size(os.environ.get('AML_PYTHON_BUDGET')),
+    }
+
+
+def duckdb_config(memory_share=1):
+    """
+    DuckDB config dict for the profile. memory_share divides the memory limit
+    between processes that run side by side (e.g. sharded workers).
+    """
+    profile = resource_profile()
+    config = {}
+    if profile['memory_limit']:
+        config['memory_limit'] = f"{parse_size(profile['memory_limit']) // memory_share // 1024**2}MB"
+    if profile['threads']:
+        config['threads'] = profile['threads']
+    if profile['temp_directory']:
+        os.makedirs(profile['temp_directory'], exist_ok=True)
+        config['temp_directory'] = profile['temp_directory']
+    return config
+
+
+def connect(database=':memory:', read_only=False, memory_share=1):
+    """
+    duckdb.connect() with the resource profile applied
+    """
+    return duckdb.connect(database, read_only=read_only, config=duckdb_config(memory_share))
+
+
+def chunk_count(rows, bytes_per_row, memory_share=1):
+    """
+    Number of chunks needed to keep rows * bytes_per_row within the Python budget
+    (divided by memory_share, like duckdb_config). 1 = no chunking.
+    """
+    budget = resource_profile()['python_budget_bytes']
+    if not budget or not rows:
+        return 1
+    return max(1, math.ceil(rows * bytes_per_row / (budget // memory_share)))
+
+
+def memory_chunk_count(rows, bytes_per_row, memory_share=1):
+    """
+    Number of chunks needed to keep a DuckDB operator over rows * bytes_per_row
+    (e.g. a sort) within the memory limit. 1 = no limit set or it fits.
+    """
+    limit = parse_size(resource_profile()['memory_limit'])
+    if not limit or not rows:
+        return 1
+    return max(1, math.ceil(rows * bytes_per_row / (limit // memory_share)))
+
+
+def describe_profile():
+    profile = resource_profile()
+    budget = profile['python_budget_bytes']
+    return (f"memory_limit={profile['memory_limit'] or 'default'}, "
+            f"threads={profile['threads'] or 'default'}, "
+            f"temp_directory={profile['temp_directory'] or 'default'}, "
+            f"python_budget={f'{budget // 1024**2}MB' if budget else 'unlimited'}")
@@ -0,0 +1,143 @@
+"""
+Database Snapshots
+Published read-only copies of the pipeline database for API and dashboard readers
+
+The pipeline writes data/fraud_data.duckdb. Readers never open it: after a run,
+publish_snapshot() copies the whole database (COPY FROM DATABASE) into
+data/snapshots/<snapshot_id>.duckdb and then atomically replaces the
+data/snapshots/CURRENT pointer (write + os.replace). Readers resolve the
+pointer per request / connection, so they always see one complete run and
+never contend for the writer's file lock.
+
+Frequent publishers (the stream service) pass tables=READER_TABLES to copy
+only what the API and dashboard query, leaving out the pipeline's working
+state (baseline statistics, recipient pairs, run bookkeeping).
+
+Old snapshots beyond `keep` are garbage-collected after each publish.
+"""
+
+import os
+import glob
+import time
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DB_FILE = os.path.join(BASE_DIR, "data", "fraud_data.duckdb")
+SNAPSHOT_DIR = os.path.join(BASE_DIR, "data", "snapshots")
+POINTER_FILE = os.path.join(SNAPSHOT_DIR, "CURRENT")
+
+# Published snapshots kept on disk (readers may still hold older ones open)
+KEEP_SNAPSHOTS = 3
+
+# Tables (and views) read by the API and dashboard
+READER_TABLES = ('transactions', 'rule_alerts', 'ml_scores', 'ml_alerts', 'ml_explanations',
+                 'customer_profiles', 'step_stats', 'transaction_stats', 'rule_stats', 'ml_stats',
+                 'system_stats')
+
+
+def current_snapshot():
+    """
+    Path of the currently published snapshot; the pipeline database itself
+    when nothing has been published yet.
+    """
+    try:
+        with open(POINTER_FILE) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return DB_FILE
+    path = os.path.join(SNAPSHOT_DIR, name)
+    return path if name and os.path.exists(path) else DB_FILE
+
+
+def snapshot_id(path=None):
+    """
+    Identifier of a snapshot path (file stem), 'live' for the pipeline database
+    """
+    path = path or current_snapshot()
+    if path == DB_FILE:
+        return 'live'
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _write_pointer(name):
+    tmp = POINTER_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, POINTER_FILE)
+
+
+def _copy_tables(conn, source, tables):
+    # Same DDL (constraints included) and row order as the source
+    tables = list(tables)
+    conn.execute("USE snapshot_publish")
+    try:
+        for table, sql in conn.execute("""
+            SELECT table_name, sql FROM duckdb_tables()
+            WHERE database_name = ? AND schema_name = 'main' AND list_contains(?, table_name)
+        """, [source, tables]).fetchall():
+            conn.execute(sql)
+            conn.execute(f'INSERT INTO "{table}" SELECT * FROM "{source}".main."{table}"')
+        for (sql,) in conn.execute("""
+            SELECT sql FROM duckdb_views()
+            WHERE database_name = ? AND schema_name = 'main' AND list_contains(?, view_name)
+        """, [source, tables]).fetchall():
+            conn.execute(sql)
+    finally:
+        conn.execute(f'USE "{source}"')
+
+
+def publish_snapshot(conn, keep=KEEP_SNAPSHOTS, tables=None):
+    """
+    Copy the database behind conn into a new snapshot and make it current.
+    tables limits the copy to those tables/views (missing ones are skipped).
+    Returns the snapshot path.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    name = datetime.now().strftime('%Y%m%d%H%M%S%f') + '.duckdb'
+    tmp_path = os.path.join(SNAPSHOT_DIR, name + '.tmp')
+    path = os.path.join(SNAPSHOT_DIR, name)
+
+    source = conn.execute("SELECT current_database()").fetchone()[0]
+    conn.execute(f"ATTACH '{tmp_path}' AS snapshot_publish")
+    try:
+        if tables is None:
+            conn.execute(f"COPY FROM DATABASE \"{source}\" TO snapshot_publish")
+        else:
+            _copy_tables(conn, source, tables)
+    finally:
+        conn.execute("DETACH snapshot_publish")
+
+    os.replace(tmp_path, path)
+    _write_pointer(name)
+
+    collect_garbage(keep)
+    print(f"[INFO] Published snapshot {name}")
+    return path
+
+
+def collect_garbage(keep=KEEP_SNAPSHOTS, stale_seconds=3600):
+    """
+    Delete all but the newest `keep` snapshots (never the current one), plus
+    unfinished .tmp copies older than stale_seconds. Returns the number removed.
+    """
+    current = current_snapshot()
+    snapshots = sorted(glob.glob(os.path.join(SNAPSHOT_DIR, '*.duckdb')), reverse=True)
+    doomed = [p for p in snapshots[keep:] if p != current]
+    doomed += [p for p in glob.glob(os.path.join(SNAPSHOT_DIR, '*.tmp'))
+               if p != POINTER_FILE + '.tmp' and time.time() - os.path.getmtime(p) > stale_seconds]
+
+    removed = 0
+    for path in doomed:
+        for leftover in (path, path + '.wal'):
+            try:
+                os.remove(leftover)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Open elsewhere (Windows): retried by the next publish
+                break
+        else:
+            removed += 1
+    return removed
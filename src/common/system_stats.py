@@ -0,0 +1,191 @@
+"""
+System Statistics
+Summary counters maintained by the writers, read by the API and dashboard as one row
+
+Each writer refreshes its own one-row summary table in the same transaction
+as its data (single-row upserts, so concurrent pipeline stages never touch
+the same row):
+- transaction_stats + step_stats: ETL load and stream ingestion
+  (transactions and amount per step; totals summed from step_stats)
+- rule_stats: rules engine (alerts per rule)
+- ml_stats: ML scoring (anomaly risk bands over ml_scores, ml_alerts totals)
+
+The system_stats view joins the three rows, so `SELECT * FROM system_stats`
+is a constant-time read regardless of the number of transactions.
+
+The tables are created up front (ETL load, pipeline, sharded and stream
+startup) with ensure_stats_tables(), before any stages run concurrently. The
+refresh functions only create them for a standalone run on an older database,
+where they are the only writer.
+"""
+
+import duckdb
+
+# Anomaly score bands (same cut-offs as the dashboard's risk distribution)
+RISK_BANDS = [('critical', 0.8, None), ('high', 0.6, 0.8), ('medium', 0.4, 0.6), ('low', 0.3, 0.4)]
+
+# ml_scores at or above this score count as ML anomalies in the KPIs
+ANOMALY_THRESHOLD = 0.5
+
+# ml_alerts at or above this risk score count as high risk
+HIGH_RISK_SCORE = 80
+
+
+def _table_exists(conn, table):
+    return conn.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ? AND table_schema = 'main'",
+        [table]
+    ).fetchone()[0] > 0
+
+
+def ensure_stats_tables(conn):
+    """
+    Create the summary tables and the system_stats view if missing, filled
+    from whatever the database already holds (databases built before them).
+    Call before starting concurrent writers: two stages creating them at once conflict.
+    """
+    if _table_exists(conn, 'transaction_stats'):
+        return
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS step_stats (
+            step BIGINT PRIMARY KEY,
+            transactions BIGINT,
+            amount DOUBLE
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS transaction_stats (
+            id INTEGER PRIMARY KEY,
+            total_transactions BIGINT,
+            total_amount DOUBLE,
+            first_step BIGINT,
+            last_step BIGINT,
+            transactions_updated_at TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rule_stats (
+            id INTEGER PRIMARY KEY,
+            rule_alerts BIGINT,
+            alerts_by_rule MAP(VARCHAR, BIGINT),
+            rules_updated_at TIMESTAMP
+        )
+    """)
+    band_columns = ",\n".join(f"            risk_{name} BIGINT" for name, _, _ in RISK_BANDS)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS ml_stats (
+            id INTEGER PRIMARY KEY,
+            ml_anomalies BIGINT,
+{band_columns},
+            ml_alerts BIGINT,
+            high_risk_alerts BIGINT,
+            ml_updated_at TIMESTAMP
+        )
+    """)
+    # Empty counters until the first refresh, so the view always has its row
+    conn.execute("INSERT OR IGNORE INTO transaction_stats VALUES (1, 0, 0, NULL, NULL, NULL)")
+    conn.execute("INSERT OR IGNORE INTO rule_stats VALUES (1, 0, MAP {}, NULL)")
+    conn.execute(f"INSERT OR IGNORE INTO ml_stats VALUES (1, 0, {', '.join('0' for _ in RISK_BANDS)}, 0, 0, NULL)")
+    conn.execute("""
+        CREATE OR REPLACE VIEW system_stats AS
+        SELECT t.* EXCLUDE (id), r.* EXCLUDE (id), m.* EXCLUDE (id)
+        FROM transaction_stats t, rule_stats r, ml_stats m
+    """)
+    if _table_exists(conn, 'transactions'):
+        _refresh_transaction_stats(conn)
+    _refresh_rule_stats(conn)
+    _refresh_ml_stats(conn)
+
+
+def refresh_transaction_stats(conn, from_step=None):
+    """
+    Recount steps >= from_step (all steps when None, e.g. after a full reload)
+    and the transaction totals
+    """
+    ensure_stats_tables(conn)
+    _refresh_transaction_stats(conn, from_step)
+
+
+def _refresh_transaction_stats(conn, from_step=None):
+    if from_step is None:
+        conn.execute("DELETE FROM step_stats")
+    conn.execute("""
+        INSERT OR REPLACE INTO step_stats
+        SELECT step, COUNT(*), SUM(amount)
+        FROM transactions
+        WHERE ? IS NULL OR step >= ?
+        GROUP BY step
+    """, [from_step, from_step])
+    conn.execute("""
+        INSERT OR REPLACE INTO transaction_stats
+        SELECT 1, COALESCE(SUM(transactions), 0), COALESCE(SUM(amount), 0), MIN(step), MAX(step),
+               CURRENT_TIMESTAMP
+        FROM step_stats
+    """)
+
+
+def refresh_rule_stats(conn):
+    """
+    Alert counts per rule (rule_alerts is small: one grouped scan)
+    """
+    ensure_stats_tables(conn)
+    _refresh_rule_stats(conn)
+
+
+def _refresh_rule_stats(conn):
+    if not _table_exists(conn, 'rule_alerts'):
+        return
+    conn.execute("""
+        INSERT OR REPLACE INTO rule_stats
+        SELECT 1, COALESCE(SUM(alerts), 0), COALESCE(map_from_entries(list((rule_name, alerts))), MAP {}),
+               CURRENT_TIMESTAMP
+        FROM (SELECT rule_name, COUNT(*) as alerts FROM rule_alerts GROUP BY rule_name)
+    """)
+
+
+def refresh_ml_stats(conn):
+    """
+    Anomaly risk bands over ml_scores and ml_alerts totals
+    """
+    ensure_stats_tables(conn)
+    _refresh_ml_stats(conn)
+
+
+def _refresh_ml_stats(conn):
+    scores = "SELECT 0 as anomaly_score WHERE false"
+    if _table_exists(conn, 'ml_scores'):
+        scores = "SELECT anomaly_score FROM ml_scores"
+    alerts = "SELECT 0 as risk_score WHERE false"
+    if _table_exists(conn, 'ml_alerts'):
+        alerts = "SELECT risk_score FROM ml_alerts"
+
+    bands = ",\n".join(
+        f"COUNT(*) FILTER (WHERE anomaly_score >= {low}"
+        + (f" AND anomaly_score < {high})" if high is not None else ")")
+        for _, low, high in RISK_BANDS
+    )
+    conn.execute(f"""
+        INSERT OR REPLACE INTO ml_stats
+        SELECT 1, s.*, a.*, CURRENT_TIMESTAMP
+        FROM (
+            SELECT COUNT(*) FILTER (WHERE anomaly_score >= {ANOMALY_THRESHOLD}), {bands}
+            FROM ({scores})
+        ) s, (
+            SELECT COUNT(*), COUNT(*) FILTER (WHERE risk_score >= {HIGH_RISK_SCORE})
+            FROM ({alerts})
+        ) a
+    """)
+
+
+def read_system_stats(conn):
+    """
+    The summary row as a dict (alerts_by_rule as {rule: count}), None when
+    the database predates the summary tables
+    """
+    try:
+        cursor = conn.execute("SELECT * FROM system_stats")
+    except duckdb.CatalogException:
+        return None
+    columns = [d[0] for d in cursor.description]
+    row = cursor.fetchone()
+    return dict(zip(columns, row)) if row else None
@@ -0,0 +1,23 @@
+"""
+Test Options
+Slow tests (full pipeline runs on generated data) only run with --run-slow
+"""
+
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption('--run-slow', action='store_true', help="Run tests marked slow")
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', "slow: full pipeline runs, skipped without --run-slow")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--run-slow'):
+        return
+    skip = pytest.mark.skip(reason="slow: run with --run-slow")
+    for item in items:
+        if 'slow' in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,129 @@
+"""
+Batch Scoring Tests
+Chunked scoring under a small Python memory budget matches a single pass,
+and connect() applies the resource profile from the environment
+"""
+
+import os
+import sys
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src', 'common'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src', '03_ml_scoring'))
+
+from db import connect, duckdb_config
+from features import FEATURES, TYPE_CODES, feature_query
+from calibration import new_digest, digest_update, build_calibration
+from drift import build_reference
+from batch_scoring import score_transactions, row_id_chunks
+
+ROWS = 6000
+
+PROFILE_VARS = ('AML_MEMORY_LIMIT', 'AML_THREADS', 'AML_TEMP_DIR', 'AML_PYTHON_BUDGET')
+
+
+@pytest.fixture(autouse=True)
+def clean_profile(monkeypatch):
+    for name in PROFILE_VARS:
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.fixture
+def conn():
+    # PaySim-like columns; a few large transfers draining the balance stand out
+    rng = np.random.default_rng(7)
+    amount = rng.lognormal(8, 1, ROWS)
+    amount[rng.choice(ROWS, 60, replace=False)] *= 200
+    balance = amount * rng.uniform(1, 5, ROWS)
+    df = pd.DataFrame({
+        'step': np.sort(rng.integers(1, 100, ROWS)),
+        'type': rng.choice(list(TYPE_CODES), ROWS),
+        'amount': amount,
+        'nameOrig': [f"C{i % 1500}" for i in range(ROWS)],
+        'oldbalanceOrg': balance,
+        'newbalanceOrig': np.maximum(balance - amount, 0),
+        'nameDest': [f"M{i % 700}" for i in range(ROWS)],
+        'oldbalanceDest': rng.lognormal(9, 1, ROWS),
+        'newbalanceDest': rng.lognormal(9, 1, ROWS),
+    })
+    connection = duckdb.connect()
+    connection.register('synthetic', df)
+    connection.execute("CREATE TABLE transactions AS SELECT * FROM synthetic")
+    connection.unregister('synthetic')
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def artifacts(conn):
+    df = conn.execute(feature_query()).fetchdf()
+    X = df[FEATURES].fillna(0).to_numpy()
+    scaler = StandardScaler().fit(X)
+    model = IsolationForest(n_estimators=50, contamination=0.01, random_state=42).fit(scaler.transform(X))
+    decision = model.decision_function(scaler.transform(X))
+    return {
+        'model': model,
+        'scaler': scaler,
+        'features': FEATURES,
+        'calibration': build_calibration(digest_update(new_digest(), decision)),
+        'prefilter': None,
+        'drift_reference': build_reference(FEATURES, X, decision),
+    }
+
+
+def test_chunked_scoring_matches_single_pass(conn, artifacts, monkeypatch):
+    single = score_transactions(conn, artifacts)
+
+    # 32KB at 256 bytes per row: 128 rows per chunk
+    monkeypatch.setenv('AML_PYTHON_BUDGET', '32KB')
+    rows, chunks = row_id_chunks(conn)
+    assert len(chunks) > 10
+    chunked = score_transactions(conn, artifacts)
+
+    assert single['chunks'] == 1
+    assert chunked['chunks'] == len(chunks)
+    assert chunked['rows'] == single['rows'] == rows
+    assert len(single['anomalies']) > 0
+
+    pd.testing.assert_frame_equal(chunked['anomalies'], single['anomalies'])
+    np.testing.assert_array_equal(chunked['X_anomalies'], single['X_anomalies'])
+    assert chunked['anomalies']['anomaly_score'].sum() == single['anomalies']['anomaly_score'].sum()
+    assert chunked['drift']['n_rows'] == single['drift']['n_rows']
+    np.testing.assert_array_equal(chunked['drift']['score'], single['drift']['score'])
+    for name, counts in single['drift']['features'].items():
+        np.testing.assert_array_equal(chunked['drift']['features'][name], counts)
+
+
+def test_chunks_cover_every_row_once(conn, monkeypatch):
+    monkeypatch.setenv('AML_PYTHON_BUDGET', '32KB')
+    rows, chunks = row_id_chunks(conn, where="step > 10")
+    counted = sum(conn.execute(f"SELECT COUNT(*) FROM transactions WHERE amount > 0 AND {where}").fetchone()[0]
+                  for where in chunks)
+    assert counted == rows
+
+
+def test_connect_applies_profile(tmp_path, monkeypatch):
+    temp_dir = str(tmp_path / 'spill')
+    monkeypatch.setenv('AML_MEMORY_LIMIT', '256MB')
+    monkeypatch.setenv('AML_THREADS', '2')
+    monkeypatch.setenv('AML_TEMP_DIR', temp_dir)
+
+    with connect() as conn, duckdb.connect(config={'memory_limit': '256MB'}) as reference:
+        memory_limit, threads, temp_directory = conn.execute(
+            "SELECT current_setting('memory_limit'), current_setting('threads'), "
+            "current_setting('temp_directory')"
+        ).fetchone()
+        assert memory_limit == reference.execute("SELECT current_setting('memory_limit')").fetchone()[0]
+        assert threads == 2
+        assert temp_directory == temp_dir
+    assert os.path.isdir(temp_dir)
+
+    # Side-by-side processes split the memory limit
+    assert duckdb_config(memory_share=4)['memory_limit'] == '64MB'
@@ -0,0 +1,103 @@
+"""
+Memory-Capped Pipeline Test
+ETL and the full pipeline complete on a synthetic dataset 5x AML_MEMORY_LIMIT,
+and every output matches an uncapped run on the same data
+
+Slow (several minutes): python -m pytest tests --run-slow -k memory_cap
+AML_TEST_MEMORY_LIMIT changes the cap (default 128MB, single-threaded).
+"""
+
+import os
+import sys
+
+import duckdb
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'benchmarks'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src', 'common'))
+
+from bench_memory_cap import CSV_BYTES_PER_ROW, prepare_workspace, run_step, table_rows
+from generate_synthetic import generate
+from db import parse_size
+
+MEMORY_LIMIT = os.environ.get('AML_TEST_MEMORY_LIMIT', '128MB')
+RATIO = 5
+
+# Big enough for the 10% training sample (no thinning, same model as the
+# uncapped run), small enough that scoring runs in chunks
+PYTHON_BUDGET = '256MB'
+
+PROFILE_VARS = ('AML_MEMORY_LIMIT', 'AML_THREADS', 'AML_TEMP_DIR', 'AML_PYTHON_BUDGET')
+
+STEPS = [
+    ('etl', ['src/01_etl/load_data.py']),
+    ('pipeline', ['src/04_orchestration/master_pipeline.py', '--force', '--skip', 'publish']),
+]
+
+# Pipeline outputs compared between the runs, minus run-specific columns
+# (model_version is a timestamp, alert ids and dates depend on the run)
+OUTPUTS = {
+    'transactions': ('rowid',),
+    'rule_alerts': ('-alert_id', '-detection_date'),
+    'customer_baselines': (),
+    'customer_profiles': (),
+    'ml_scores': ('-model_version',),
+    'ml_explanations': ('-model_version',),
+}
+
+
+def run_pipeline(workdir, **profile):
+    env = {name: value for name, value in os.environ.items() if name not in PROFILE_VARS}
+    env.update(profile, AML_THREADS='1')
+    for name, args in STEPS:
+        ok, _ = run_step(name, args, workdir, env)
+        with open(os.path.join(workdir, f"{name}.log")) as log:
+            tail = log.read()[-2000:]
+        assert ok, f"{name} failed in {workdir}:\n{tail}"
+
+
+def fingerprint(conn, database, table, options):
+    """
+    (rows, order-insensitive hash of the rows); doubles rounded so spilled and
+    in-memory aggregates compare equal
+    """
+    excluded = {option[1:] for option in options if option.startswith('-')}
+    columns = [c for c in options if not c.startswith('-')]
+    for name, data_type in conn.execute("""
+        SELECT column_name, data_type FROM duckdb_columns()
+        WHERE database_name = ? AND table_name = ? ORDER BY column_index
+    """, [database, table]).fetchall():
+        if name not in excluded:
+            columns.append(f'ROUND("{name}", 6)' if data_type == 'DOUBLE' else f'"{name}"')
+    return conn.execute(
+        f"SELECT COUNT(*), SUM(hash({', '.join(columns)})) FROM {database}.{table}"
+    ).fetchone()
+
+
+@pytest.mark.slow
+def test_pipeline_under_memory_cap_matches_uncapped(tmp_path):
+    capped, uncapped = str(tmp_path / 'capped'), str(tmp_path / 'uncapped')
+    prepare_workspace(capped)
+    prepare_workspace(uncapped)
+
+    limit = parse_size(MEMORY_LIMIT)
+    rows = int(limit * RATIO / CSV_BYTES_PER_ROW)
+    csv_path = os.path.join(capped, 'data', 'paysim.csv')
+    assert generate(rows, csv_path) >= limit * RATIO
+    os.symlink(csv_path, os.path.join(uncapped, 'data', 'paysim.csv'))
+
+    run_pipeline(capped, AML_MEMORY_LIMIT=MEMORY_LIMIT, AML_PYTHON_BUDGET=PYTHON_BUDGET,
+                 AML_TEMP_DIR=str(tmp_path / 'spill'))
+    run_pipeline(uncapped)
+
+    # load_data.py reports errors without an exit code: check the table too
+    assert table_rows(capped, 'transactions') == rows
+    assert table_rows(capped, 'ml_scores') > 0
+    assert table_rows(capped, 'rule_alerts') > 0
+
+    with duckdb.connect() as conn:
+        for name, workdir in (('capped', capped), ('uncapped', uncapped)):
+            conn.execute(f"ATTACH '{os.path.join(workdir, 'data', 'fraud_data.duckdb')}' AS {name} (READ_ONLY)")
+        for table, options in OUTPUTS.items():
+            assert fingerprint(conn, 'capped', table, options) == fingerprint(conn, 'uncapped', table, options), table